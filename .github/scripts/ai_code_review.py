@@ -7,90 +7,45 @@ AI Code Review Script
 import os
 import sys
 import json
+import time
+import signal
 import argparse
-import yaml
+import subprocess
+import functools
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional
-from anthropic import Anthropic
-
-
-class CodeReviewAssistant:
-    """AI ассистент для code review с контекстом проекта"""
-
-    def __init__(self, api_key: str, config_path: Optional[Path] = None):
-        self.client = Anthropic(api_key=api_key)
-        self.config = self.load_config(config_path)
-        self.model = self.config.get('model', 'claude-3-5-sonnet-20241022')
-        self.max_tokens = self.config.get('max_tokens', 8000)
-        self.temperature = self.config.get('temperature', 0.3)
-
-    def load_config(self, config_path: Optional[Path]) -> Dict:
-        """Загружает конфигурацию из YAML файла"""
-        if config_path and config_path.exists():
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    return yaml.safe_load(f) or {}
-            except Exception as e:
-                print(f"⚠️  Не удалось загрузить конфиг: {e}")
-                return {}
-        return {}
-
-    def load_project_context(self, docs_dir: Path) -> str:
-        """Загружает документацию проекта для контекста"""
-        context_parts = []
-
-        if not docs_dir.exists():
-            return ""
-
-        # Приоритетные файлы документации
-        priority_files = [
-            "ARCHITECTURE.md",
-            "PROJECT_STATUS.md",
-            "QUICKSTART.md",
-            "INDEX.md"
-        ]
-
-        for filename in priority_files:
-            file_path = docs_dir / filename
-            if file_path.exists():
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    context_parts.append(f"### {filename}\n{content}\n")
-
-        return "\n\n".join(context_parts)
-
-    def build_review_prompt(
-        self,
-        diff: str,
-        file_contents: str,
-        pr_info: str,
-        project_context: str
-    ) -> str:
-        """Создаёт промпт для Claude с учётом контекста проекта"""
-
-        prompt = f"""Ты — Code Review Assistant для Kotlin Multiplatform проекта на Clean Architecture.
-
-## 📋 Информация о Pull Request
-
-{pr_info}
-
-## 📚 Контекст проекта (из RAG)
-
-{project_context[:15000]}  # Ограничиваем размер контекста
-
-## 🔍 Diff изменений
-
-```diff
-{diff[:20000]}  # Ограничиваем размер diff
-```
-
-## 📄 Полное содержимое изменённых файлов
-
-{file_contents[:30000]}  # Ограничиваем размер файлов
-
----
-
-## 🎯 Твоя задача
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from category_passes import CategoryPass, plan_passes, render_review
+from deadline import Deadline, next_degradation, plan_degradation
+from docs_index import DocsIndex
+from diff_parser import (
+    DiffChunk, DiffFilter, FileDiff, chunk_diff, diff_size, read_diff_file,
+    split_file_sections
+)
+from prompt_minifier import MinifyOptions, MinifyResult, minify_inputs
+from prompt_packer import (
+    SECTION_CONTEXT, SECTION_DIFF, SECTION_FILES, SECTION_PR_INFO, SECTION_SYMBOLS,
+    PackItem, PackResult, context_items, diff_items, estimate_tokens, file_items, pack, symbol_items
+)
+from rate_limit import RateLimiter, call_with_retries, is_retryable, is_retryable_except_timeout, is_timeout
+from review_cache import ReviewCache
+from review_metrics import ReviewMetrics, append_history
+from rule_engine import DEFAULT_SKIP_SEVERITIES, LocalRulesResult, check_files
+from symbol_index import SymbolIndex
+from triage import (
+    ROUTE_FULL, ROUTE_SUMMARY, HeuristicTriage, HunkRoute, Routing, build_triage_prompt, parse_triage_response
+)
+
+
+# Версия шаблонов промптов: входит в ключ кэша, увеличивайте при их изменении
+PROMPT_VERSION = "5"
+
+
+# Общие части промптов: инструкции анализа и формат ответа
+ANALYSIS_GUIDELINES = """## 🎯 Твоя задача
 
 Проанализируй изменения как senior Kotlin/KMP разработчик, учитывая:
 
@@ -128,7 +83,9 @@ class CodeReviewAssistant:
 - Documentation
 - Тестируемость
 
-## 📝 Формат ответа
+"""
+
+RESPONSE_FORMAT = """## 📝 Формат ответа
 
 Используй следующий формат Markdown:
 
@@ -215,48 +172,643 @@ class CodeReviewAssistant:
 - 🟡 Important — code smell, неоптимальные решения
 - 💡 Suggestion — улучшения, рефакторинг
 
-Начинай анализ!
 """
-        return prompt
 
-    def review_code(
+# Завершение запроса: сами инструкции и формат ответа — в system-префиксе
+START_REVIEW = "Проанализируй изменения по инструкциям и в формате из системного промпта. Начинай анализ!\n"
+
+# Формат ответа для отдельного фрагмента в map-reduce режиме
+CHUNK_FINDINGS_FORMAT = """## 📝 Формат ответа
+
+Верни только список замечаний к этому фрагменту, без общего summary.
+Для каждого замечания:
+
+### 🔴 Critical | 🟡 Important | 💡 Suggestion
+📍 **[Файл:строка]** — [Категория]
+
+**Проблема:** [Чёткое описание]
+
+**Предложение:** [Исправление, при необходимости с кодом]
+
+Отдельной строкой `✅ Хорошо:` отметь 1 позитивный момент, если он есть.
+Если замечаний нет, ответь `Замечаний нет`.
+
+"""
+
+# Формат краткого обзора низкорисковых изменений (каскад моделей)
+LOW_RISK_SUMMARY_FORMAT = """## 📝 Формат ответа
+
+Эти изменения по оценке триажа низкорисковые. Дай краткий обзор: 3-5 пунктов
+о том, что изменилось, и отдельным списком только явные проблемы, если они есть
+(📍 **[Файл:строка]** — описание). Без общего summary и оценок.
+
+"""
+
+# Начало review, когда в основную модель не ушло ни одного hunk'а
+LOW_RISK_ONLY_REVIEW = """# 🔍 Code Review Summary
+
+✅ Триаж не нашёл рискованных изменений: детальный review основной моделью
+не требуется.
+"""
+
+# Ответ, когда все hunk'и уже объяснены локальными правилами (запрос к API не нужен)
+LOCAL_ONLY_REVIEW = """# 🔍 Code Review Summary
+
+✅ Все изменения уже разобраны локальными проверками правил проекта:
+детальный review моделью не требуется.
+"""
+
+# Ответ, когда после фильтрации diff анализировать нечего (запрос к API не нужен)
+NO_FILES_REVIEW = """# 🔍 Code Review Summary
+
+✅ Нет файлов для анализа: все изменения отфильтрованы правилами
+`ignore_patterns` / `analyze_only` из конфигурации.
+"""
+
+
+ROLE = "Ты — Code Review Assistant для Kotlin Multiplatform проекта на Clean Architecture.\n\n"
+
+# Метка кэшируемого префикса (prompt caching API)
+CACHE_CONTROL = {'type': 'ephemeral'}
+# Минимум токенов кэшируемого префикса у API (для Sonnet/Opus); короче — кэш не создаётся
+MIN_CACHE_TOKENS = 1024
+
+
+def system_prompt(response_format: str) -> str:
+    """Неизменные инструкции запроса: одинаковы побайтно во всех запусках"""
+    return ROLE + ANALYSIS_GUIDELINES + response_format
+
+
+@dataclass
+class Prompt:
+    """Запрос к модели: неизменный system-префикс и блоки сообщения пользователя.
+
+    System (инструкции, правила и постоянная документация проекта) кэшируется
+    всегда; блок с cache=True продлевает кэшируемый префикс — всё до него
+    включительно должно совпадать побайтно между запросами. Префикс короче
+    минимума API не кэшируется и не помечается.
+    """
+
+    system: str
+    blocks: List[Tuple[str, bool]] = field(default_factory=list)
+    # Текст для ключа кэша ответов, если ответ не зависит от части промпта (по умолчанию — весь промпт)
+    cache_key: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return self.system + "".join(text for text, _ in self.blocks)
+
+    def request(self, cache: bool = True, min_cache_tokens: int = MIN_CACHE_TOKENS) -> Dict:
+        """Поля `system` и `messages` запроса Messages API"""
+        system: Dict[str, Any] = {'type': 'text', 'text': self.system}
+        prefix_tokens = estimate_tokens(self.system)
+        if cache and prefix_tokens >= min_cache_tokens:
+            system['cache_control'] = dict(CACHE_CONTROL)
+        content = []
+        for text, cacheable in self.blocks:
+            if not text:
+                continue
+            block: Dict[str, Any] = {'type': 'text', 'text': text}
+            prefix_tokens += estimate_tokens(text)
+            if cache and cacheable and prefix_tokens >= min_cache_tokens:
+                block['cache_control'] = dict(CACHE_CONTROL)
+            content.append(block)
+        return {'system': [system], 'messages': [{'role': 'user', 'content': content}]}
+
+
+def prompt_text(prompt: Union[str, Prompt]) -> str:
+    """Текст промпта, заданного строкой или Prompt"""
+    return prompt if isinstance(prompt, str) else prompt.text
+
+
+def context_block(packed: PackResult) -> str:
+    """Блок контекста проекта, подобранного по diff: свой у каждого PR, не кэшируется"""
+    context = packed.render(SECTION_CONTEXT, separator="\n\n")
+    if not context:
+        return ""
+    return f"## 📚 Контекст проекта (из RAG)\n\n{context}\n\n"
+
+
+def symbols_section(packed: PackResult) -> str:
+    """Раздел промпта с объявлениями символов из diff (пустой, если их нет)"""
+    symbols = packed.render(SECTION_SYMBOLS, separator="\n\n")
+    if not symbols:
+        return ""
+    return f"""
+## 🔗 Объявления, на которые ссылается diff
+
+Сигнатуры и KDoc из репозитория — тела не показаны.
+
+{symbols}
+"""
+
+
+class PartialStreamError(Exception):
+    """Поток оборвался после начала ответа: повтор запроса продублировал бы текст"""
+
+
+class CodeReviewAssistant:
+    """AI ассистент для code review с контекстом проекта"""
+
+    def __init__(
         self,
-        diff: str,
+        api_key: str,
+        config_path: Optional[Path] = None,
+        cache_dir: Optional[Path] = None,
+        client: Optional[Any] = None,
+        base_url: Optional[str] = None
+    ):
+        started = time.monotonic()
+        self.config = self.load_config(config_path)
+        self.reset_metrics().add_phase('config', time.monotonic() - started)
+        self.rate_limits = self.config.get('rate_limits') or {}
+        self.rate_limiter = RateLimiter.from_config(self.rate_limits)
+        # client можно подменить (например, FakeAnthropic для офлайн-проверок)
+        self.client = client or self.create_client(api_key, base_url)
+        self.model = self.config.get('model', 'claude-3-5-sonnet-20241022')
+        self.max_tokens = self.config.get('max_tokens', 8000)
+        self.temperature = self.config.get('temperature', 0.3)
+        self.cache = self.create_cache(cache_dir)
+        self.docs_index: Optional[DocsIndex] = None
+        # Правила и постоянная документация проекта: часть кэшируемого system-префикса
+        self.stable_context = self.build_stable_context()
+        self.symbol_index: Optional[SymbolIndex] = None
+        # Дедлайн текущей задачи: ограничивает таймауты запросов и повторы
+        self.deadline: Optional[Deadline] = None
+        # Состояние последнего запроса — своё у каждого потока (batch, map-reduce)
+        self._local = threading.local()
+
+    @property
+    def last_pack(self) -> Optional[PackResult]:
+        """Результат упаковки последнего промпта в текущем потоке"""
+        return getattr(self._local, 'last_pack', None)
+
+    @last_pack.setter
+    def last_pack(self, value: Optional[PackResult]) -> None:
+        self._local.last_pack = value
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Время до первого токена последнего потокового запроса в текущем потоке"""
+        return getattr(self._local, 'time_to_first_token', None)
+
+    @time_to_first_token.setter
+    def time_to_first_token(self, value: Optional[float]) -> None:
+        self._local.time_to_first_token = value
+
+    @property
+    def last_routing(self) -> Optional[Routing]:
+        """Решение триажа последнего каскадного review в текущем потоке"""
+        return getattr(self._local, 'last_routing', None)
+
+    @last_routing.setter
+    def last_routing(self, value: Optional[Routing]) -> None:
+        self._local.last_routing = value
+
+    @property
+    def last_local_rules(self) -> Optional[LocalRulesResult]:
+        """Результат локальных правил последнего review в текущем потоке"""
+        return getattr(self._local, 'last_local_rules', None)
+
+    @last_local_rules.setter
+    def last_local_rules(self, value: Optional[LocalRulesResult]) -> None:
+        self._local.last_local_rules = value
+
+    @property
+    def last_minify(self) -> Optional[MinifyResult]:
+        """Результат минификации входных данных последнего review в текущем потоке"""
+        return getattr(self._local, 'last_minify', None)
+
+    @last_minify.setter
+    def last_minify(self, value: Optional[MinifyResult]) -> None:
+        self._local.last_minify = value
+
+    @property
+    def last_degradations(self) -> Optional[List[str]]:
+        """Упрощения последнего review из-за нехватки времени в текущем потоке"""
+        return getattr(self._local, 'last_degradations', None)
+
+    @last_degradations.setter
+    def last_degradations(self, value: Optional[List[str]]) -> None:
+        self._local.last_degradations = value
+
+    @property
+    def last_error(self) -> Optional[Exception]:
+        """Ошибка API последнего review в текущем потоке"""
+        return getattr(self._local, 'last_error', None)
+
+    @last_error.setter
+    def last_error(self, value: Optional[Exception]) -> None:
+        self._local.last_error = value
+
+    @property
+    def metrics_config(self) -> Dict:
+        return self.config.get('metrics') or {}
+
+    def reset_metrics(self) -> ReviewMetrics:
+        """Начинает новые метрики (каждая задача сервера считается отдельно)"""
+        self.metrics = ReviewMetrics(self.metrics_config.get('pricing'))
+        return self.metrics
+
+    def create_client(self, api_key: str, base_url: Optional[str] = None) -> Any:
+        """Создаёт клиент Anthropic; повторами управляет rate_limits, а не SDK"""
+        # SDK импортируется только здесь: с подменённым клиентом он не нужен,
+        # а остальным путям не приходится платить за его загрузку
+        from anthropic import Anthropic
+
+        kwargs: Dict[str, Any] = {'api_key': api_key}
+        if base_url:
+            kwargs['base_url'] = base_url
+        if 'max_retries' in self.rate_limits:
+            kwargs['max_retries'] = 0
+        return Anthropic(**kwargs)
+
+    def load_config(self, config_path: Optional[Path]) -> Dict:
+        """Загружает конфигурацию из YAML файла"""
+        if config_path and config_path.exists():
+            import yaml
+
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    return yaml.safe_load(f) or {}
+            except Exception as e:
+                print(f"⚠️  Не удалось загрузить конфиг: {e}")
+                return {}
+        return {}
+
+    def create_cache(self, cache_dir: Optional[Path] = None) -> Optional[ReviewCache]:
+        """Создаёт кэш ответов по секции `cache:` конфига"""
+        cache_config = self.config.get('cache') or {}
+        if not cache_config.get('enabled', False):
+            return None
+        directory = cache_dir or Path(cache_config.get('directory', '.review-cache'))
+        return ReviewCache(
+            directory=directory,
+            ttl_hours=cache_config.get('cache_duration_hours', 24),
+            max_size_mb=cache_config.get('max_size_mb', 50)
+        )
+
+    def load_project_context(self, docs_dir: Path, files: Optional[List[FileDiff]] = None) -> str:
+        """Подбирает из документации проекта разделы, релевантные diff"""
+        self.load_docs_index(docs_dir)
+        self.stable_context = self.build_stable_context()
+        return self.select_project_context(files or [])
+
+    @property
+    def stable_docs(self) -> List[str]:
+        """Файлы документации, которые всегда идут в кэшируемый префикс"""
+        return (self.config.get('cache') or {}).get('stable_docs') or []
+
+    def build_stable_context(self) -> str:
+        """Правила проекта и постоянная документация: не зависят от diff, поэтому кэшируются"""
+        parts = []
+        rules = [rule for rule in self.config.get('project_specific_rules') or [] if rule.get('description')]
+        if rules:
+            parts.append("## 📏 Правила проекта\n\n" + "\n".join(
+                f"- `{rule.get('rule', '')}` ({rule.get('severity', 'important')}): {rule['description']}"
+                for rule in rules
+            ))
+        if self.docs_index is not None and self.stable_docs:
+            max_size = (self.config.get('cache') or {}).get('max_stable_context_size', 12000)
+            docs = self.docs_index.fixed_context(self.stable_docs, max_size)
+            if docs:
+                parts.append(f"## 📚 Документация проекта\n\n{docs}")
+        return "".join(f"\n\n{part}" for part in parts)
+
+    def system_prompt(self, response_format: str) -> str:
+        """System-префикс запроса: инструкции и постоянный контекст проекта"""
+        return system_prompt(response_format) + self.stable_context
+
+    def load_docs_index(self, docs_dir: Path) -> Optional[DocsIndex]:
+        """Строит (или обновляет с диска) поисковый индекс документации"""
+        if not docs_dir.exists():
+            self.docs_index = None
+            return None
+
+        if self.docs_index is not None and self.docs_index.docs_dir == docs_dir:
+            # Тёплый индекс (режим --serve): перечитываются только изменившиеся файлы
+            self.docs_index.build()
+            if self.docs_index.reindexed:
+                print(f"📚 Переиндексировано файлов документации: {len(self.docs_index.reindexed)}")
+            return self.docs_index
+
+        # Индекс сохраняется рядом с кэшем ответов и переживает запуски workflow
+        cache_config = self.config.get('cache') or {}
+        index_path = None
+        if self.cache is not None and cache_config.get('cache_project_context', True):
+            index_path = self.cache.directory / 'docs_index.json'
+
+        self.docs_index = DocsIndex(docs_dir, index_path=index_path).build()
+        if self.docs_index.reindexed:
+            print(f"📚 Переиндексировано файлов документации: {len(self.docs_index.reindexed)}")
+        return self.docs_index
+
+    @property
+    def symbol_index_config(self) -> Dict:
+        return self.config.get('symbol_index') or {}
+
+    def load_symbol_index(self) -> Optional[SymbolIndex]:
+        """Строит (или обновляет по SHA blob'ов) индекс объявлений Kotlin"""
+        options = self.symbol_index_config
+        if not options.get('enabled', False):
+            self.symbol_index = None
+            return None
+
+        if self.symbol_index is None:
+            cache_config = self.config.get('cache') or {}
+            index_path = None
+            if self.cache is not None and cache_config.get('cache_project_context', True):
+                index_path = self.cache.directory / 'symbol_index.json'
+            self.symbol_index = SymbolIndex(
+                repo_dir=Path(options.get('repo_dir', '.')),
+                roots=options.get('roots'),
+                index_path=index_path
+            )
+        try:
+            self.symbol_index.build()
+        except (OSError, subprocess.CalledProcessError) as e:
+            # Не git-репозиторий или нет git: review без объявлений символов
+            print(f"⚠️  Индекс символов недоступен: {e}")
+            self.symbol_index = None
+            return None
+        if self.symbol_index.reindexed:
+            print(f"🔗 Переиндексировано Kotlin файлов: {len(self.symbol_index.reindexed)}")
+        return self.symbol_index
+
+    def select_symbols(self, files: List[FileDiff]) -> List[Tuple[str, str]]:
+        """Сигнатуры и KDoc объявлений, на которые ссылаются hunk'и"""
+        if self.symbol_index is None:
+            return []
+        return self.symbol_index.select(files, self.symbol_index_config.get('max_symbols', 40))
+
+    def select_project_context(self, files: List[FileDiff]) -> str:
+        """Возвращает разделы документации, релевантные diff, в пределах лимита"""
+        if self.docs_index is None:
+            return ""
+        limits = self.config.get('limits') or {}
+        return self.docs_index.select_context(
+            files, limits.get('max_project_context_size', 15000), exclude=self.stable_docs
+        )
+
+    def input_budget(self, model: Optional[str] = None) -> int:
+        """Бюджет входных токенов на запрос для модели из секции `token_budget:`"""
+        budget_config = self.config.get('token_budget') or {}
+        models = budget_config.get('models') or {}
+        return models.get(model or self.model, budget_config.get('default', 60000))
+
+    def pack_inputs(
+        self,
+        files: List[FileDiff],
+        file_sections: Dict[str, str],
+        pr_info: str,
+        project_context: str,
+        budget: int,
+        instructions: str,
+        symbols: Optional[List[Tuple[str, str]]] = None
+    ) -> PackResult:
+        """Распределяет бюджет токенов между разделами промпта по приоритету"""
+        budget_config = self.config.get('token_budget') or {}
+        # Шаблон с инструкциями уходит в каждый запрос и вычитается из бюджета
+        available = max(0, budget - estimate_tokens(instructions) - 200)
+        reserves = {
+            section: int(available * share)
+            for section, share in (budget_config.get('reserve') or {}).items()
+        }
+        items = [PackItem(section=SECTION_PR_INFO, label='PR info', text=pr_info, required=True)]
+        items += diff_items(files)
+        items += symbol_items(symbols or [])
+        items += context_items(project_context)
+        items += file_items(file_sections)
+        return pack(items, available, reserves)
+
+    @staticmethod
+    def select_file_sections(files: List[FileDiff], file_contents: str) -> Dict[str, str]:
+        """Оставляет содержимое только тех файлов, что прошли фильтр diff"""
+        paths = {file_diff.path for file_diff in files}
+        return {
+            path: text
+            for path, text in split_file_sections(file_contents).items()
+            if path in paths or path == 'file_contents'
+        }
+
+    @property
+    def prompt_caching(self) -> bool:
+        return (self.config.get('cache') or {}).get('prompt_caching', True)
+
+    @property
+    def min_cache_tokens(self) -> int:
+        return (self.config.get('cache') or {}).get('min_prefix_tokens', MIN_CACHE_TOKENS)
+
+    def build_review_prompt(
+        self,
+        files: List[FileDiff],
         file_contents: str,
         pr_info: str,
         project_context: str
-    ) -> str:
-        """Запускает AI review кода"""
+    ) -> Prompt:
+        """Создаёт промпт для Claude: инструкции и постоянный контекст — кэшируемый префикс, PR — после"""
+        system = self.system_prompt(RESPONSE_FORMAT)
+        context, changes = self.build_prompt_sections(files, file_contents, pr_info, project_context, system)
+        return Prompt(system=system, blocks=[(context, False), (changes + START_REVIEW, False)])
 
-        prompt = self.build_review_prompt(
-            diff=diff,
-            file_contents=file_contents,
+    def build_prompt_sections(
+        self,
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        instructions: str
+    ) -> Tuple[str, str]:
+        """Блок контекста проекта и блок PR (информация, diff, объявления, файлы)"""
+        packed = self.pack_inputs(
+            files=files,
+            file_sections=self.select_file_sections(files, file_contents),
             pr_info=pr_info,
-            project_context=project_context
+            project_context=project_context,
+            budget=self.input_budget(),
+            instructions=instructions,
+            symbols=self.select_symbols(files)
         )
+        self.last_pack = packed
+
+        return context_block(packed), f"""## 📋 Информация о Pull Request
 
+{packed.render(SECTION_PR_INFO)}
+
+## 🔍 Diff изменений
+
+```diff
+{packed.render(SECTION_DIFF)}
+```
+{symbols_section(packed)}
+## 📄 Содержимое изменённых файлов
+
+Выдержки вокруг изменений; номер строки указан слева от `|`.
+
+{packed.render(SECTION_FILES)}
+
+---
+
+"""
+
+    def _create_message(
+        self,
+        prompt: Union[str, Prompt],
+        model: Optional[str] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Отправляет один запрос к Claude и возвращает текст ответа.
+
+        prompt — текст или Prompt с кэшируемым префиксом. Если передан on_text,
+        ответ запрашивается потоком и каждый фрагмент текста передаётся
+        в on_text сразу по получении.
+        """
+        model = model or self.model
+        request: Dict[str, Any] = dict(
+            model=model,
+            max_tokens=max_tokens or self.max_tokens,
+            temperature=self.temperature
+        )
+        if isinstance(prompt, Prompt):
+            request.update(prompt.request(cache=self.prompt_caching, min_cache_tokens=self.min_cache_tokens))
+        else:
+            request['messages'] = [{"role": "user", "content": prompt}]
+        # Таймаут при дедлайне не повторяем: review_with_deadline упростит запрос
+        retryable = is_retryable if self.deadline is None else is_retryable_except_timeout
+
+        if self.rate_limiter is not None:
+            with self.metrics.phase('rate_limit_wait'):
+                self.rate_limiter.acquire(estimate_tokens(prompt_text(prompt)))
+
+        def send() -> str:
+            if self.deadline is not None:
+                request['timeout'] = self.deadline.request_timeout(
+                    self.deadline_config.get('request_timeout_seconds', 300),
+                    minimum=self.deadline_config.get('min_request_seconds', 20)
+                )
+            started = time.monotonic()
+            if on_text is None:
+                response = self.client.messages.create(**request)
+                text, usage, first_token = response.content[0].text, response.usage, None
+            else:
+                text, usage = self._stream_message(request, on_text)
+                first_token = self.time_to_first_token
+            self.metrics.record_call(
+                model, usage, time.monotonic() - started,
+                time_to_first_token=first_token, streamed=on_text is not None
+            )
+            return text
+
+        with self.metrics.phase('api'):
+            return call_with_retries(
+                send,
+                max_retries=self.rate_limits.get('max_retries', 0),
+                base_delay=self.rate_limits.get('backoff_base_seconds', 2),
+                max_delay=self.rate_limits.get('backoff_max_seconds', 60),
+                on_retry=self._on_retry,
+                retryable=retryable,
+                deadline=self.deadline.expires_at if self.deadline is not None else None
+            )
+
+    def _on_retry(self, attempt: int, error: Exception, delay: float) -> None:
+        self.metrics.record_retry()
+        print(f"🔁 Повтор {attempt} через {delay:.1f} с: {error}")
+
+    def _stream_message(self, request: Dict, on_text: Callable[[str], None]) -> Tuple[str, Any]:
+        """Запрашивает ответ потоком, передавая текст в on_text по мере получения.
+
+        Возвращает текст ответа и usage итогового сообщения.
+        """
+        started = time.monotonic()
+        self.time_to_first_token = None
+        parts: List[str] = []
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=self.max_tokens,
-                temperature=0.3,  # Более детерминированный для code review
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+            with self.client.messages.stream(**request) as stream:
+                for text in stream.text_stream:
+                    if not parts:
+                        self.time_to_first_token = time.monotonic() - started
+                    parts.append(text)
+                    on_text(text)
+                usage = stream.get_final_message().usage
+        except Exception as e:
+            if parts:
+                raise PartialStreamError(str(e)) from e
+            raise
+        return "".join(parts), usage
+
+    def _cached_message(
+        self,
+        prompt: Union[str, Prompt],
+        model: Optional[str] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Как _create_message, но сначала ищет ответ в кэше.
+
+        Ключ — параметры запроса и весь промпт (или Prompt.cache_key, если часть
+        промпта на ответ не влияет, как номер фрагмента). Ошибки API не кэшируются.
+        """
+        model = model or self.model
+        if self.cache is None:
+            return self._create_message(prompt, model=model, on_text=on_text, max_tokens=max_tokens)
+
+        key_text = prompt_text(prompt)
+        if isinstance(prompt, Prompt) and prompt.cache_key is not None:
+            key_text = prompt.cache_key
+        key = ReviewCache.make_key(
+            model, PROMPT_VERSION, str(max_tokens or self.max_tokens), str(self.temperature), key_text
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            if on_text is not None:
+                on_text(cached)
+            return cached
+
+        text = self._create_message(prompt, model=model, on_text=on_text, max_tokens=max_tokens)
+        self.cache.put(key, text, meta={'model': model})
+        return text
+
+    def review_code(
+        self,
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Запускает AI review кода"""
+
+        self.last_pack = None
+        self.time_to_first_token = None
+        if not files:
+            return NO_FILES_REVIEW
+
+        with self.metrics.phase('prompt_build'):
+            prompt = self.build_review_prompt(
+                files=files,
+                file_contents=file_contents,
+                pr_info=pr_info,
+                project_context=project_context
             )
 
-            return response.content[0].text
+        self.last_error = None
+        try:
+            return self._cached_message(prompt, on_text=on_text)
 
         except Exception as e:
-            return f"""# ❌ Ошибка при анализе
+            self.last_error = e
+            return self.format_error(e)
+
+    @staticmethod
+    def format_error(error: Exception) -> str:
+        """Форматирует ошибку API в виде комментария для PR"""
+        return f"""# ❌ Ошибка при анализе
 
 Не удалось выполнить AI code review:
 
 ```
-{str(e)}
+{str(error)}
 ```
 
 Пожалуйста, проверьте:
@@ -265,72 +817,919 @@ class CodeReviewAssistant:
 3. Логи GitHub Actions для деталей
 """
 
+    # ------------------------------------------------------------------
+    # Map-reduce режим для больших PR
+    # ------------------------------------------------------------------
 
-def main():
-    parser = argparse.ArgumentParser(description='AI Code Review with Claude')
-    parser.add_argument('--diff-file', required=True, help='Файл с diff изменений')
-    parser.add_argument('--files-file', required=True, help='Файл с содержимым изменённых файлов')
-    parser.add_argument('--pr-info-file', required=True, help='Файл с информацией о PR')
-    parser.add_argument('--docs-dir', required=True, help='Директория с документацией проекта')
-    parser.add_argument('--output-file', required=True, help='Файл для сохранения результата')
-    parser.add_argument('--config', default='.github/ai-review-config.yml', help='Путь к файлу конфигурации')
+    @property
+    def chunking_config(self) -> Dict:
+        return self.config.get('chunking') or {}
 
-    args = parser.parse_args()
+    def should_chunk(self, files: List[FileDiff]) -> bool:
+        """Решает, нужен ли поблочный review для данного diff"""
+        chunking = self.chunking_config
+        if not chunking.get('enabled', False):
+            return False
+        return diff_size(files) > chunking.get('min_diff_size', 20000)
 
-    # Проверяем API ключ
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
-        print("❌ ANTHROPIC_API_KEY не установлен")
-        sys.exit(1)
+    def build_chunk_prompt(
+        self,
+        chunk: DiffChunk,
+        index: int,
+        total: int,
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        symbols: Optional[List[Tuple[str, str]]] = None
+    ) -> Prompt:
+        """Создаёт промпт для анализа одного фрагмента diff (system-префикс общий для всех фрагментов)"""
+        packed = self.pack_inputs(
+            files=[chunk.as_file_diff()],
+            file_sections={chunk.path: file_contents} if file_contents else {},
+            pr_info=pr_info,
+            project_context=project_context,
+            budget=self.chunking_config.get('token_budget', 20000),
+            instructions=self.system_prompt(CHUNK_FINDINGS_FORMAT),
+            symbols=self.select_symbols([chunk.as_file_diff()]) if symbols is None else symbols
+        )
+        if packed.dropped or packed.truncated:
+            print(f"✂️  Фрагмент {index}/{total}: {len(packed.dropped)} элементов не вошло в бюджет")
+
+        # Номер фрагмента и информация о PR (с подсказками локальных правил) общие для всего PR:
+        # в ключ кэша они не входят, иначе новый файл в PR сбросил бы ответы по всем фрагментам
+        chunk_header = f"""Это фрагмент {index}/{total} большого Pull Request: `{chunk.title}`.
+Остальные фрагменты анализируются отдельно, поэтому оценивай только этот.
+
+## 📋 Информация о Pull Request
+
+{packed.render(SECTION_PR_INFO)}
+
+"""
+        chunk_text = f"""## 🔍 Diff фрагмента
+
+```diff
+{packed.render(SECTION_DIFF)}
+```
+{symbols_section(packed)}
+## 📄 Содержимое файла
+
+{packed.render(SECTION_FILES)}
+
+---
+
+{START_REVIEW}"""
+        system = self.system_prompt(CHUNK_FINDINGS_FORMAT)
+        context = context_block(packed)
+        return Prompt(
+            system=system,
+            blocks=[(context, False), (chunk_header, False), (chunk_text, False)],
+            cache_key=system + context + chunk_text
+        )
+
+    def build_reduce_prompt(self, findings: List[str], titles: List[str], pr_info: str) -> str:
+        """Создаёт промпт для объединения замечаний по фрагментам"""
+        parts = [
+            f"### Фрагмент {index}/{len(findings)}: {title}\n\n{text.strip()}"
+            for index, (title, text) in enumerate(zip(titles, findings), start=1)
+        ]
+        joined = "\n\n---\n\n".join(parts)
+
+        return f"""Ты — Code Review Assistant для Kotlin Multiplatform проекта на Clean Architecture.
+
+Pull Request был разбит на {len(findings)} фрагментов, каждый проанализирован отдельно.
+Объедини замечания в единый review: убери дубликаты, сохрани ссылки [Файл:строка],
+пересчитай количество проблем по приоритетам и выдели ключевые находки по всему PR.
+Не добавляй новых замечаний, которых нет во фрагментах.
+
+## 📋 Информация о Pull Request
+
+{pr_info}
+
+## 🧩 Замечания по фрагментам
+
+{joined}
+
+---
+
+{RESPONSE_FORMAT}Начинай объединение!
+"""
+
+    def _review_chunk(
+        self,
+        chunk: DiffChunk,
+        index: int,
+        total: int,
+        file_sections: Dict[str, str],
+        pr_info: str,
+        project_context: str
+    ) -> str:
+        file_contents = file_sections.get(chunk.path, "")
+        if self.docs_index is not None:
+            # Каждому фрагменту — свои релевантные разделы документации
+            max_context = self.chunking_config.get('max_context_size', 8000)
+            with self.metrics.phase('context'):
+                project_context = self.docs_index.select_context(
+                    [chunk.as_file_diff()], max_context, exclude=self.stable_docs
+                )
+        with self.metrics.phase('prompt_build'):
+            symbols = self.select_symbols([chunk.as_file_diff()])
+            prompt = self.build_chunk_prompt(
+                chunk=chunk,
+                index=index,
+                total=total,
+                file_contents=file_contents,
+                pr_info=pr_info,
+                project_context=project_context,
+                symbols=symbols
+            )
+        return self._cached_message(prompt)
+
+    def review_code_chunked(
+        self,
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Запускает map-reduce review: фрагменты параллельно, затем объединение"""
+        self.last_error = None
+        self.last_pack = None
+        self.time_to_first_token = None
+        chunking = self.chunking_config
+        chunks = chunk_diff(files, chunking.get('max_chunk_size', 20000))
+
+        if len(chunks) <= 1:
+            return self.review_code(files, file_contents, pr_info, project_context, on_text=on_text)
+
+        file_sections = split_file_sections(file_contents)
+        total = len(chunks)
+        workers = max(1, min(chunking.get('max_workers', 4), total))
+        print(f"🧩 Map-reduce review: {total} фрагментов, {workers} потоков")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self._review_chunk,
+                    chunk, index, total, file_sections, pr_info, project_context
+                )
+                for index, chunk in enumerate(chunks, start=1)
+            ]
+            findings: List[str] = []
+            for index, (chunk, future) in enumerate(zip(chunks, futures), start=1):
+                try:
+                    findings.append(future.result())
+                except Exception as e:
+                    print(f"⚠️  Фрагмент {index}/{total} ({chunk.title}) не проанализирован: {e}")
+                    findings.append(f"⚠️ Фрагмент не проанализирован из-за ошибки API: `{e}`")
+                    # last_error хранится по потокам, поэтому записывается здесь, а не в _review_chunk
+                    if self.last_error is None:
+                        self.last_error = e
+
+        titles = [chunk.title for chunk in chunks]
+        # Таймаут фрагмента при дедлайне: review_with_deadline повторит review с упрощением,
+        # поэтому reduce не запускаем и ничего не отдаём потоком
+        if self.deadline is not None and self.last_error is not None and is_timeout(self.last_error):
+            return self.join_chunk_findings(titles, findings)
+
+        with self.metrics.phase('prompt_build'):
+            reduce_prompt = self.build_reduce_prompt(findings, titles, pr_info)
+        reduce_model = chunking.get('reduce_model', self.model)
+
+        try:
+            # Потоком отдаётся только reduce-проход: это и есть итоговый review
+            return self._cached_message(
+                reduce_prompt, model=reduce_model, on_text=on_text
+            )
+        except Exception as e:
+            # Без reduce-прохода отдаём замечания по фрагментам как есть
+            print(f"⚠️  Reduce-проход не выполнен: {e}")
+            if self.last_error is None:
+                self.last_error = e
+            return self.join_chunk_findings(titles, findings)
+
+    @staticmethod
+    def join_chunk_findings(titles: List[str], findings: List[str]) -> str:
+        """Замечания по фрагментам как есть, без reduce-прохода"""
+        parts = [
+            f"## {title}\n\n{text.strip()}"
+            for title, text in zip(titles, findings)
+        ]
+        return "# 🔍 Code Review Summary\n\n" + "\n\n---\n\n".join(parts)
+
+    # ------------------------------------------------------------------
+    # Проходы по категориям анализа: параллельные узкие запросы
+    # ------------------------------------------------------------------
+
+    @property
+    def category_passes_config(self) -> Dict:
+        return self.config.get('category_passes') or {}
+
+    def plan_category_passes(self) -> List[CategoryPass]:
+        """Проходы для включённых `analysis_categories`"""
+        return plan_passes(self.config.get('analysis_categories') or {}, self.category_passes_config.get('groups'))
+
+    def review_code_by_category(
+        self,
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Review отдельными параллельными проходами по категориям с общим префиксом промпта.
+
+        Префикс (PR, контекст, diff, файлы) одинаков во всех проходах и помечен
+        для prompt caching. Первый проход стартует сразу, остальные — как только
+        он начал отвечать (префикс к этому моменту уже в кэше API), поэтому
+        общее время близко к самому долгому проходу.
+        """
+        self.last_error = None
+        self.last_pack = None
+        self.time_to_first_token = None
+        passes = self.plan_category_passes()
+        if not files or len(passes) <= 1:
+            return self.review_code(files, file_contents, pr_info, project_context, on_text=on_text)
+
+        options = self.category_passes_config
+        with self.metrics.phase('prompt_build'):
+            system = self.system_prompt(CHUNK_FINDINGS_FORMAT)
+            context, changes = self.build_prompt_sections(files, file_contents, pr_info, project_context, system)
+        pack = self.last_pack
+        workers = max(1, min(options.get('max_workers', 5), len(passes)))
+        print(f"🎯 Review по категориям: {len(passes)} проходов, {workers} потоков")
+
+        prefix_ready = threading.Event()
+        if not options.get('warm_prefix', True):
+            prefix_ready.set()
+
+        def run_pass(category_pass: CategoryPass, first: bool) -> str:
+            if not first:
+                prefix_ready.wait(timeout=options.get('warm_timeout_seconds', 30))
+            # system — общий кэш со всеми review, контекст и блок PR — общие для всех проходов
+            prompt = Prompt(
+                system=system,
+                blocks=[(context, False), (changes, True), (category_pass.focus() + START_REVIEW, False)]
+            )
+            try:
+                return self._cached_message(
+                    prompt,
+                    on_text=(lambda text: prefix_ready.set()) if first else None,
+                    max_tokens=options.get('max_tokens', 3000)
+                )
+            finally:
+                if first:
+                    prefix_ready.set()
+
+        results: List[Tuple[str, str]] = []
+        failed: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (category_pass, executor.submit(run_pass, category_pass, index == 0))
+                for index, category_pass in enumerate(passes)
+            ]
+            for category_pass, future in futures:
+                try:
+                    results.append((category_pass.name, future.result()))
+                except Exception as e:
+                    print(f"⚠️  Проход «{category_pass.title}» не выполнен: {e}")
+                    failed[category_pass.name] = str(e)
+                    self.last_error = e
+
+        self.last_pack = pack
+        if not results:
+            review = self.format_error(self.last_error)
+        else:
+            if len(failed) < len(passes):
+                # Часть проходов удалась — review не считается ошибочным
+                self.last_error = None
+            review = render_review(results, {item.name: item.title for item in passes}, failed)
+        if on_text is not None:
+            on_text(review)
+        return review
+
+    def review_method(self, files: List[FileDiff], chunked: bool = False) -> Callable[..., str]:
+        """Способ review для diff: map-reduce для больших, проходы по категориям или один запрос"""
+        if chunked or self.should_chunk(files):
+            return self.review_code_chunked
+        if self.category_passes_config.get('enabled', False):
+            return self.review_code_by_category
+        return self.review_code
+
+    # ------------------------------------------------------------------
+    # Каскад моделей: дешёвый триаж, основная модель только для рискованного
+    # ------------------------------------------------------------------
+
+    @property
+    def cascade_config(self) -> Dict:
+        return self.config.get('cascade') or {}
+
+    def triage(self, files: List[FileDiff]) -> Routing:
+        """Оценивает риск каждого hunk'а и распределяет их по моделям"""
+        cascade = self.cascade_config
+        threshold = cascade.get('threshold', 0.4)
+        heuristic = HeuristicTriage(self.config.get('priorities') or {}, cascade.get('signals'))
+        method = cascade.get('triage', 'heuristic')
+
+        model_scores: Dict[int, float] = {}
+        if method == 'model':
+            priorities = self.config.get('priorities') or {}
+            categories = [category for level in priorities.values() for category in level or []]
+            prompt, index = build_triage_prompt(files, categories)
+            try:
+                text = self._cached_message(
+                    prompt,
+                    model=cascade.get('triage_model', 'claude-3-5-haiku-20241022')
+                )
+                scores = parse_triage_response(text)
+                model_scores = {id(hunk): scores[hunk_id] for hunk_id, (_, hunk) in index.items() if hunk_id in scores}
+            except Exception as e:
+                print(f"⚠️  Триаж моделью не выполнен, используется эвристика: {e}")
+                method = 'heuristic'
+
+        routing = Routing(method=method, threshold=threshold)
+        for file_diff in files:
+            if not file_diff.hunks:
+                routing.routes.append(HunkRoute(file_diff.path, None, 0.0, [f"{file_diff.change_type} без hunk'ов"]))
+                continue
+            for hunk in file_diff.hunks:
+                if id(hunk) in model_scores:
+                    score, reasons = model_scores[id(hunk)], [cascade.get('triage_model', 'модель')]
+                else:
+                    score, reasons = heuristic.score(hunk)
+                route = ROUTE_FULL if score >= threshold else ROUTE_SUMMARY
+                routing.routes.append(HunkRoute(file_diff.path, hunk, score, reasons, route))
+        return routing
+
+    def summarize_low_risk(self, files: List[FileDiff], pr_info: str) -> str:
+        """Краткий обзор низкорисковых изменений дешёвой моделью (или списком без API)"""
+        listing = "\n".join(
+            f"- `{file_diff.path}` — {file_diff.change_type}, hunk'ов: {len(file_diff.hunks)}"
+            for file_diff in files
+        )
+        header = "## 🪶 Низкорисковые изменения\n\n"
+        summary_model = self.cascade_config.get('summary_model')
+        if not summary_model:
+            return header + listing + "\n"
+
+        packed = self.pack_inputs(
+            files=files,
+            file_sections={},
+            pr_info=pr_info,
+            project_context="",
+            budget=self.input_budget(summary_model),
+            instructions=LOW_RISK_SUMMARY_FORMAT
+        )
+        prompt = f"""Ты — Code Review Assistant для Kotlin Multiplatform проекта на Clean Architecture.
+
+## 📋 Информация о Pull Request
+
+{packed.render(SECTION_PR_INFO)}
 
-    # Читаем входные данные
+## 🔍 Diff низкорисковых изменений
+
+```diff
+{packed.render(SECTION_DIFF)}
+```
+
+---
+
+{LOW_RISK_SUMMARY_FORMAT}Начинай обзор!
+"""
+        try:
+            text = self._cached_message(prompt, model=summary_model)
+        except Exception as e:
+            print(f"⚠️  Краткий обзор не выполнен: {e}")
+            return header + listing + "\n"
+        return header + text.strip() + "\n"
+
+    def review_code_cascade(
+        self,
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        on_text: Optional[Callable[[str], None]] = None,
+        chunked: bool = False
+    ) -> str:
+        """Каскадный review: основная модель получает только рискованные hunk'и"""
+        self.last_routing = None
+        if not files:
+            return self.review_code(files, file_contents, pr_info, project_context, on_text=on_text)
+
+        with self.metrics.phase('triage'):
+            routing = self.triage(files)
+        self.last_routing = routing
+        full_files = routing.full_files(files)
+        summary_files = routing.summary_files(files)
+        counts = routing.summary()
+        print(
+            f"🧭 Каскад ({routing.method}): {counts['full_hunks']} hunk'ов → {self.model}, "
+            f"{counts['summary_hunks']} → краткий обзор"
+        )
+
+        parts: List[str] = []
+
+        def emit(text: str) -> None:
+            parts.append(text)
+            if on_text is not None:
+                on_text(text)
+
+        if full_files:
+            run_review = self.review_method(full_files, chunked)
+            review = run_review(full_files, file_contents, pr_info, project_context, on_text=emit)
+            # Ответ без потока (ошибка API, fallback reduce-прохода) дописываем целиком
+            if review != "".join(parts):
+                emit(("\n\n" if parts else "") + review)
+        else:
+            self.last_pack = None
+            emit(LOW_RISK_ONLY_REVIEW)
+
+        if summary_files:
+            emit("\n\n" + self.summarize_low_risk(summary_files, pr_info))
+        return "".join(parts)
+
+    @property
+    def local_rules_config(self) -> Dict:
+        return self.config.get('local_rules') or {}
+
+    def check_local_rules(self, files: List[FileDiff]) -> LocalRulesResult:
+        """Проверяет diff локальными реализациями project_specific_rules"""
+        options = self.local_rules_config
+        return check_files(
+            files,
+            self.config.get('project_specific_rules') or [],
+            parallel_min_hunks=options.get('parallel_min_hunks', 200),
+            max_workers=options.get('max_workers', os.cpu_count() or 1),
+            skip_severities=options.get('skip_severities') or DEFAULT_SKIP_SEVERITIES
+        )
+
+    def review_with_local_rules(
+        self,
+        run_review: Callable[..., str],
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Review с локальными правилами: их замечания — подсказка модели, объяснённые hunk'и можно пропустить"""
+        with self.metrics.phase('local_rules'):
+            result = self.check_local_rules(files)
+        self.last_local_rules = result
+        llm_files = files
+        if self.local_rules_config.get('skip_covered_hunks', False) and result.covered:
+            llm_files = result.uncovered_files(files)
+        else:
+            result.covered.clear()
+        hints = result.hints()
+        if hints:
+            pr_info = f"{pr_info.rstrip()}\n\n{hints}\n"
+        counts = result.summary()
+        print(
+            f"🧰 Локальные правила: замечаний {counts['findings']}, "
+            f"hunk'ов без запроса к модели: {counts['covered_hunks']}"
+        )
+
+        parts: List[str] = []
+
+        def emit(text: str) -> None:
+            parts.append(text)
+            if on_text is not None:
+                on_text(text)
+
+        if llm_files or not files:
+            review = run_review(llm_files, file_contents, pr_info, project_context, on_text=emit)
+            # Ответ без потока (ошибка API, кэш без on_text) дописываем целиком
+            if review != "".join(parts):
+                emit(("\n\n" if parts else "") + review)
+        else:
+            self.last_pack = None
+            self.last_routing = None
+            emit(LOCAL_ONLY_REVIEW)
+
+        if result.findings:
+            emit("\n\n" + result.render())
+        return "".join(parts)
+
+    @property
+    def minify_config(self) -> Dict:
+        return self.config.get('minify') or {}
+
+    def review_minified(
+        self,
+        run_review: Callable[..., str],
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Review по минифицированным diff и выдержкам файлов (номера строк сохраняются)"""
+        with self.metrics.phase('minify'):
+            result = minify_inputs(files, file_contents, MinifyOptions.from_config(self.minify_config))
+        self.last_minify = result
+        print(f"🗜️  Минификация: {result.report()}")
+        return run_review(result.files, result.file_contents, pr_info, project_context, on_text=on_text)
+
+    # ------------------------------------------------------------------
+    # Дедлайн: упрощение review, когда до таймаута job мало времени
+    # ------------------------------------------------------------------
+
+    @property
+    def deadline_config(self) -> Dict:
+        return self.config.get('deadline') or {}
+
+    def degrade_inputs(
+        self,
+        steps: List[str],
+        files: List[FileDiff],
+        file_contents: str,
+        project_context: str
+    ) -> Tuple[List[FileDiff], str, str, Optional[str], List[str]]:
+        """Входные данные и модель с учётом шагов деградации, плюс описание упрощений"""
+        options = self.deadline_config
+        model = None
+        notes: List[str] = []
+        if 'context' in steps:
+            project_context = ""
+            notes.append("без контекста проекта и объявлений символов")
+        if 'files' in steps:
+            max_files = options.get('max_files', 3)
+            if len(files) > max_files:
+                largest = set(map(id, sorted(files, key=lambda f: diff_size([f]), reverse=True)[:max_files]))
+                notes.append(f"проанализированы {max_files} из {len(files)} файлов с наибольшими изменениями")
+                files = [f for f in files if id(f) in largest]
+            file_contents = ""
+            notes.append("без содержимого изменённых файлов, только diff")
+        if 'model' in steps:
+            fallback = options.get('fallback_model', 'claude-3-5-haiku-20241022')
+            if fallback and fallback != self.model:
+                model = fallback
+                notes.append(f"более быстрая модель `{fallback}`")
+        return files, file_contents, project_context, model, notes
+
+    def review_with_deadline(
+        self,
+        run_review: Callable[..., str],
+        files: List[FileDiff],
+        file_contents: str,
+        pr_info: str,
+        project_context: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Review к дедлайну: упрощается заранее, если времени мало, и после таймаута запроса"""
+        thresholds = self.deadline_config.get('degrade_below_seconds') or {}
+        min_request = self.deadline_config.get('min_request_seconds', 20)
+        steps = plan_degradation(self.deadline.remaining(), thresholds)
+        self.last_degradations = None
+        while True:
+            degraded_files, degraded_contents, degraded_context, model, notes = self.degrade_inputs(
+                steps, files, file_contents, project_context
+            )
+            if notes:
+                print(f"⏳ До дедлайна {self.deadline.remaining():.0f} с, review упрощён: {'; '.join(notes)}")
+            streamed: List[str] = []
+
+            def emit(text: str) -> None:
+                streamed.append(text)
+                if on_text is not None:
+                    on_text(text)
+
+            # Модель и индексы общие для потоков map-reduce (фрагменты сами выбирают документацию
+            # и символы), поэтому подменяются на время review
+            saved = self.model, self.symbol_index, self.docs_index, self.stable_context
+            self.model = model or self.model
+            if 'context' in steps:
+                self.symbol_index = None
+                self.docs_index = None
+                self.stable_context = ""
+            try:
+                review = run_review(degraded_files, degraded_contents, pr_info, degraded_context, on_text=emit)
+            finally:
+                self.model, self.symbol_index, self.docs_index, self.stable_context = saved
+            self.last_degradations = notes or None
+
+            error = self.last_error
+            step = next_degradation(steps)
+            # Начатый поток не повторяем: текст уже отдан в вывод
+            if error is None or streamed or not is_timeout(error) or step is None:
+                return review
+            if self.deadline.remaining() <= min_request:
+                return review
+            print(f"⏳ Таймаут запроса ({error}), повтор с упрощением «{step}»")
+            steps = plan_degradation(self.deadline.remaining(), thresholds, applied=steps + [step])
+
+
+def build_output_footer(assistant: CodeReviewAssistant) -> str:
+    """Служебные блоки в конце review: упрощения к дедлайну, маршрутизация каскада и что не поместилось в промпт"""
+    footer = ""
+    if assistant.last_degradations:
+        footer += "\n\n---\n⏳ **Review упрощён, чтобы уложиться в таймаут job:**\n" + "".join(
+            f"\n- {note}" for note in assistant.last_degradations
+        ) + "\n"
+    routing = assistant.last_routing
+    if routing is not None:
+        footer += (
+            f"\n\n<details>\n<summary>🧭 Маршрутизация каскада ({routing.method}, порог {routing.threshold})</summary>\n\n"
+            f"{routing.report()}\n</details>\n"
+        )
+    if assistant.last_pack is not None and assistant.last_pack.report():
+        report = assistant.last_pack.report()
+        print(f"✂️  Не вошло в бюджет промпта:\n{report}")
+        footer += (
+            "\n\n<details>\n<summary>ℹ️ Не всё поместилось в бюджет промпта</summary>\n\n"
+            f"{report}\n</details>\n"
+        )
+    return footer
+
+
+class StreamingOutput:
+    """Пишет review в файл и stdout по мере получения текста.
+
+    Файл сбрасывается на диск после каждого фрагмента, поэтому частичный
+    review сохраняется, даже если job будет остановлен по таймауту.
+    """
+
+    def __init__(self, path: Path, echo: bool = True):
+        self.path = path
+        self.echo = echo
+        self.parts: List[str] = []
+        self._file = None
+
+    def __enter__(self) -> 'StreamingOutput':
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'w', encoding='utf-8')
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._file.close()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def write(self, text: str) -> None:
+        self.parts.append(text)
+        self._file.write(text)
+        self._file.flush()
+        if self.echo:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt(f"signal {signum}")
+
+
+REQUIRED_ARGS = ('diff_file', 'files_file', 'pr_info_file', 'docs_dir', 'output_file')
+# Время старта job (unix time), которое записывает workflow
+JOB_STARTED_ENV = 'REVIEW_JOB_STARTED'
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """Аргументы командной строки; их же принимает сервер от review_client.py"""
+    parser = argparse.ArgumentParser(description='AI Code Review with Claude')
+    parser.add_argument('--diff-file', help='Файл с diff изменений')
+    parser.add_argument('--files-file', help='Файл с содержимым изменённых файлов')
+    parser.add_argument('--pr-info-file', help='Файл с информацией о PR')
+    parser.add_argument('--docs-dir', help='Директория с документацией проекта')
+    parser.add_argument('--output-file', help='Файл для сохранения результата')
+    parser.add_argument('--config', default='.github/ai-review-config.yml', help='Путь к файлу конфигурации')
+    parser.add_argument('--chunked', action='store_true', help='Принудительно включить map-reduce review по фрагментам')
+    parser.add_argument('--cache-dir', help='Директория кэша ответов (по умолчанию из cache.directory)')
+    parser.add_argument('--stream', action='store_true', help='Писать ответ в файл и stdout по мере генерации')
+    parser.add_argument('--metrics-file', help='JSON с метриками запуска (по умолчанию <output>.metrics.json)')
+    parser.add_argument('--metrics-history', help='JSONL история запусков (по умолчанию из metrics.history_file)')
+    parser.add_argument('--record', help='Записывать запросы и ответы API в кассету (.jsonl.gz)')
+    parser.add_argument('--replay', help='Отвечать из кассеты вместо API (ключ не нужен)')
+    parser.add_argument('--replay-latency', action='store_true', help='При воспроизведении выдерживать записанные задержки')
+    parser.add_argument('--replay-strict', action='store_true', help='Ошибка, если запроса нет в кассете (иначе — ответ той же модели)')
+    parser.add_argument('--deadline-seconds', type=float, help='Секунд на review; без него дедлайн считается от --job-started')
+    # Значение по умолчанию берётся из окружения в main(), а не здесь: под --serve парсер
+    # работает в сервере, и его окружение — от job, запустившей сервер
+    parser.add_argument(
+        '--job-started', type=float,
+        help=f'Время старта job (unix time, по умолчанию ${JOB_STARTED_ENV}) для дедлайна из deadline.job_timeout_minutes'
+    )
+    parser.add_argument('--serve', action='store_true', help='Запустить сервер review на Unix-сокете')
+    parser.add_argument('--socket', help='Путь к Unix-сокету сервера (по умолчанию $AI_REVIEW_SOCKET)')
+    return parser
+
+
+def run_review_job(
+    assistant: CodeReviewAssistant,
+    args: argparse.Namespace,
+    started: Optional[float] = None,
+    handle_sigterm: bool = True
+) -> int:
+    """Выполняет один review по аргументам командной строки, возвращает код выхода"""
+    started = started if started is not None else time.monotonic()
+    metrics = assistant.metrics
+    # Кэш у ассистента общий для всех задач сервера, в метрики идут только свои обращения
+    cache_hits, cache_misses = (assistant.cache.hits, assistant.cache.misses) if assistant.cache else (0, 0)
+
+    # Читаем входные данные: diff разбирается потоково и сразу фильтруется
+    diff_filter = DiffFilter.from_config(assistant.config)
     try:
-        with open(args.diff_file, 'r', encoding='utf-8') as f:
-            diff = f.read()
+        with metrics.phase('inputs'):
+            # Review нужен весь diff сразу; его размер ограничивает limits.max_diff_size
+            files = list(read_diff_file(Path(args.diff_file), diff_filter))
 
-        with open(args.files_file, 'r', encoding='utf-8') as f:
-            file_contents = f.read()
+            with open(args.files_file, 'r', encoding='utf-8') as f:
+                file_contents = f.read()
 
-        with open(args.pr_info_file, 'r', encoding='utf-8') as f:
-            pr_info = f.read()
+            with open(args.pr_info_file, 'r', encoding='utf-8') as f:
+                pr_info = f.read()
     except FileNotFoundError as e:
         print(f"❌ Файл не найден: {e}")
-        sys.exit(1)
-
-    # Создаём ассистента
-    config_path = Path(args.config) if args.config else None
-    assistant = CodeReviewAssistant(api_key=api_key, config_path=config_path)
+        return 1
 
     # Загружаем контекст проекта
     docs_dir = Path(args.docs_dir)
-    project_context = assistant.load_project_context(docs_dir)
+    with metrics.phase('context'):
+        project_context = assistant.load_project_context(docs_dir, files=files)
+        assistant.load_symbol_index()
 
     print("🤖 Запуск AI code review...")
-    print(f"📄 Размер diff: {len(diff)} символов")
+    print(f"📄 Размер diff: {diff_size(files)} символов, файлов: {len(files)}")
+    if diff_filter.skipped:
+        print(f"🚫 {diff_filter.summary()}")
     print(f"📄 Размер файлов: {len(file_contents)} символов")
     print(f"📚 Размер контекста: {len(project_context)} символов")
     print(f"🔧 Модель: {assistant.model}")
+    assistant.deadline = Deadline.from_config(assistant.deadline_config, args.deadline_seconds, args.job_started)
+    if assistant.deadline is not None:
+        print(f"⏳ До дедлайна: {assistant.deadline.remaining():.0f} с")
 
-    # Выполняем review
-    review_result = assistant.review_code(
-        diff=diff,
+    review_kwargs = dict(
+        files=files,
         file_contents=file_contents,
         pr_info=pr_info,
         project_context=project_context
     )
+    # Большие PR — поблочно, остальные — одним запросом
+    chunked = args.chunked or assistant.should_chunk(files)
+    run_review = assistant.review_method(files, chunked)
+    if assistant.cascade_config.get('enabled', False):
+        # Каскад сам решает, нужен ли map-reduce для рискованной части diff
+        run_review = functools.partial(assistant.review_code_cascade, chunked=args.chunked)
+    assistant.last_degradations = None
+    if assistant.deadline is not None:
+        # Внутри локальных правил: при повторе с упрощением они не пересчитываются
+        run_review = functools.partial(assistant.review_with_deadline, run_review)
+    assistant.last_minify = None
+    if assistant.minify_config.get('enabled', False):
+        # Правила ниже проверяют исходные hunk'и: им нужен полный контекст
+        run_review = functools.partial(assistant.review_minified, run_review)
+    assistant.last_local_rules = None
+    if assistant.local_rules_config.get('enabled', False):
+        # Локальные правила отсекают уже объяснённые hunk'и до любого запроса к модели
+        run_review = functools.partial(assistant.review_with_local_rules, run_review)
 
-    # Сохраняем результат
     output_path = Path(args.output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    streaming = args.stream or (assistant.config.get('streaming') or {}).get('enabled', False)
+
+    def save_metrics(status: str) -> None:
+        """Пишет метрики запуска рядом с review и дописывает историю"""
+        if not assistant.metrics_config.get('enabled', True):
+            return
+        metrics_path = Path(args.metrics_file) if args.metrics_file else output_path.with_suffix('.metrics.json')
+        report = metrics.write(
+            metrics_path,
+            status=status,
+            model=assistant.model,
+            prompt_version=PROMPT_VERSION,
+            chunked=chunked,
+            streamed=streaming,
+            files=len(files),
+            skipped_files=len(diff_filter.skipped),
+            diff_chars=diff_size(files),
+            file_contents_chars=len(file_contents),
+            project_context_chars=len(project_context),
+            cache_hits=assistant.cache.hits - cache_hits if assistant.cache is not None else None,
+            cache_misses=assistant.cache.misses - cache_misses if assistant.cache is not None else None,
+            routing=assistant.last_routing.summary() if assistant.last_routing is not None else None,
+            local_rules=assistant.last_local_rules.summary() if assistant.last_local_rules is not None else None,
+            degradations=assistant.last_degradations,
+            minify=assistant.last_minify.summary() if assistant.last_minify is not None else None,
+            replay=assistant.client.report() if args.replay else None,
+            total_seconds=round(time.monotonic() - started, 3)
+        )
+        history = args.metrics_history or assistant.metrics_config.get('history_file')
+        if history:
+            append_history(Path(history), report)
+        totals = report['totals']
+        cost = f", ${totals['cost_usd']:.4f}" if totals['cost_usd'] is not None else ""
+        print(
+            f"📊 Метрики: {totals['api_calls']} запросов, {totals['input_tokens']} → "
+            f"{totals['output_tokens']} токенов{cost} → {metrics_path}"
+        )
+        if totals['cache_creation_input_tokens'] or totals['cache_read_input_tokens']:
+            print(
+                f"💾 Prompt cache: записано {totals['cache_creation_input_tokens']}, "
+                f"прочитано {totals['cache_read_input_tokens']} токенов"
+            )
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(review_result)
+    if streaming:
+        if handle_sigterm:
+            # SIGTERM (остановка job по таймауту) превращаем в KeyboardInterrupt,
+            # чтобы дописать пометку о неполном review
+            signal.signal(signal.SIGTERM, _raise_interrupt)
+        print("\n" + "="*50)
+        with StreamingOutput(output_path) as output:
+            try:
+                with metrics.phase('review'):
+                    review_result = run_review(on_text=output.write, **review_kwargs)
+            except KeyboardInterrupt:
+                output.write("\n\n---\n⚠️ **Review прерван по таймауту, результат неполный.**\n")
+                print(f"\n⚠️  Review прерван, частичный результат сохранён в {output_path}")
+                save_metrics('interrupted')
+                return 130
+
+            # Ошибка API или ответ без потока (например, fallback reduce-прохода)
+            if review_result != output.text:
+                output.write(("\n\n" if output.parts else "") + review_result)
+
+            with metrics.phase('output'):
+                footer = build_output_footer(assistant)
+                if footer:
+                    output.write(footer)
+        print("\n" + "="*50)
+        if assistant.time_to_first_token is not None:
+            print(f"⏱️  Время до первого токена: {assistant.time_to_first_token:.2f} с")
+    else:
+        with metrics.phase('review'):
+            review_result = run_review(**review_kwargs)
+        with metrics.phase('output'):
+            review_result += build_output_footer(assistant)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(review_result)
+
+    if assistant.cache is not None:
+        evicted = assistant.cache.evict()
+        print(f"💾 Кэш: {assistant.cache.hits} попаданий, {assistant.cache.misses} промахов, удалено записей: {evicted}")
+
+    save_metrics('error' if assistant.last_error else 'ok')
 
     print(f"✅ Review сохранён в {output_path}")
-    print("\n" + "="*50)
-    print(review_result[:500] + "..." if len(review_result) > 500 else review_result)
+    if not streaming:
+        print("\n" + "="*50)
+        print(review_result[:500] + "..." if len(review_result) > 500 else review_result)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None, client: Optional[Any] = None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+
+    replay = None
+    if args.replay:
+        from cassette import ReplayClient
+
+        replay = client = ReplayClient(Path(args.replay), latency=args.replay_latency, strict=args.replay_strict)
+
+    # Проверяем API ключ (с подменённым клиентом, например в бенчмарках, он не нужен)
+    api_key = os.environ.get('ANTHROPIC_API_KEY', '')
+    if not api_key and client is None:
+        print("❌ ANTHROPIC_API_KEY не установлен")
+        sys.exit(1)
+
+    if args.serve:
+        from review_server import serve
+        serve(args, api_key, client=client)
+        return
+
+    missing = [name for name in REQUIRED_ARGS if getattr(args, name) is None]
+    if missing:
+        parser.error("обязательные аргументы: " + ", ".join('--' + name.replace('_', '-') for name in missing))
+    if args.job_started is None:
+        args.job_started = float(os.environ[JOB_STARTED_ENV]) if os.environ.get(JOB_STARTED_ENV) else None
+
+    started = time.monotonic()
+
+    # Создаём ассистента
+    config_path = Path(args.config) if args.config else None
+    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+    assistant = CodeReviewAssistant(api_key=api_key, config_path=config_path, cache_dir=cache_dir, client=client)
+    if args.record or args.replay:
+        # Как в бенчмарках: каждый запрос доходит до кассеты, а время прогона — без ожидания лимитов
+        assistant.cache = None
+        assistant.rate_limiter = None
+    if args.record:
+        from cassette import RecordingClient
+
+        assistant.client = RecordingClient(assistant.client, Path(args.record))
+
+    exit_code = run_review_job(assistant, args, started=started)
+    if args.record:
+        print(f"📼 Кассета {args.record}: записано запросов: {assistant.client.messages.recorded}")
+    if replay is not None:
+        print(f"📼 Кассета {args.replay}: {replay.summary()}")
+    if exit_code:
+        sys.exit(exit_code)
 
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Пакетный AI Code Review
+Проверяет много PR/diff из манифеста одним процессом: один клиент Anthropic,
+один индекс документации, параллельные задачи с учётом rate limit API
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import yaml
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from ai_code_review import CodeReviewAssistant, build_output_footer
+from diff_parser import DiffFilter, read_diff_file
+
+
+def load_manifest(path: Path) -> Dict:
+    """Загружает манифест задач (YAML или JSON)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = yaml.safe_load(f) or {}
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    jobs = manifest.get('jobs') or []
+    for index, job in enumerate(jobs, start=1):
+        job.setdefault('id', f"job-{index}")
+        for key in ('diff_file', 'files_file', 'pr_info_file'):
+            if key not in job:
+                raise ValueError(f"Задача {job['id']}: не указан {key}")
+    return manifest
+
+
+def resolve(base_dir: Path, value: str) -> Path:
+    """Пути в манифесте считаются относительно самого манифеста"""
+    path = Path(value)
+    return path if path.is_absolute() else base_dir / path
+
+
+def run_job(assistant: CodeReviewAssistant, job: Dict, base_dir: Path, output_dir: Path) -> Dict:
+    """Выполняет review одной задачи и пишет результат в её output_file"""
+    started = time.monotonic()
+    output_path = resolve(base_dir, job['output_file']) if job.get('output_file') else output_dir / f"{job['id']}.md"
+    result = {'id': job['id'], 'output_file': str(output_path)}
+
+    try:
+        files = list(read_diff_file(resolve(base_dir, job['diff_file']), DiffFilter.from_config(assistant.config)))
+        file_contents = resolve(base_dir, job['files_file']).read_text(encoding='utf-8')
+        pr_info = resolve(base_dir, job['pr_info_file']).read_text(encoding='utf-8')
+    except OSError as e:
+        result.update(status='error', error=f"Файл не найден: {e}", seconds=0.0)
+        return result
+
+    review_kwargs = dict(
+        files=files,
+        file_contents=file_contents,
+        pr_info=pr_info,
+        project_context=assistant.select_project_context(files)
+    )
+    if assistant.cascade_config.get('enabled', False):
+        run_review = functools.partial(assistant.review_code_cascade, chunked=bool(job.get('chunked')))
+    else:
+        run_review = assistant.review_method(files, bool(job.get('chunked')))
+    assistant.last_minify = None
+    if assistant.minify_config.get('enabled', False):
+        run_review = functools.partial(assistant.review_minified, run_review)
+    assistant.last_local_rules = None
+    if assistant.local_rules_config.get('enabled', False):
+        run_review = functools.partial(assistant.review_with_local_rules, run_review)
+    review = run_review(**review_kwargs)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(review + build_output_footer(assistant), encoding='utf-8')
+
+    error = assistant.last_error
+    result.update(
+        status='error' if error else 'ok',
+        error=str(error) if error else None,
+        minify_saved_tokens=assistant.last_minify.saved_tokens if assistant.last_minify is not None else None,
+        seconds=round(time.monotonic() - started, 3)
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетный AI Code Review по манифесту')
+    parser.add_argument('--manifest', required=True, help='YAML/JSON манифест с задачами')
+    parser.add_argument('--docs-dir', help='Директория с документацией (по умолчанию из манифеста)')
+    parser.add_argument('--output-dir', help='Директория для результатов (по умолчанию из манифеста)')
+    parser.add_argument('--config', default='.github/ai-review-config.yml', help='Путь к файлу конфигурации')
+    parser.add_argument('--cache-dir', help='Директория кэша ответов (по умолчанию из cache.directory)')
+    parser.add_argument('--concurrency', type=int, help='Число одновременных задач (по умолчанию batch.max_concurrency)')
+    parser.add_argument('--base-url', help='Адрес API (например, локальный stub-сервер)')
+
+    args = parser.parse_args()
+
+    api_key = os.environ.get('ANTHROPIC_API_KEY')
+    if not api_key:
+        print("❌ ANTHROPIC_API_KEY не установлен")
+        sys.exit(1)
+
+    manifest_path = Path(args.manifest)
+    try:
+        manifest = load_manifest(manifest_path)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print(f"❌ Не удалось прочитать манифест: {e}")
+        sys.exit(1)
+
+    base_dir = manifest_path.parent
+    jobs: List[Dict] = manifest['jobs']
+    output_dir = Path(args.output_dir or resolve(base_dir, manifest.get('output_dir', 'batch-output')))
+    docs_dir = Path(args.docs_dir or resolve(base_dir, manifest.get('docs_dir', '.claude')))
+
+    # Один ассистент на все задачи: общий клиент с пулом соединений,
+    # конфиг, кэш, индекс документации и rate limiter
+    assistant = CodeReviewAssistant(
+        api_key=api_key,
+        config_path=Path(args.config) if args.config else None,
+        cache_dir=Path(args.cache_dir) if args.cache_dir else None,
+        base_url=args.base_url
+    )
+    assistant.load_docs_index(docs_dir)
+    assistant.load_symbol_index()
+
+    batch_config = assistant.config.get('batch') or {}
+    concurrency = max(1, args.concurrency or batch_config.get('max_concurrency', 4))
+
+    print(f"📦 Пакетный review: {len(jobs)} задач, {concurrency} параллельно")
+    print(f"🔧 Модель: {assistant.model}")
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_job, assistant, job, base_dir, output_dir) for job in jobs]
+        results = []
+        for future in futures:
+            result = future.result()
+            icon = "✅" if result['status'] == 'ok' else "❌"
+            print(f"{icon} {result['id']}: {result['seconds']:.1f} с → {result['output_file']}")
+            if result.get('error'):
+                print(f"   {result['error']}")
+            results.append(result)
+
+    summary = {
+        'jobs': results,
+        'total_seconds': round(time.monotonic() - started, 3),
+        'concurrency': concurrency,
+        'rate_limit_wait_seconds': round(assistant.rate_limiter.waited_seconds, 3) if assistant.rate_limiter else 0.0,
+        'metrics': assistant.metrics.to_dict(),
+    }
+    output_dir.mkdir(parents=True, exist_ok=True)
+    summary_path = output_dir / 'batch_summary.json'
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    print(f"\n📊 Готово за {summary['total_seconds']:.1f} с, ошибок: {failed}. Сводка: {summary_path}")
+    if assistant.cache is not None:
+        assistant.cache.evict()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки AI Code Review
+Офлайн-набор: синтетические KMP diff от 1 KB до 100 MB, фейковый клиент
+Anthropic, JSON с результатами и сравнение с baseline с порогом регрессии
+"""
+
+import io
+import json
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import argparse
+import yaml
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from context_collector import render_excerpt  # noqa: E402
+from diff_parser import DiffFilter, parse_diff, read_diff_file  # noqa: E402
+from docs_index import DocsIndex  # noqa: E402
+from fake_client import FakeAnthropic  # noqa: E402
+from prompt_packer import diff_items, pack  # noqa: E402
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DEFAULT_CONFIG = SCRIPTS_DIR.parent / 'ai-review-config.yml'
+DEFAULT_SIZES = '1KB,100KB,1MB,10MB'
+BENCHMARKS = ('parse_diff', 'context_load', 'prompt_build', 'end_to_end')
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 * 1024, 'B': 1}
+
+FEATURES = [
+    ('categories', 'Category'), ('transactions', 'Transaction'), ('accounts', 'Account'), ('budgets', 'Budget'),
+    ('reports', 'Report'), ('settings', 'Setting'), ('profile', 'Profile'), ('sync', 'SyncJob'),
+]
+LAYERS = [
+    ('presentation/viewmodel', '{Entity}ViewModel'),
+    ('presentation/screen', '{Entity}Screen'),
+    ('domain/usecase', 'Get{Entity}UseCase'),
+    ('domain/model', '{Entity}'),
+    ('data/repository', '{Entity}RepositoryImpl'),
+]
+
+
+@dataclass
+class Workspace:
+    """Синтетические входные данные одного review"""
+    diff: str
+    file_contents: str
+    pr_info: str
+    docs: Dict[str, str] = field(default_factory=dict)
+
+
+def parse_size(value: str) -> int:
+    """'100KB' → 102400"""
+    value = value.strip().upper()
+    for unit in ('KB', 'MB', 'B'):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(value)
+
+
+def format_size(size_bytes: int) -> str:
+    for unit in ('MB', 'KB'):
+        if size_bytes >= SIZE_UNITS[unit] and size_bytes % SIZE_UNITS[unit] == 0:
+            return f"{size_bytes // SIZE_UNITS[unit]}{unit}"
+    return f"{size_bytes}B"
+
+
+def _kotlin_member(rng: random.Random, entity: str, index: int) -> List[str]:
+    """Один член класса в стиле проекта: StateFlow, suspend-функция или Composable"""
+    kind = rng.randrange(4)
+    name = f"{entity[0].lower()}{entity[1:]}"
+    if kind == 0:
+        return [
+            f"    private val _state{index} = MutableStateFlow<{entity}UiState>({entity}UiState.Loading)",
+            f"    val state{index}: StateFlow<{entity}UiState> = _state{index}.asStateFlow()",
+            "",
+        ]
+    if kind == 1:
+        return [
+            f"    fun load{entity}{index}(id: Long) {{",
+            "        viewModelScope.launch {",
+            f"            get{entity}UseCase(id)",
+            f"                .catch {{ e -> _state{index}.value = {entity}UiState.Error(e.message) }}",
+            f"                .collect {{ {name} -> _state{index}.value = {entity}UiState.Success({name}) }}",
+            "        }",
+            "    }",
+            "",
+        ]
+    if kind == 2:
+        return [
+            f"    suspend fun fetch{entity}{index}(limit: Int = {rng.randint(10, 100)}): Result<List<{entity}>> =",
+            "        withContext(dispatchers.io) {",
+            f"            runCatching {{ api.get{entity}s(limit).map {{ it.toDomain() }} }}",
+            "        }",
+            "",
+        ]
+    return [
+        "    @Composable",
+        f"    fun {entity}Item{index}({name}: {entity}, onClick: ({entity}) -> Unit) {{",
+        "        Card(modifier = Modifier.fillMaxWidth().clickable { onClick(" + name + ") }) {",
+        f"            Text(text = {name}.title, style = MaterialTheme.typography.titleMedium)",
+        "        }",
+        "    }",
+        "",
+    ]
+
+
+def generate_kotlin_file(rng: random.Random, feature: str, entity: str, class_name: str, members: int) -> List[str]:
+    """Строки Kotlin файла: package, imports и класс с членами"""
+    lines = [
+        f"package ru.macdroid.subagentstest.features.{feature}",
+        "",
+        "import androidx.compose.runtime.Composable",
+        "import kotlinx.coroutines.flow.MutableStateFlow",
+        "import kotlinx.coroutines.flow.StateFlow",
+        "import kotlinx.coroutines.launch",
+        "",
+        f"class {class_name}(",
+        f"    private val get{entity}UseCase: Get{entity}UseCase,",
+        "    private val dispatchers: AppDispatchers",
+        ") : ViewModel() {",
+        "",
+    ]
+    for index in range(members):
+        lines.extend(_kotlin_member(rng, entity, index))
+    lines.append("}")
+    return lines
+
+
+def _old_version(rng: random.Random, line: str) -> str:
+    """Правдоподобная «старая» версия изменённой строки"""
+    replacements = [
+        ('viewModelScope.launch', 'GlobalScope.launch'),
+        ('asStateFlow()', 'value'),
+        ('dispatchers.io', 'Dispatchers.IO'),
+        ('runCatching', 'try'),
+        ('Modifier.fillMaxWidth()', 'Modifier'),
+    ]
+    for new, old in replacements:
+        if new in line:
+            return line.replace(new, old)
+    return line.rstrip() + f"  // TODO {rng.randint(1, 99)}"
+
+
+def generate_file_diff(rng: random.Random, path: str, lines: List[str]) -> str:
+    """Unified diff файла: hunk'и с контекстом, номера строк совпадают с lines"""
+    parts = [
+        f"diff --git a/{path} b/{path}\n",
+        f"index {rng.getrandbits(28):07x}..{rng.getrandbits(28):07x} 100644\n",
+        f"--- a/{path}\n",
+        f"+++ b/{path}\n",
+    ]
+    # Изменённые строки заменяются один к одному, поэтому номера old и new совпадают
+    line_number = 9
+    while line_number < len(lines) - 8:
+        context = 3
+        changed = rng.randint(1, 6)
+        start = line_number
+        end = min(len(lines), start + context * 2 + changed)
+        body = []
+        for number in range(start, end + 1):
+            text = lines[number - 1]
+            if context < number - start + 1 <= context + changed and text.strip():
+                body.append(f"-{_old_version(rng, text)}\n")
+                body.append(f"+{text}\n")
+            else:
+                body.append(f" {text}\n")
+        count = end - start + 1
+        parts.append(f"@@ -{start},{count} +{start},{count} @@ class {Path(path).stem}\n")
+        parts.extend(body)
+        line_number = end + rng.randint(10, 60)
+    return "".join(parts)
+
+
+def generate_docs(rng: random.Random, size_bytes: int) -> Dict[str, str]:
+    """Документация проекта: markdown с разделами по фичам и слоям"""
+    docs: Dict[str, str] = {}
+    size = 0
+    index = 0
+    while size < size_bytes:
+        feature, _ = FEATURES[index % len(FEATURES)]
+        sections = [f"# {feature.title()} feature\n"]
+        for layer, _ in LAYERS:
+            sections.append(
+                f"## {layer}\n\n"
+                f"{feature.title()} {layer} uses StateFlow, UseCase and Repository patterns. "
+                f"ViewModel exposes immutable state; errors are mapped to UiState.Error. "
+                f"Rule {rng.randint(1, 999)}: never launch coroutines in GlobalScope.\n"
+            )
+        text = "\n".join(sections)
+        docs[f"{feature}_{index}.md"] = text
+        size += len(text)
+        index += 1
+    return docs
+
+
+def generate_workspace(size_bytes: int, seed: int = 42) -> Workspace:
+    """Генерирует diff примерно size_bytes, выдержки файлов, PR info и документацию"""
+    rng = random.Random(seed)
+    diff_parts: List[str] = []
+    excerpts: List[str] = []
+    size = 0
+    index = 0
+    while size < size_bytes:
+        feature, entity = FEATURES[index % len(FEATURES)]
+        layer, template = LAYERS[index % len(LAYERS)]
+        entity = f"{entity}{index}"
+        class_name = template.format(Entity=entity)
+        path = f"composeApp/src/commonMain/kotlin/ru/macdroid/subagentstest/features/{feature}/{layer}/{class_name}.kt"
+        lines = generate_kotlin_file(rng, feature, entity, class_name, members=rng.randint(4, 40))
+        file_diff = generate_file_diff(rng, path, lines)
+        diff_parts.append(file_diff)
+        excerpts.append(render_excerpt(path, "\n".join(lines), parse_diff(file_diff)[0], 20, True))
+        size += len(file_diff)
+        index += 1
+
+    pr_info = (
+        f"PR Title: Refactor {index} feature files\n"
+        "PR Description: Synthetic benchmark PR\n"
+        "Author: benchmark\n"
+        "Base Branch: main\n"
+    )
+    docs = generate_docs(rng, max(8 * 1024, min(size_bytes // 10, 5 * 1024 * 1024)))
+    return Workspace("".join(diff_parts), "\n".join(excerpts), pr_info, docs)
+
+
+def generate_diff(size_bytes: int, seed: int = 42) -> str:
+    """Генерирует синтетический diff Kotlin файлов заданного размера"""
+    return generate_workspace(size_bytes, seed).diff
+
+
+def write_workspace(workspace: Workspace, directory: Path) -> Dict[str, Path]:
+    """Раскладывает входные данные по файлам, как их готовит workflow"""
+    docs_dir = directory / 'docs'
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    for name, text in workspace.docs.items():
+        (docs_dir / name).write_text(text, encoding='utf-8')
+    paths = {
+        'diff': directory / 'changes.diff',
+        'files': directory / 'file_contents.txt',
+        'pr_info': directory / 'pr_info.txt',
+        'docs': docs_dir,
+    }
+    paths['diff'].write_text(workspace.diff, encoding='utf-8')
+    paths['files'].write_text(workspace.file_contents, encoding='utf-8')
+    paths['pr_info'].write_text(workspace.pr_info, encoding='utf-8')
+    return paths
+
+
+def write_benchmark_config(directory: Path, config_path: Path) -> Path:
+    """Конфиг проекта без дискового кэша и истории метрик — каждый прогон холодный"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    config.setdefault('cache', {})['enabled'] = False
+    config.setdefault('metrics', {})['history_file'] = None
+    config['rate_limits'] = {}
+    # Индекс символов строится по git-репозиторию, а не по синтетическому workspace
+    config.setdefault('symbol_index', {})['enabled'] = False
+    path = directory / 'config.yml'
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return path
+
+
+class Suite:
+    """Набор бенчмарков для одного размера входных данных"""
+
+    def __init__(self, size_bytes: int, seed: int, config_path: Path, latency: float, output_tokens: int):
+        self.size_bytes = size_bytes
+        self.directory = Path(tempfile.mkdtemp(prefix='review-bench-'))
+        self.workspace = generate_workspace(size_bytes, seed)
+        self.paths = write_workspace(self.workspace, self.directory)
+        self.config_path = write_benchmark_config(self.directory, config_path)
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            self.config = yaml.safe_load(f)
+        self.latency = latency
+        self.output_tokens = output_tokens
+
+    def client(self) -> FakeAnthropic:
+        return FakeAnthropic(latency=self.latency, output_tokens=self.output_tokens)
+
+    def parse_diff(self) -> None:
+        for _ in read_diff_file(self.paths['diff'], DiffFilter.from_config(self.config)):
+            pass
+
+    def context_load(self) -> None:
+        files = list(read_diff_file(self.paths['diff'], DiffFilter.from_config(self.config)))
+        index = DocsIndex(self.paths['docs']).build()
+        index.select_context(files, (self.config.get('limits') or {}).get('max_project_context_size', 15000))
+
+    def prompt_build(self) -> None:
+        from ai_code_review import CodeReviewAssistant
+
+        with redirect_stdout(io.StringIO()):
+            assistant = CodeReviewAssistant(api_key='offline', config_path=self.config_path, client=self.client())
+            files = list(read_diff_file(self.paths['diff'], DiffFilter.from_config(assistant.config)))
+            project_context = assistant.load_project_context(self.paths['docs'], files=files)
+            assistant.build_review_prompt(files, self.workspace.file_contents, self.workspace.pr_info, project_context)
+
+    def end_to_end(self) -> None:
+        from ai_code_review import main as review_main
+
+        argv = [
+            '--diff-file', str(self.paths['diff']),
+            '--files-file', str(self.paths['files']),
+            '--pr-info-file', str(self.paths['pr_info']),
+            '--docs-dir', str(self.paths['docs']),
+            '--output-file', str(self.directory / 'review.md'),
+            '--config', str(self.config_path),
+        ]
+        with redirect_stdout(io.StringIO()):
+            review_main(argv, client=self.client())
+
+
+def measure(func: Callable[[], None], repeat: int) -> Dict:
+    """Запускает func repeat раз; результат — медиана и минимум, в секундах"""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - started)
+    return {
+        'seconds': round(statistics.median(runs), 6),
+        'min_seconds': round(min(runs), 6),
+        'runs': len(runs),
+    }
+
+
+def run_suite(
+    sizes: List[int],
+    benchmarks: List[str],
+    repeat: int,
+    seed: int,
+    config_path: Path,
+    latency: float,
+    output_tokens: int
+) -> Dict:
+    """Прогоняет бенчмарки для всех размеров, возвращает сравнимый JSON"""
+    results: Dict[str, Dict] = {}
+    for size_bytes in sizes:
+        suite = Suite(size_bytes, seed, config_path, latency, output_tokens)
+        try:
+            for name in benchmarks:
+                key = f"{name}[{format_size(size_bytes)}]"
+                results[key] = measure(getattr(suite, name), repeat)
+                print(f"   {key:<28} {results[key]['seconds'] * 1000:10.1f} мс")
+        finally:
+            shutil.rmtree(suite.directory, ignore_errors=True)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'latency': latency,
+            'output_tokens': output_tokens,
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float, min_delta: float) -> List[str]:
+    """Регрессии: медиана хуже baseline больше чем на threshold и на min_delta секунд"""
+    regressions = []
+    for key, result in current['results'].items():
+        previous = baseline.get('results', {}).get(key)
+        if previous is None:
+            continue
+        delta = result['seconds'] - previous['seconds']
+        if delta > min_delta and result['seconds'] > previous['seconds'] * (1 + threshold):
+            regressions.append(
+                f"{key}: {previous['seconds'] * 1000:.1f} → {result['seconds'] * 1000:.1f} мс "
+                f"(+{delta / previous['seconds'] * 100:.0f}%)"
+            )
+    return regressions
+
+
+def bench_packer(size_mb: float, budget: int) -> None:
+    """Измеряет разбор и упаковку diff заданного размера в бюджет"""
+    diff = generate_diff(int(size_mb * 1024 * 1024))
+
+    start = time.perf_counter()
+    files = parse_diff(diff)
+    parsed = time.perf_counter()
+    items = diff_items(files)
+    itemized = time.perf_counter()
+    result = pack(items, budget)
+    packed = time.perf_counter()
+
+    print(f"📦 Упаковка diff {len(diff) / 1024 / 1024:.1f} MB в {budget} токенов")
+    print(f"   Файлов: {len(files)}, hunk'ов: {len(items)}")
+    print(f"   Разбор diff:      {(parsed - start) * 1000:8.1f} мс")
+    print(f"   Оценка токенов:   {(itemized - parsed) * 1000:8.1f} мс")
+    print(f"   Упаковка:         {(packed - itemized) * 1000:8.1f} мс")
+    print(f"   Итого:            {(packed - start) * 1000:8.1f} мс")
+    print(f"   Вошло: {len(result.included)}, отброшено: {len(result.dropped)}, "
+          f"токенов: {result.used_tokens}/{budget}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки AI Code Review')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Размеры diff через запятую (1KB ... 100MB)')
+    parser.add_argument('--only', help=f"Бенчмарки через запятую из: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов каждого замера (берётся медиана)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed генератора diff')
+    parser.add_argument('--config', default=str(DEFAULT_CONFIG), help='Конфиг, на основе которого идёт прогон')
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа фейкового клиента, с')
+    parser.add_argument('--output-tokens', type=int, default=800, help='Выходных токенов в ответе фейкового клиента')
+    parser.add_argument('--output', help='Куда сохранить результаты (JSON)')
+    parser.add_argument('--baseline', help='JSON baseline для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Допустимое замедление (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Игнорировать замедления меньше, мс')
+    parser.add_argument('--size-mb', type=float, help='Только бенчмарк упаковки diff заданного размера')
+    parser.add_argument('--budget', type=int, default=60000, help='Бюджет входных токенов для --size-mb')
+    args = parser.parse_args()
+
+    if args.size_mb is not None:
+        bench_packer(args.size_mb, args.budget)
+        return
+
+    benchmarks = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in benchmarks if name not in BENCHMARKS]
+    if unknown:
+        print(f"❌ Неизвестные бенчмарки: {', '.join(unknown)}")
+        sys.exit(2)
+
+    sizes = [parse_size(value) for value in args.sizes.split(',')]
+    print(f"⏱️  Бенчмарки: {', '.join(benchmarks)}; размеры: {', '.join(map(format_size, sizes))}")
+    current = run_suite(
+        sizes=sizes,
+        benchmarks=benchmarks,
+        repeat=max(1, args.repeat),
+        seed=args.seed,
+        config_path=Path(args.config),
+        latency=args.latency,
+        output_tokens=args.output_tokens
+    )
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты сохранены в {output_path}")
+
+    if not args.baseline:
+        return
+    baseline_path = Path(args.baseline)
+    if not baseline_path.exists():
+        print(f"⚠️  Baseline {baseline_path} не найден, сравнение пропущено")
+        return
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = compare(current, baseline, args.threshold, args.min_delta_ms / 1000)
+    if regressions:
+        print(f"❌ Регрессии (порог {args.threshold * 100:.0f}%):")
+        for line in regressions:
+            print(f"   {line}")
+        sys.exit(1)
+    print(f"✅ Регрессий относительно {baseline_path} нет")
+
+
+if __name__ == '__main__':
+    main()
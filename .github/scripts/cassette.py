@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Кассеты запросов к Claude API: запись и воспроизведение
+RecordingClient оборачивает настоящий клиент и дописывает в кассету отпечаток
+каждого запроса, ответ, usage и время; ReplayClient отдаёт записанные ответы
+без API (по желанию — с записанными задержками). Так прошлые PR можно прогнать
+через новую упаковку, кэширование или map-reduce и сравнить токены и время офлайн
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from fake_client import FakeMessage, FakeStream, FakeTextBlock, FakeUsage, request_text
+from prompt_packer import estimate_tokens
+
+
+CASSETTE_VERSION = 1
+USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+# Параметры запроса, не влияющие на ответ (таймаут зависит от дедлайна job)
+VOLATILE_KEYS = {'timeout'}
+REPLAY_CHUNK_SIZE = 40
+
+
+class CassetteMiss(Exception):
+    """В кассете нет ответа на запрос (строгое воспроизведение)"""
+
+
+def request_fingerprint(request: Dict) -> str:
+    """Отпечаток запроса: SHA-256 канонического JSON без изменчивых параметров"""
+    stable = {key: value for key, value in request.items() if key not in VOLATILE_KEYS}
+    payload = json.dumps(stable, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def usage_dict(usage: Any) -> Dict[str, int]:
+    return {name: getattr(usage, name, 0) or 0 for name in USAGE_FIELDS}
+
+
+def load_cassette(path: Path) -> List[Dict]:
+    """Записи кассеты (gzip JSONL: по одной записи на строку)"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class RecordingStream:
+    """Обёртка потока SDK: пропускает текст и записывает ответ по завершении"""
+
+    def __init__(self, manager: Any, on_done):
+        self._manager = manager
+        self._on_done = on_done
+        self._stream = None
+        self._parts: List[str] = []
+        self._first_token: Optional[float] = None
+        self._started = 0.0
+
+    def __enter__(self) -> 'RecordingStream':
+        self._started = time.monotonic()
+        self._stream = self._manager.__enter__()
+        return self
+
+    def __exit__(self, *exc_info) -> Any:
+        return self._manager.__exit__(*exc_info)
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        for text in self._stream.text_stream:
+            if self._first_token is None:
+                self._first_token = time.monotonic() - self._started
+            self._parts.append(text)
+            yield text
+
+    def get_final_message(self) -> Any:
+        message = self._stream.get_final_message()
+        self._on_done("".join(self._parts), message.usage, time.monotonic() - self._started, self._first_token)
+        return message
+
+
+class RecordingMessages:
+    """client.messages, который дописывает каждый успешный ответ в кассету"""
+
+    def __init__(self, inner: Any, path: Path):
+        self._inner = inner
+        self._path = path
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def _record(self, request: Dict, text: str, usage: Any, seconds: float, first_token: Optional[float]) -> None:
+        entry = {
+            'v': CASSETTE_VERSION,
+            'fingerprint': request_fingerprint(request),
+            'model': request.get('model', ''),
+            'prompt_tokens': estimate_tokens(request_text(request)),
+            'text': text,
+            'usage': usage_dict(usage),
+            'seconds': round(seconds, 3),
+            'first_token': round(first_token, 3) if first_token is not None else None,
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n"
+        # Каждая запись — отдельный gzip-member: кассета читается, даже если job оборвался
+        with self._lock:
+            with gzip.open(self._path, 'at', encoding='utf-8') as f:
+                f.write(line)
+            self.recorded += 1
+
+    def create(self, **kwargs) -> Any:
+        started = time.monotonic()
+        response = self._inner.create(**kwargs)
+        self._record(kwargs, response.content[0].text, response.usage, time.monotonic() - started, None)
+        return response
+
+    def stream(self, **kwargs) -> RecordingStream:
+        return RecordingStream(
+            self._inner.stream(**kwargs),
+            lambda text, usage, seconds, first_token: self._record(kwargs, text, usage, seconds, first_token)
+        )
+
+
+class RecordingClient:
+    """Клиент Anthropic, записывающий запросы в кассету"""
+
+    def __init__(self, inner: Any, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.messages = RecordingMessages(inner.messages, path)
+
+
+class ReplayMessages:
+    """client.messages, отвечающий из кассеты"""
+
+    def __init__(self, entries: List[Dict], latency: bool, strict: bool):
+        self._latency = latency
+        self._strict = strict
+        self._by_fingerprint: Dict[str, List[Dict]] = defaultdict(list)
+        self._by_model: Dict[str, List[Dict]] = defaultdict(list)
+        for entry in entries:
+            self._by_fingerprint[entry['fingerprint']].append(entry)
+            self._by_model[entry['model']].append(entry)
+        self._served: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self.calls: List[Dict] = []
+        self.hits = 0
+        self.misses = 0
+        # Оценка входных токенов одним способом для записи и прогона — сравнение без подмешивания usage
+        self.recorded_prompt_tokens = sum(entry.get('prompt_tokens', 0) for entry in entries)
+        self.replayed_prompt_tokens = 0
+
+    def _next(self, key: str, entries: List[Dict]) -> Dict:
+        """Записи с одним ключом отдаются по кругу в порядке записи"""
+        entry = entries[self._served[key] % len(entries)]
+        self._served[key] += 1
+        return entry
+
+    def _lookup(self, request: Dict) -> Dict:
+        fingerprint = request_fingerprint(request)
+        prompt_tokens = estimate_tokens(request_text(request))
+        with self._lock:
+            self.calls.append(request)
+            self.replayed_prompt_tokens += prompt_tokens
+            if fingerprint in self._by_fingerprint:
+                self.hits += 1
+                return self._next(fingerprint, self._by_fingerprint[fingerprint])
+            self.misses += 1
+            model = request.get('model', '')
+            if self._strict or not self._by_model.get(model):
+                raise CassetteMiss(f"нет записи для запроса {fingerprint[:12]} ({model})")
+            # Промпт изменился (новая упаковка): ответ той же модели, входные токены — оценка нового
+            # промпта; usage помечается, чтобы такие запросы не сравнивали с настоящими
+            entry = dict(self._next('model:' + model, self._by_model[model]))
+        entry['usage'] = dict(
+            entry['usage'],
+            input_tokens=prompt_tokens,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=0,
+            substituted=True,
+        )
+        return entry
+
+    @staticmethod
+    def _message(entry: Dict) -> FakeMessage:
+        return FakeMessage(
+            content=[FakeTextBlock(entry['text'])],
+            model=entry['model'],
+            usage=FakeUsage(**entry['usage'])
+        )
+
+    def create(self, **kwargs) -> FakeMessage:
+        entry = self._lookup(kwargs)
+        if self._latency:
+            time.sleep(entry['seconds'])
+        return self._message(entry)
+
+    def stream(self, **kwargs) -> FakeStream:
+        entry = self._lookup(kwargs)
+        first_token = delta = 0.0
+        if self._latency:
+            first_token = entry['first_token'] if entry['first_token'] is not None else entry['seconds']
+            chunks = max(1, -(-len(entry['text']) // REPLAY_CHUNK_SIZE))
+            delta = max(0.0, entry['seconds'] - first_token) / chunks
+        return FakeStream(self._message(entry), REPLAY_CHUNK_SIZE, first_token, delta)
+
+
+class ReplayClient:
+    """Заменитель `anthropic.Anthropic`, воспроизводящий кассету"""
+
+    def __init__(self, path: Path, latency: bool = False, strict: bool = False):
+        self.path = path
+        self.messages = ReplayMessages(load_cassette(path), latency=latency, strict=strict)
+
+    @property
+    def comparable(self) -> bool:
+        """Токены и стоимость прогона сравнимы с записью: все ответы — на те же промпты"""
+        return self.messages.misses == 0
+
+    def summary(self) -> str:
+        messages = self.messages
+        text = (
+            f"{messages.hits} совпадений, {messages.misses} подменённых ответов; "
+            f"входные токены (оценка): запись {messages.recorded_prompt_tokens} → прогон {messages.replayed_prompt_tokens}"
+        )
+        if not self.comparable:
+            text += ". ⚠️ Usage подменённых ответов смешивает оценку входа с записанным выходом — сравнивайте оценки"
+        return text
+
+    def report(self) -> Dict[str, Any]:
+        """Сводка воспроизведения для метрик"""
+        messages = self.messages
+        return {
+            'cassette': str(self.path),
+            'hits': messages.hits,
+            'substituted': messages.misses,
+            'comparable': self.comparable,
+            'recorded_prompt_tokens': messages.recorded_prompt_tokens,
+            'replayed_prompt_tokens': messages.replayed_prompt_tokens,
+        }
+
+
+def cassette_totals(entries: List[Dict]) -> Dict[str, Any]:
+    """Итоги кассеты: запросы, токены и суммарное время запросов"""
+    totals: Dict[str, Any] = {name: sum(entry['usage'][name] for entry in entries) for name in USAGE_FIELDS}
+    totals.update(
+        api_calls=len(entries),
+        api_seconds=round(sum(entry['seconds'] for entry in entries), 3),
+        prompt_tokens=sum(entry.get('prompt_tokens', 0) for entry in entries),
+    )
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Итоги кассет запросов AI Code Review')
+    parser.add_argument('cassettes', nargs='+', help='Файлы кассет (.jsonl.gz)')
+    args = parser.parse_args()
+
+    for path in args.cassettes:
+        totals = cassette_totals(load_cassette(Path(path)))
+        print(
+            f"📼 {path}: {totals['api_calls']} запросов, {totals['input_tokens']} → {totals['output_tokens']} токенов, "
+            f"кэш промпта {totals['cache_creation_input_tokens']}/{totals['cache_read_input_tokens']}, "
+            f"API {totals['api_seconds']:.1f} с"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Review по категориям анализа
+Каждая включённая категория `analysis_categories` (или группа категорий)
+анализируется отдельным небольшим запросом с общим префиксом промпта;
+замечания проходов объединяются и дедуплицируются по файлу и строке
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+# Фокус прохода для каждой категории `analysis_categories`
+CATEGORY_FOCUS: Dict[str, Tuple[str, str]] = {
+    'architecture': (
+        '🏗️ Architecture',
+        "Разделение слоёв Presentation/Domain/Data, Use Case и Repository, "
+        "Dependency Inversion, SOLID, feature slicing."
+    ),
+    'kotlin_best_practices': (
+        '💡 Best Practice',
+        "Идиомы Kotlin: null safety, immutability (val, data class), scope functions, "
+        "type safety, expect/actual и платформенная независимость."
+    ),
+    'compose_best_practices': (
+        '💡 Best Practice',
+        "Compose Multiplatform: state hoisting, remember/derivedStateOf, side effects "
+        "(LaunchedEffect, DisposableEffect), стабильность параметров Composable."
+    ),
+    'potential_bugs': (
+        '🐛 Bug / Potential Bug',
+        "Логические ошибки, edge cases, необработанные ошибки и исключения, утечки памяти."
+    ),
+    'performance': (
+        '⚡ Performance',
+        "Лишние рекомпозиции, тяжёлая работа в main-потоке, лишние аллокации и запросы."
+    ),
+    'code_style': (
+        '🎨 Code Style',
+        "Naming conventions, структура файлов, читаемость, соответствие стилю проекта."
+    ),
+    'testing': (
+        '🧪 Testing',
+        "Тестируемость изменений и недостающие тесты для новой логики."
+    ),
+    'documentation': (
+        '📚 Documentation',
+        "KDoc публичного API и актуальность документации."
+    ),
+    'security': (
+        '🔒 Security',
+        "Секреты в коде, небезопасные соединения, валидация входных данных, криптография."
+    ),
+    'concurrency': (
+        '🧵 Concurrency',
+        "Корутины и Flow: scope и отмена, диспетчеры, race conditions, thread safety."
+    ),
+}
+
+SEVERITY_HEADINGS = {
+    'critical': '### 🔴 Critical Issues',
+    'important': '### 🟡 Important Notes',
+    'suggestion': '### 💡 Suggestions',
+}
+SEVERITY_ORDER = ['critical', 'important', 'suggestion']
+SEVERITY_MARKERS = {'🔴': 'critical', '🟡': 'important', '💡': 'suggestion'}
+
+LOCATION_RE = re.compile(r'\*\*\[([^\]]+?):(\d+)(?:[-–]\d+)?\]\*\*')
+GOOD_PREFIX = '✅ Хорошо:'
+
+
+@dataclass
+class CategoryPass:
+    """Один проход: имя и категории, которые он проверяет"""
+
+    name: str
+    categories: List[str]
+
+    @property
+    def title(self) -> str:
+        return ", ".join(self.categories)
+
+    def focus(self) -> str:
+        """Инструкция прохода, которая дописывается после общего префикса"""
+        lines = [f"- **{CATEGORY_FOCUS[category][0]}** — {CATEGORY_FOCUS[category][1]}" for category in self.categories]
+        return (
+            "## 🎯 Фокус этого прохода\n\n"
+            "Остальные категории проверяются отдельными запросами — сообщай только о проблемах этих категорий:\n\n"
+            + "\n".join(lines) + "\n\n"
+        )
+
+
+def plan_passes(analysis_categories: Dict[str, bool], groups: Optional[Dict[str, List[str]]] = None) -> List[CategoryPass]:
+    """Проходы для включённых категорий: по группам из конфига или по одной категории"""
+    enabled = [
+        category for category, on in (analysis_categories or {}).items()
+        if on and category in CATEGORY_FOCUS
+    ]
+    if not groups:
+        return [CategoryPass(category, [category]) for category in enabled]
+    passes = []
+    for name, categories in groups.items():
+        selected = [category for category in categories or [] if category in enabled]
+        if selected:
+            passes.append(CategoryPass(name, selected))
+    return passes
+
+
+@dataclass
+class Finding:
+    """Замечание из ответа прохода"""
+
+    severity: str
+    text: str
+    path: Optional[str] = None
+    line: Optional[int] = None
+    passes: List[str] = field(default_factory=list)
+
+    @property
+    def problem(self) -> str:
+        """Текст строки `**Проблема:**` (пустой, если её нет)"""
+        line = next((line for line in self.text.splitlines() if line.startswith('**Проблема:**')), '')
+        return line.replace('**Проблема:**', '').strip()
+
+    @property
+    def key(self) -> Tuple:
+        """Место и нормализованный текст проблемы: разные замечания на одной строке не схлопываются"""
+        text = self.problem if self.path is not None and self.problem else self.text
+        return (self.path, self.line, re.sub(r'\s+', ' ', text).strip().lower())
+
+    @property
+    def headline(self) -> str:
+        """Строка для «Ключевых находок»: место и первая фраза проблемы"""
+        first = self.text.splitlines()[0].strip()
+        return f"{first}: {self.problem}" if self.problem else first
+
+    def render(self, titles: Dict[str, str]) -> str:
+        if len(self.passes) < 2:
+            return self.text
+        return f"{self.text}\n\n_Отмечено проходами: {'; '.join(titles.get(name, name) for name in self.passes)}_"
+
+
+def parse_findings(text: str, pass_name: str) -> Tuple[List[Finding], List[str]]:
+    """Замечания (блоки от 📍 до следующего) и отметки `✅ Хорошо:` из ответа прохода"""
+    findings: List[Finding] = []
+    good: List[str] = []
+    severity = 'important'
+    current: Optional[List[str]] = None
+
+    def close() -> None:
+        if current:
+            block = "\n".join(current).strip()
+            match = LOCATION_RE.search(current[0])
+            findings.append(Finding(
+                severity=severity,
+                text=block,
+                path=match.group(1).strip() if match else None,
+                line=int(match.group(2)) if match else None,
+                passes=[pass_name],
+            ))
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('#'):
+            close()
+            current = None
+            marker = next((marker for marker in SEVERITY_MARKERS if marker in stripped), None)
+            if marker:
+                severity = SEVERITY_MARKERS[marker]
+        elif stripped.startswith('📍'):
+            close()
+            current = [line]
+        elif stripped.startswith(GOOD_PREFIX):
+            close()
+            current = None
+            good.append(stripped[len(GOOD_PREFIX):].strip())
+        elif stripped == '---':
+            close()
+            current = None
+        elif current is not None:
+            current.append(line)
+    close()
+    return findings, good
+
+
+def merge_findings(results: List[Tuple[str, str]]) -> Tuple[List[Finding], List[str]]:
+    """Объединяет ответы проходов: одинаковая проблема на файл:строке — одно замечание с наибольшей severity"""
+    merged: Dict[Tuple, Finding] = {}
+    good: List[str] = []
+    for pass_name, text in results:
+        findings, pass_good = parse_findings(text, pass_name)
+        for note in pass_good:
+            if note and note not in good:
+                good.append(note)
+        for finding in findings:
+            existing = merged.get(finding.key)
+            if existing is None:
+                merged[finding.key] = finding
+            elif SEVERITY_ORDER.index(finding.severity) < SEVERITY_ORDER.index(existing.severity):
+                finding.passes = existing.passes + finding.passes
+                merged[finding.key] = finding
+            elif pass_name not in existing.passes:
+                existing.passes.append(pass_name)
+    ordered = sorted(
+        merged.values(),
+        key=lambda finding: (SEVERITY_ORDER.index(finding.severity), finding.path or '', finding.line or 0)
+    )
+    return ordered, good
+
+
+def render_review(
+    results: List[Tuple[str, str]],
+    titles: Dict[str, str],
+    failed: Optional[Dict[str, str]] = None
+) -> str:
+    """Собирает ответы проходов в стандартный Code Review Summary"""
+    findings, good = merge_findings(results)
+    counts = {severity: sum(1 for finding in findings if finding.severity == severity) for severity in SEVERITY_ORDER}
+
+    parts = [
+        "# 🔍 Code Review Summary\n",
+        "## 📊 Общая оценка\n",
+        f"- **Критичных проблем:** {counts['critical']} 🔴",
+        f"- **Важных замечаний:** {counts['important']} 🟡",
+        f"- **Предложений:** {counts['suggestion']} 💡\n",
+        "## 🎯 Ключевые находки\n",
+    ]
+    key_findings = [finding.headline for finding in findings[:3]]
+    parts.append("\n".join(f"- {line}" for line in key_findings) if key_findings else "Замечаний нет.")
+    parts += ["\n---\n", "## 📝 Детальные замечания\n"]
+    for severity in SEVERITY_ORDER:
+        blocks = [finding.render(titles) for finding in findings if finding.severity == severity]
+        if blocks:
+            parts.append(SEVERITY_HEADINGS[severity] + "\n")
+            parts.append("\n\n".join(blocks) + "\n\n---\n")
+    if good:
+        parts.append("## ✅ Что сделано хорошо\n")
+        parts.append("\n".join(f"- {note}" for note in good[:3]) + "\n")
+    if failed:
+        parts.append("\n".join(
+            f"⚠️ Проход «{titles.get(name, name)}» не выполнен: `{error}`" for name, error in failed.items()
+        ) + "\n")
+    parts.append(f"_Проходы по категориям: {'; '.join(titles.values())}_\n")
+    return "\n".join(parts)
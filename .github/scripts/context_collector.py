@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Сборщик контекста изменённых файлов для AI Code Review
+Читает содержимое файлов из git одним процессом `git cat-file --batch`
+и оставляет только окна строк вокруг hunk'ов и объемлющие объявления
+"""
+
+import re
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from diff_parser import DiffFilter, FileDiff, read_diff_file
+
+
+# Объявления Kotlin, которые показываются над окном как «где мы находимся»
+DECLARATION_RE = re.compile(
+    r'^\s*(?:@\w+(?:\([^)]*\))?\s+)*'
+    r'(?:(?:public|private|protected|internal|expect|actual|abstract|open|sealed|data|enum|'
+    r'annotation|inner|value|companion|override|suspend|inline|operator|infix|tailrec|external|const|lateinit)\s+)*'
+    r'(?:class|interface|object|fun|typealias)\b'
+)
+PACKAGE_RE = re.compile(r'^\s*package\s')
+GAP_MARKER = "     ⋮"
+
+
+class GitBlobReader:
+    """Долгоживущий `git cat-file --batch`: один процесс на все файлы"""
+
+    def __init__(self, repo_dir: Path = Path('.')):
+        self.process = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=repo_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def read(self, rev: str, path: str) -> Optional[str]:
+        """Возвращает содержимое файла в ревизии rev или None, если его нет"""
+        return self.read_object(f"{rev}:{path}")
+
+    def read_object(self, name: str) -> Optional[str]:
+        """Возвращает содержимое blob'а по имени объекта (SHA или `rev:path`)"""
+        self.process.stdin.write(f"{name}\n".encode('utf-8'))
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().decode('utf-8').rstrip('\n')
+        # Для отсутствующего объекта ответ — "<object> missing", а в имени (rev:path) могут быть пробелы
+        if not header or header.endswith((' missing', ' ambiguous')):
+            return None
+        _, object_type, size = header.rsplit(' ', 2)
+        data = self.process.stdout.read(int(size))
+        self.process.stdout.read(1)  # Завершающий перевод строки
+        if object_type != 'blob':
+            return None
+        return data.decode('utf-8', errors='replace')
+
+    def close(self) -> None:
+        if self.process.stdin:
+            self.process.stdin.close()
+        self.process.wait()
+
+    def __enter__(self) -> 'GitBlobReader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def hunk_windows(file_diff: FileDiff, window: int, line_count: int) -> List[Tuple[int, int]]:
+    """Окна строк (1-based, включительно) вокруг hunk'ов; пересекающиеся объединяются"""
+    ranges = []
+    for hunk in file_diff.hunks:
+        start = max(1, hunk.new_start - window)
+        end = min(line_count, hunk.new_start + max(hunk.new_count, 1) - 1 + window)
+        if start <= end:
+            ranges.append((start, end))
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def enclosing_declarations(lines: List[str], start: int) -> List[int]:
+    """Номера строк объявлений (class/fun/...), внутри которых начинается окно"""
+    first = next((line for line in lines[start - 1:] if line.strip()), "")
+    indent_limit = _indent(first)
+    found = []
+    for number in range(start - 1, 0, -1):
+        if indent_limit == 0:
+            break
+        line = lines[number - 1]
+        if line.strip() and _indent(line) < indent_limit and DECLARATION_RE.match(line):
+            found.append(number)
+            indent_limit = _indent(line)
+    return sorted(found)
+
+
+def render_excerpt(path: str, content: str, file_diff: FileDiff, window: int, include_declarations: bool) -> str:
+    """Формирует выдержку файла с номерами строк для промпта"""
+    lines = content.splitlines()
+    shown = set()
+    for start, end in hunk_windows(file_diff, window, len(lines)):
+        shown.update(range(start, end + 1))
+        if include_declarations:
+            shown.update(enclosing_declarations(lines, start))
+    if include_declarations:
+        package_line = next((number for number, line in enumerate(lines, start=1) if PACKAGE_RE.match(line)), None)
+        if package_line:
+            shown.add(package_line)
+
+    width = len(str(len(lines))) if lines else 1
+    output = [f"=== FILE: {path} ==="]
+    previous = 0
+    for number in sorted(shown):
+        if number != previous + 1:
+            output.append(GAP_MARKER)
+        output.append(f"{number:>{width}} | {lines[number - 1]}")
+        previous = number
+    if previous and previous < len(lines):
+        output.append(GAP_MARKER)
+    return "\n".join(output) + "\n"
+
+
+def collect_context(
+    files: Iterable[FileDiff],
+    rev: str = 'HEAD',
+    window: int = 20,
+    include_declarations: bool = True,
+    repo_dir: Path = Path('.')
+) -> Dict[str, str]:
+    """Собирает выдержки для всех файлов diff (удалённые пропускаются).
+
+    files читается один раз, поэтому подходит генератор read_diff_file: разобранный
+    файл освобождается, как только для него собрана выдержка.
+    """
+    excerpts: Dict[str, str] = {}
+    with GitBlobReader(repo_dir) as reader:
+        for file_diff in files:
+            if file_diff.change_type == 'deleted' or file_diff.path in excerpts:
+                continue
+            content = reader.read(rev, file_diff.path)
+            if content is None:
+                continue
+            excerpts[file_diff.path] = render_excerpt(
+                file_diff.path, content, file_diff, window, include_declarations
+            )
+    return excerpts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Выдержки изменённых файлов вокруг hunk\'ов')
+    parser.add_argument('--diff-file', required=True, help='Файл с diff изменений')
+    parser.add_argument('--output', required=True, help='Куда записать выдержки (формат === FILE: ===)')
+    parser.add_argument('--rev', default='HEAD', help='Ревизия, из которой читаются файлы')
+    parser.add_argument('--repo-dir', default='.', help='Корень git репозитория')
+    parser.add_argument('--config', default='.github/ai-review-config.yml', help='Путь к файлу конфигурации')
+    args = parser.parse_args()
+
+    # yaml нужен только CLI: GitBlobReader импортируется и из ai_code_review.py
+    import yaml
+
+    config = {}
+    config_path = Path(args.config)
+    if config_path.exists():
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+    collector_config = config.get('context_collector') or {}
+
+    try:
+        excerpts = collect_context(
+            read_diff_file(Path(args.diff_file), DiffFilter.from_config(config)),
+            rev=args.rev,
+            window=collector_config.get('window_lines', 20),
+            include_declarations=collector_config.get('include_declarations', True),
+            repo_dir=Path(args.repo_dir)
+        )
+    except FileNotFoundError as e:
+        print(f"❌ Файл не найден: {e}")
+        sys.exit(1)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(excerpts.values()))
+
+    total = sum(len(text) for text in excerpts.values())
+    print(f"📄 Выдержки: {len(excerpts)} файлов, {total} символов → {output_path}")
+
+
+if __name__ == '__main__':
+    main()
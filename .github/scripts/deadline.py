@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Дедлайн review
+Оставшееся до таймаута job время ограничивает каждый запрос к API и повторы;
+когда времени мало, review упрощается по шагам: без контекста проекта,
+меньше файлов, более быстрая модель
+"""
+
+import math
+import time
+from typing import Dict, List, Optional
+
+
+# Шаги деградации в порядке применения
+DEGRADATION_STEPS = ['context', 'files', 'model']
+
+
+class DeadlineExceeded(Exception):
+    """До дедлайна не осталось времени на запрос"""
+
+
+class Deadline:
+    """Момент (time.monotonic), к которому review должен быть готов"""
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Dict,
+        deadline_seconds: Optional[float] = None,
+        job_started: Optional[float] = None
+    ) -> Optional['Deadline']:
+        """Дедлайн из аргументов: явное число секунд или старт job (unix time) + таймаут job"""
+        if not config.get('enabled', True):
+            return None
+        if deadline_seconds:
+            return cls(time.monotonic() + deadline_seconds)
+        if job_started:
+            expires = job_started + config.get('job_timeout_minutes', 15) * 60 - config.get('reserve_seconds', 180)
+            return cls(time.monotonic() + expires - time.time())
+        return None
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def request_timeout(self, default: float, minimum: float = 0.0) -> float:
+        """Таймаут очередного запроса: не дольше оставшегося времени"""
+        remaining = self.remaining()
+        if remaining <= minimum:
+            raise DeadlineExceeded(f"до дедлайна review осталось {max(remaining, 0):.0f} с")
+        return min(default, remaining)
+
+
+def plan_degradation(remaining: float, thresholds: Dict[str, float], applied: Optional[List[str]] = None) -> List[str]:
+    """Шаги деградации: уже применённые и те, чей порог больше оставшегося времени"""
+    applied = applied or []
+    return [
+        step for step in DEGRADATION_STEPS
+        if step in applied or remaining < thresholds.get(step, -math.inf)
+    ]
+
+
+def next_degradation(applied: List[str]) -> Optional[str]:
+    """Следующий ещё не применённый шаг"""
+    return next((step for step in DEGRADATION_STEPS if step not in applied), None)
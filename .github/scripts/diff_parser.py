@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Парсер unified diff
+Потоково разбирает diff на файлы и hunk'и, отфильтровывая файлы
+по правилам конфига до того, как они попадут в промпт
+"""
+
+import fnmatch
+import mmap
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+FILE_BANNER_RE = re.compile(r'^=== FILE: (.+?) ===$', re.MULTILINE)
+
+
+@dataclass
+class Hunk:
+    """Один hunk diff'а вместе с заголовком @@"""
+
+    header: str
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + self.lines)
+
+
+@dataclass
+class FileDiff:
+    """Изменения одного файла: заголовок git diff и список hunk'ов"""
+
+    path: str
+    old_path: str
+    change_type: str = "modified"
+    header_lines: List[str] = field(default_factory=list)
+    hunks: List[Hunk] = field(default_factory=list)
+
+    @property
+    def header(self) -> str:
+        return "\n".join(self.header_lines)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + [hunk.text for hunk in self.hunks])
+
+
+@dataclass
+class DiffChunk:
+    """Фрагмент diff'а для отдельного запроса: часть hunk'ов одного файла"""
+
+    file: FileDiff
+    hunks: List[Hunk]
+    part: int = 1
+    parts: int = 1
+
+    @property
+    def path(self) -> str:
+        return self.file.path
+
+    @property
+    def title(self) -> str:
+        if self.parts > 1:
+            return f"{self.path} (часть {self.part}/{self.parts})"
+        return self.path
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.file.header] + [hunk.text for hunk in self.hunks])
+
+    def as_file_diff(self) -> FileDiff:
+        """Представляет фрагмент как FileDiff только с его hunk'ами"""
+        return FileDiff(
+            path=self.file.path,
+            old_path=self.file.old_path,
+            change_type=self.file.change_type,
+            header_lines=self.file.header_lines,
+            hunks=self.hunks,
+        )
+
+
+def _parse_hunk_header(line: str) -> Optional[Hunk]:
+    match = HUNK_HEADER_RE.match(line)
+    if not match:
+        return None
+    old_start, old_count, new_start, new_count = match.groups()
+    return Hunk(
+        header=line,
+        old_start=int(old_start),
+        old_count=int(old_count) if old_count is not None else 1,
+        new_start=int(new_start),
+        new_count=int(new_count) if new_count is not None else 1,
+    )
+
+
+def _strip_prefix(path: str) -> str:
+    if path.startswith(("a/", "b/")):
+        return path[2:]
+    return path
+
+
+def _apply_header_line(current: FileDiff, line: str) -> None:
+    current.header_lines.append(line)
+    if line.startswith("new file mode"):
+        current.change_type = "added"
+    elif line.startswith("deleted file mode"):
+        current.change_type = "deleted"
+    elif line.startswith("rename from "):
+        current.change_type = "renamed"
+        current.old_path = line[len("rename from "):]
+    elif line.startswith("rename to "):
+        current.path = line[len("rename to "):]
+    elif line.startswith("+++ ") and line[4:] != "/dev/null":
+        current.path = _strip_prefix(line[4:])
+
+
+def iter_file_diffs(
+    lines: Iterable[str],
+    accept: Optional[Callable[[FileDiff], bool]] = None
+) -> Iterator[FileDiff]:
+    """Потоково разбирает строки `git diff`, выдавая файлы по одному.
+
+    accept вызывается, как только заголовок файла прочитан (до первого hunk'а):
+    строки отклонённого файла не накапливаются, поэтому память ограничена
+    самым большим из принятых файлов.
+    """
+    current: Optional[FileDiff] = None
+    hunk: Optional[Hunk] = None
+    decided = False
+    skipping = False
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            if current is not None and not skipping and (decided or accept is None or accept(current)):
+                yield current
+            # Формат: diff --git a/<old> b/<new>
+            paths = line[len("diff --git "):]
+            old_path, _, new_path = paths.partition(" b/")
+            current = FileDiff(
+                path=new_path or _strip_prefix(old_path),
+                old_path=_strip_prefix(old_path),
+                header_lines=[line],
+            )
+            hunk = None
+            decided = False
+            skipping = False
+            continue
+
+        if current is None or skipping:
+            continue
+
+        if line.startswith("@@"):
+            new_hunk = _parse_hunk_header(line)
+            if new_hunk is not None:
+                if not decided:
+                    decided = True
+                    if accept is not None and not accept(current):
+                        skipping = True
+                        continue
+                hunk = new_hunk
+                current.hunks.append(hunk)
+                continue
+
+        if hunk is not None:
+            hunk.lines.append(line)
+            continue
+
+        _apply_header_line(current, line)
+
+    if current is not None and not skipping and (decided or accept is None or accept(current)):
+        yield current
+
+
+def parse_diff(diff: str) -> List[FileDiff]:
+    """Разбирает вывод `git diff` на список изменённых файлов"""
+    return list(iter_file_diffs(diff.splitlines()))
+
+
+def iter_diff_lines(path: Path) -> Iterator[str]:
+    """Читает файл diff построчно через mmap, не загружая его целиком"""
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for raw in iter(mapped.readline, b""):
+                yield raw.decode('utf-8', errors='replace').rstrip("\r\n")
+
+
+def render_diff(files: Iterable[FileDiff]) -> str:
+    """Собирает записи обратно в текст unified diff"""
+    return "\n".join(file_diff.text for file_diff in files)
+
+
+class DiffFilter:
+    """Фильтр файлов diff по секциям конфига.
+
+    Учитывает `ignore_patterns`, `analyze_only.file_extensions`,
+    `analyze_only.change_types`, `limits.max_files_to_analyze` и
+    `limits.max_diff_size`; отклонённые файлы с причиной собираются в skipped.
+    """
+
+    def __init__(
+        self,
+        ignore_patterns: Optional[List[str]] = None,
+        file_extensions: Optional[List[str]] = None,
+        change_types: Optional[List[str]] = None,
+        max_files: Optional[int] = None,
+        max_chars: Optional[int] = None
+    ):
+        self.ignore_patterns = ignore_patterns or []
+        self.file_extensions = tuple(file_extensions or ())
+        self.change_types = set(change_types or ())
+        self.max_files = max_files
+        self.max_chars = max_chars
+        self.accepted = 0
+        self.accepted_chars = 0
+        self.skipped: List[Tuple[str, str]] = []
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'DiffFilter':
+        analyze_only = config.get('analyze_only') or {}
+        limits = config.get('limits') or {}
+        return cls(
+            ignore_patterns=config.get('ignore_patterns'),
+            file_extensions=analyze_only.get('file_extensions'),
+            change_types=analyze_only.get('change_types'),
+            max_files=limits.get('max_files_to_analyze'),
+            max_chars=limits.get('max_diff_size'),
+        )
+
+    def _is_ignored(self, path: str) -> bool:
+        # '/' в начале позволяет шаблонам вида **/build/** совпадать и с корнем
+        return any(
+            fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(f"/{path}", pattern)
+            for pattern in self.ignore_patterns
+        )
+
+    def reason(self, file_diff: FileDiff) -> Optional[str]:
+        """Причина, по которой файл не анализируется, или None"""
+        if self.file_extensions and not file_diff.path.endswith(self.file_extensions):
+            return "расширение"
+        # Переименование с правками анализируется как изменение
+        change_type = "modified" if file_diff.change_type == "renamed" else file_diff.change_type
+        if self.change_types and change_type not in self.change_types:
+            return f"тип изменения: {file_diff.change_type}"
+        if self._is_ignored(file_diff.path):
+            return "ignore_patterns"
+        if self.max_files is not None and self.accepted >= self.max_files:
+            return "max_files_to_analyze"
+        return None
+
+    def __call__(self, file_diff: FileDiff) -> bool:
+        reason = self.reason(file_diff)
+        if reason is not None:
+            self.skipped.append((file_diff.path, reason))
+            return False
+        self.accepted += 1
+        return True
+
+    def admit(self, file_diff: FileDiff) -> bool:
+        """Проверяет разобранный файл по бюджету размера diff: принятые файлы в сумме не больше max_chars"""
+        size = len(file_diff.text)
+        if self.max_chars is not None and self.accepted_chars + size > self.max_chars:
+            self.skipped.append((file_diff.path, "max_diff_size"))
+            self.accepted -= 1
+            return False
+        self.accepted_chars += size
+        return True
+
+    def summary(self) -> str:
+        """Краткая сводка по пропущенным файлам"""
+        if not self.skipped:
+            return ""
+        counts: Dict[str, int] = {}
+        for _, reason in self.skipped:
+            counts[reason] = counts.get(reason, 0) + 1
+        details = ", ".join(f"{reason}: {count}" for reason, count in counts.items())
+        return f"Пропущено файлов: {len(self.skipped)} ({details})"
+
+
+def read_diff_file(path: Path, diff_filter: Optional[DiffFilter] = None) -> Iterator[FileDiff]:
+    """Потоково читает файл diff и выдаёт принятые фильтром файлы по одному.
+
+    Генератор: в памяти одновременно только разбираемый файл, а если вызывающий
+    собирает файлы в список — не больше `limits.max_diff_size` символов diff.
+    Файл открывается при первой итерации.
+    """
+    for file_diff in iter_file_diffs(iter_diff_lines(path), accept=diff_filter):
+        if diff_filter is None or diff_filter.admit(file_diff):
+            yield file_diff
+
+
+def diff_size(files: Iterable[FileDiff]) -> int:
+    """Размер diff в символах без повторной сборки текста"""
+    return sum(
+        len(file_diff.header) + sum(len(hunk.header) + sum(len(line) + 1 for line in hunk.lines)
+                                    for hunk in file_diff.hunks)
+        for file_diff in files
+    )
+
+
+def chunk_file_diff(file_diff: FileDiff, max_chars: int) -> List[DiffChunk]:
+    """Группирует hunk'и файла во фрагменты не длиннее max_chars.
+
+    Hunk никогда не разрезается: если он сам длиннее лимита,
+    он уходит отдельным фрагментом целиком.
+    """
+    groups: List[List[Hunk]] = []
+    group: List[Hunk] = []
+    size = len(file_diff.header)
+
+    for hunk in file_diff.hunks:
+        hunk_size = len(hunk.text) + 1
+        if group and size + hunk_size > max_chars:
+            groups.append(group)
+            group = []
+            size = len(file_diff.header)
+        group.append(hunk)
+        size += hunk_size
+
+    if group or not groups:
+        groups.append(group)
+
+    return [
+        DiffChunk(file=file_diff, hunks=hunks, part=index, parts=len(groups))
+        for index, hunks in enumerate(groups, start=1)
+    ]
+
+
+def chunk_diff(files: List[FileDiff], max_chars: int) -> List[DiffChunk]:
+    """Разбивает diff на фрагменты по файлам, большие файлы — по группам hunk'ов"""
+    chunks: List[DiffChunk] = []
+    for file_diff in files:
+        chunks.extend(chunk_file_diff(file_diff, max_chars))
+    return chunks
+
+
+def split_file_sections(file_contents: str) -> Dict[str, str]:
+    """Разбивает выгрузку `=== FILE: path ===` на содержимое по файлам"""
+    sections: Dict[str, str] = {}
+    matches = list(FILE_BANNER_RE.finditer(file_contents))
+    if not matches and file_contents.strip():
+        # Выгрузка без баннеров — считаем её одним блоком
+        return {'file_contents': file_contents}
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(file_contents)
+        sections[match.group(1)] = file_contents[match.start():end].rstrip() + "\n"
+    return sections
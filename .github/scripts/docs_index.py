@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Поисковый индекс по документации проекта для AI Code Review
+BM25 по разделам markdown файлов, сохраняется на диск и перестраивается
+только для изменившихся файлов
+"""
+
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from diff_parser import FileDiff
+
+
+INDEX_VERSION = 1
+DOC_SUFFIXES = ('.md', '.txt')
+
+# Файлы, которые попадают в контекст, если по diff ничего не нашлось
+PRIORITY_FILES = [
+    "ARCHITECTURE.md",
+    "PROJECT_STATUS.md",
+    "QUICKSTART.md",
+    "INDEX.md"
+]
+
+HEADING_RE = re.compile(r'^#{1,6}\s+(.+?)\s*#*\s*$')
+WORD_RE = re.compile(r'[A-Za-zА-Яа-яЁё_][\wЁё]*')
+CAMEL_RE = re.compile(r'[A-ZА-ЯЁ]?[a-zа-яё]+|[A-ZА-ЯЁ]+(?![a-zа-яё])|\d+')
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на термы: слова целиком и части CamelCase/snake_case"""
+    terms = []
+    for word in WORD_RE.findall(text):
+        lower = word.lower()
+        if len(lower) > 1:
+            terms.append(lower)
+        parts = [part.lower() for part in CAMEL_RE.findall(word)]
+        if len(parts) > 1:
+            terms.extend(part for part in parts if len(part) > 2)
+    return terms
+
+
+def query_terms(files: Iterable[FileDiff], max_terms: int = 200) -> List[str]:
+    """Собирает поисковый запрос из путей и идентификаторов изменённого кода"""
+    counts: Counter = Counter()
+    for file_diff in files:
+        counts.update(tokenize(file_diff.path.replace('/', ' ').replace('.', ' ')))
+        for hunk in file_diff.hunks:
+            counts.update(tokenize(hunk.header))
+            for line in hunk.lines:
+                if line.startswith(('+', '-')):
+                    counts.update(tokenize(line[1:]))
+    return [term for term, _ in counts.most_common(max_terms)]
+
+
+def split_sections(text: str, max_chars: int) -> List[Tuple[str, str]]:
+    """Делит markdown на разделы по заголовкам, длинные разделы — по абзацам.
+
+    Строка заголовка в текст раздела не входит: в контекст он выводится
+    вместе с именем файла.
+    """
+    sections: List[Tuple[str, List[str]]] = [("", [])]
+    in_code = False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        match = None if in_code else HEADING_RE.match(line)
+        if match:
+            sections.append((match.group(1), []))
+        else:
+            sections[-1][1].append(line)
+
+    result: List[Tuple[str, str]] = []
+    for heading, lines in sections:
+        body = "\n".join(lines).strip()
+        if not body:
+            continue
+        if len(body) <= max_chars:
+            result.append((heading, body))
+            continue
+        piece = ""
+        for paragraph in body.split("\n\n"):
+            if piece and len(piece) + len(paragraph) + 2 > max_chars:
+                result.append((heading, piece))
+                piece = ""
+            piece = f"{piece}\n\n{paragraph}" if piece else paragraph
+        if piece:
+            result.append((heading, piece[:max_chars]))
+    return result
+
+
+def render_sections(sections: Iterable[Dict], max_chars: int) -> str:
+    """Разделы документации для промпта в пределах бюджета символов"""
+    parts = []
+    used = 0
+    for section in sections:
+        block = f"### {section['file']} › {section['heading'] or 'Введение'}\n{section['text']}\n"
+        if used + len(block) > max_chars:
+            continue
+        parts.append(block)
+        used += len(block) + 2
+    return "\n\n".join(parts)
+
+
+class DocsIndex:
+    """BM25 индекс по разделам документации с инкрементальным обновлением"""
+
+    def __init__(self, docs_dir: Path, index_path: Optional[Path] = None, max_section_chars: int = 4000):
+        self.docs_dir = Path(docs_dir)
+        self.index_path = index_path
+        self.max_section_chars = max_section_chars
+        self.files: Dict[str, Dict] = {}
+        self.reindexed: List[str] = []
+
+    @property
+    def sections(self) -> List[Dict]:
+        return [section for entry in self.files.values() for section in entry['sections']]
+
+    def _load_saved(self) -> Dict[str, Dict]:
+        if not self.index_path or not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != INDEX_VERSION or data.get('max_section_chars') != self.max_section_chars:
+            return {}
+        return data.get('files', {})
+
+    def _index_file(self, rel_path: str, content: str) -> List[Dict]:
+        sections = []
+        for heading, text in split_sections(content, self.max_section_chars):
+            terms = tokenize(f"{heading}\n{text}")
+            sections.append({
+                'file': rel_path,
+                'heading': heading,
+                'text': text,
+                'length': len(terms),
+                'tf': dict(Counter(terms)),
+            })
+        return sections
+
+    def build(self) -> 'DocsIndex':
+        """Обновляет индекс: переиндексирует только файлы с изменившимся хэшем"""
+        saved = self.files or self._load_saved()
+        files: Dict[str, Dict] = {}
+        self.reindexed = []
+
+        if self.docs_dir.exists():
+            for path in sorted(self.docs_dir.rglob('*')):
+                if not path.is_file() or path.suffix.lower() not in DOC_SUFFIXES:
+                    continue
+                rel_path = path.relative_to(self.docs_dir).as_posix()
+                raw = path.read_bytes()
+                digest = hashlib.sha256(raw).hexdigest()
+                entry = saved.get(rel_path)
+                if entry is None or entry.get('sha256') != digest:
+                    content = raw.decode('utf-8', errors='replace')
+                    entry = {'sha256': digest, 'sections': self._index_file(rel_path, content)}
+                    self.reindexed.append(rel_path)
+                files[rel_path] = entry
+
+        changed = bool(self.reindexed) or set(files) != set(saved)
+        self.files = files
+        if changed:
+            self.save()
+        return self
+
+    def save(self) -> None:
+        """Сохраняет индекс на диск"""
+        if not self.index_path:
+            return
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'max_section_chars': self.max_section_chars,
+                'files': self.files,
+            }, f, ensure_ascii=False)
+        tmp_path.replace(self.index_path)
+
+    def search(self, terms: List[str]) -> List[Tuple[float, Dict]]:
+        """Ранжирует разделы по BM25 для набора термов"""
+        sections = self.sections
+        if not sections or not terms:
+            return []
+
+        total = len(sections)
+        avg_length = sum(section['length'] for section in sections) / total or 1.0
+        unique_terms = set(terms)
+        doc_freq = Counter(
+            term for section in sections for term in unique_terms if term in section['tf']
+        )
+
+        scored = []
+        for section in sections:
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * section['length'] / avg_length)
+            for term in unique_terms:
+                tf = section['tf'].get(term)
+                if not tf:
+                    continue
+                idf = math.log(1 + (total - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((score, section))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+    def _priority_sections(self) -> List[Dict]:
+        ordered = []
+        for filename in PRIORITY_FILES:
+            entry = self.files.get(filename)
+            if entry:
+                ordered.extend(entry['sections'])
+        return ordered
+
+    def select_context(self, files: Iterable[FileDiff], max_chars: int, exclude: Iterable[str] = ()) -> str:
+        """Возвращает самые релевантные diff'у разделы в пределах бюджета символов.
+
+        exclude — файлы, которые уже есть в промпте целиком (постоянный контекст).
+        """
+        excluded = set(exclude)
+        ranked = [section for _, section in self.search(query_terms(files))]
+        if not ranked:
+            ranked = self._priority_sections()
+        return render_sections([section for section in ranked if section['file'] not in excluded], max_chars)
+
+    def fixed_context(self, filenames: Iterable[str], max_chars: int) -> str:
+        """Разделы перечисленных файлов в исходном порядке: одинаковы для любого diff"""
+        sections = [
+            section
+            for filename in filenames
+            for section in (self.files.get(filename) or {}).get('sections', [])
+        ]
+        return render_sections(sections, max_chars)
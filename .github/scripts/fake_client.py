@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Фейковый клиент Anthropic для офлайн-проверок AI Code Review
+Повторяет нужную часть интерфейса SDK: messages.create и messages.stream,
+включая prompt caching: префиксы до блоков с cache_control запоминаются,
+и повторный запрос с тем же префиксом получает cache_read_input_tokens
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from prompt_packer import estimate_tokens
+
+
+DEFAULT_RESPONSE = """# 🔍 Code Review Summary
+
+## 📊 Общая оценка
+
+- **Критичных проблем:** 0 🔴
+- **Важных замечаний:** 1 🟡
+- **Предложений:** 1 💡
+
+## 🎯 Ключевые находки
+
+Офлайн-ответ фейкового клиента.
+"""
+
+
+@dataclass
+class FakeTextBlock:
+    text: str
+    type: str = "text"
+
+
+@dataclass
+class FakeUsage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    # Ответ подставлен из кассеты для другого промпта (см. cassette.ReplayMessages)
+    substituted: bool = False
+
+
+@dataclass
+class FakeMessage:
+    content: List[FakeTextBlock]
+    model: str = ""
+    usage: FakeUsage = field(default_factory=FakeUsage)
+    stop_reason: str = "end_turn"
+
+
+def request_text(kwargs: Dict) -> str:
+    """Собирает весь текст запроса для оценки входных токенов"""
+    parts = []
+    system = kwargs.get('system')
+    if isinstance(system, str):
+        parts.append(system)
+    elif isinstance(system, list):
+        parts.extend(block.get('text', '') for block in system)
+    for message in kwargs.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get('text', '') for block in content)
+    return "\n".join(parts)
+
+
+def _blocks(kwargs: Dict) -> List[Dict]:
+    """Блоки запроса в порядке префикса: system, затем сообщения"""
+    blocks: List[Dict] = []
+    system = kwargs.get('system')
+    if isinstance(system, str):
+        blocks.append({'type': 'text', 'text': system})
+    elif isinstance(system, list):
+        blocks.extend(system)
+    for message in kwargs.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            blocks.append({'type': 'text', 'text': content})
+        else:
+            blocks.extend(content)
+    return blocks
+
+
+def cache_breakpoints(kwargs: Dict) -> List[str]:
+    """Тексты префиксов запроса, заканчивающихся блоками с cache_control"""
+    prefixes = []
+    text = ""
+    for block in _blocks(kwargs):
+        text += block.get('text', '')
+        if block.get('cache_control'):
+            prefixes.append(text)
+    return prefixes
+
+
+def cacheable_prefix(kwargs: Dict) -> str:
+    """Самый длинный кэшируемый префикс запроса (пустой, если меток нет)"""
+    prefixes = cache_breakpoints(kwargs)
+    return prefixes[-1] if prefixes else ""
+
+
+# Задержка: число секунд или функция от параметров запроса (например, от модели)
+Delay = Union[float, Callable[[Dict], float]]
+
+
+class APITimeoutError(Exception):
+    """Как anthropic.APITimeoutError: ответ не пришёл за `timeout` запроса"""
+
+
+def _wait(delay: float, timeout: Optional[float]) -> None:
+    """Ждёт delay секунд или падает по таймауту запроса, как SDK"""
+    if timeout is not None and delay > timeout:
+        time.sleep(timeout)
+        raise APITimeoutError("Request timed out.")
+    time.sleep(delay)
+
+
+class FakeStream:
+    """Контекстный менеджер, эмулирующий MessageStream SDK"""
+
+    def __init__(
+        self,
+        message: FakeMessage,
+        chunk_size: int,
+        first_token_delay: float,
+        delta_delay: float,
+        timeout: Optional[float] = None
+    ):
+        self._message = message
+        self._chunk_size = chunk_size
+        self._first_token_delay = first_token_delay
+        self._delta_delay = delta_delay
+        self._timeout = timeout
+
+    def __enter__(self) -> 'FakeStream':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        text = self._message.content[0].text
+        _wait(self._first_token_delay, self._timeout)
+        for start in range(0, len(text), self._chunk_size):
+            if start:
+                time.sleep(self._delta_delay)
+            yield text[start:start + self._chunk_size]
+
+    def get_final_message(self) -> FakeMessage:
+        return self._message
+
+
+class FakeMessages:
+    """Эмуляция client.messages с записью всех запросов"""
+
+    def __init__(
+        self,
+        responses: Union[str, List[str], Callable[[Dict], str]],
+        latency: Delay,
+        first_token_delay: Delay,
+        delta_delay: float,
+        chunk_size: int,
+        input_tokens: Optional[int],
+        output_tokens: Optional[int],
+        min_cache_tokens: int = 1024
+    ):
+        self._responses = responses
+        self._latency = latency
+        self._first_token_delay = first_token_delay
+        self._delta_delay = delta_delay
+        self._chunk_size = chunk_size
+        self._input_tokens = input_tokens
+        self._output_tokens = output_tokens
+        self._min_cache_tokens = min_cache_tokens
+        self._lock = threading.Lock()
+        self._prompt_cache: set = set()
+        self.calls: List[Dict] = []
+
+    def _cache_usage(self, kwargs: Dict) -> Tuple[int, int]:
+        """(записано, прочитано) токенов кэша промпта, как считает API"""
+        breakpoints = []
+        for prefix in cache_breakpoints(kwargs):
+            tokens = estimate_tokens(prefix)
+            if tokens >= self._min_cache_tokens:
+                key = hashlib.sha256(f"{kwargs.get('model')}\n{prefix}".encode('utf-8')).hexdigest()
+                breakpoints.append((key, tokens))
+        if not breakpoints:
+            return 0, 0
+        with self._lock:
+            read = max((tokens for key, tokens in breakpoints if key in self._prompt_cache), default=0)
+            self._prompt_cache.update(key for key, _ in breakpoints)
+        written = max(tokens for _, tokens in breakpoints) - read
+        return written, read
+
+    @staticmethod
+    def _delay(delay: Delay, kwargs: Dict) -> float:
+        return delay(kwargs) if callable(delay) else delay
+
+    def _respond(self, kwargs: Dict) -> FakeMessage:
+        with self._lock:
+            self.calls.append(kwargs)
+            index = len(self.calls) - 1
+        if callable(self._responses):
+            text = self._responses(kwargs)
+        elif isinstance(self._responses, list):
+            text = self._responses[index % len(self._responses)]
+        else:
+            text = self._responses
+        written, read = self._cache_usage(kwargs)
+        usage = FakeUsage(
+            input_tokens=(
+                self._input_tokens if self._input_tokens is not None
+                else max(0, estimate_tokens(request_text(kwargs)) - written - read)
+            ),
+            output_tokens=self._output_tokens if self._output_tokens is not None else estimate_tokens(text),
+            cache_creation_input_tokens=written,
+            cache_read_input_tokens=read,
+        )
+        return FakeMessage(content=[FakeTextBlock(text)], model=kwargs.get('model', ''), usage=usage)
+
+    def create(self, **kwargs) -> FakeMessage:
+        message = self._respond(kwargs)
+        _wait(self._delay(self._latency, kwargs), kwargs.get('timeout'))
+        return message
+
+    def stream(self, **kwargs) -> FakeStream:
+        return FakeStream(
+            self._respond(kwargs), self._chunk_size, self._delay(self._first_token_delay, kwargs), self._delta_delay,
+            timeout=kwargs.get('timeout')
+        )
+
+
+class FakeAnthropic:
+    """Заменитель `anthropic.Anthropic` с настраиваемыми ответами и задержками"""
+
+    def __init__(
+        self,
+        responses: Union[str, List[str], Callable[[Dict], str]] = DEFAULT_RESPONSE,
+        latency: Delay = 0.0,
+        first_token_delay: Delay = 0.0,
+        delta_delay: float = 0.0,
+        chunk_size: int = 40,
+        input_tokens: Optional[int] = None,
+        output_tokens: Optional[int] = None,
+        min_cache_tokens: int = 1024
+    ):
+        self.messages = FakeMessages(
+            responses=responses,
+            latency=latency,
+            first_token_delay=first_token_delay,
+            delta_delay=delta_delay,
+            chunk_size=chunk_size,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            min_cache_tokens=min_cache_tokens,
+        )
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Минификация входных данных промпта
+Убирает малоценные для review токены: лишние строки контекста в hunk'ах diff,
+блоки import и лицензионные заголовки в выдержках файлов, строки выдержек,
+уже показанные в diff, и лишние пробелы. Номера строк сохраняются: hunk'и
+получают пересчитанные заголовки @@, выдержки — явные номера строк
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from context_collector import GAP_MARKER
+from diff_parser import FILE_BANNER_RE, FileDiff, Hunk, render_diff, split_file_sections
+from prompt_packer import estimate_tokens
+
+
+HUNK_SUFFIX_RE = re.compile(r'^@@ [^@]* @@(.*)$')
+EXCERPT_LINE_RE = re.compile(r'^ *(\d+) \| ?(.*)$')
+IMPORT_RE = re.compile(r'^\s*import\s+([\w.`*]+)(\s+as\s+\w+)?\s*;?\s*$')
+LICENSE_RE = re.compile(r'copyright|licen[cs]e|spdx', re.IGNORECASE)
+DIFF_MARKER = "(см. diff)"
+# Лицензионный заголовок ищется только в начале файла
+LICENSE_MAX_START = 5
+
+
+@dataclass
+class MinifyOptions:
+    """Настройки минификации из секции `minify:` конфига"""
+
+    context_lines: Optional[int] = 2
+    collapse_imports: bool = True
+    min_import_lines: int = 3
+    strip_license_headers: bool = True
+    dedupe_file_contents: bool = True
+    normalize_whitespace: bool = True
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'MinifyOptions':
+        return cls(**{name: config[name] for name in cls.__dataclass_fields__ if name in config})
+
+
+@dataclass
+class MinifyResult:
+    """Минифицированные входные данные и оценка сэкономленных токенов"""
+
+    files: List[FileDiff]
+    file_contents: str
+    tokens_before: Dict[str, int]
+    tokens_after: Dict[str, int]
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def saved_tokens(self) -> int:
+        return sum(self.tokens_before.values()) - sum(self.tokens_after.values())
+
+    def summary(self) -> Dict:
+        return {
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after,
+            'saved_tokens': self.saved_tokens,
+            **self.stats,
+        }
+
+    def report(self) -> str:
+        before = sum(self.tokens_before.values())
+        percent = self.saved_tokens / before * 100 if before else 0.0
+        return (
+            f"diff {self.tokens_before['diff']} → {self.tokens_after['diff']}, "
+            f"файлы {self.tokens_before['files']} → {self.tokens_after['files']} токенов "
+            f"(−{self.saved_tokens}, {percent:.0f}%)"
+        )
+
+
+# ----------------------------------------------------------------------
+# Diff: контекст hunk'ов
+# ----------------------------------------------------------------------
+
+def _hunk_header(old_start: int, old_count: int, new_start: int, new_count: int, suffix: str) -> str:
+    return f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{suffix}"
+
+
+def trim_hunk(hunk: Hunk, context_lines: int, stats: Dict[str, int]) -> List[Hunk]:
+    """Оставляет не больше context_lines строк контекста вокруг изменений.
+
+    Если между изменениями остаётся разрыв, hunk делится на несколько
+    с пересчитанными заголовками @@ — номера строк остаются верными.
+    """
+    changes = [index for index, line in enumerate(hunk.lines) if line[:1] in ('+', '-')]
+    if not changes:
+        return [hunk]
+    keep = [False] * len(hunk.lines)
+    for index in changes:
+        for near in range(max(0, index - context_lines), min(len(hunk.lines), index + context_lines + 1)):
+            keep[near] = True
+    for index, line in enumerate(hunk.lines):
+        # «\ No newline at end of file» относится к предыдущей строке
+        if line.startswith('\\') and index and keep[index - 1]:
+            keep[index] = True
+    dropped = keep.count(False)
+    if not dropped:
+        return [hunk]
+    stats['diff_context_lines'] = stats.get('diff_context_lines', 0) + dropped
+
+    match = HUNK_SUFFIX_RE.match(hunk.header)
+    suffix = match.group(1) if match else ""
+    result: List[Hunk] = []
+    old_line, new_line = hunk.old_start, hunk.new_start
+    current: Optional[List[str]] = None
+    start = (0, 0)
+    for index, line in enumerate(hunk.lines):
+        if keep[index]:
+            if current is None:
+                current, start = [], (old_line, new_line)
+            current.append(line)
+        elif current is not None:
+            result.append(_make_hunk(current, start, suffix))
+            current = None
+        if line[:1] in (' ', '-', ''):
+            old_line += 1
+        if line[:1] in (' ', '+', ''):
+            new_line += 1
+    if current is not None:
+        result.append(_make_hunk(current, start, suffix))
+    return result
+
+
+def _make_hunk(lines: List[str], start: Tuple[int, int], suffix: str) -> Hunk:
+    old_count = sum(1 for line in lines if line[:1] in (' ', '-', ''))
+    new_count = sum(1 for line in lines if line[:1] in (' ', '+', ''))
+    # Как в git: у пустой стороны hunk'а номер — строка перед ним
+    old_start = start[0] if old_count else start[0] - 1
+    new_start = start[1] if new_count else start[1] - 1
+    return Hunk(
+        header=_hunk_header(old_start, old_count, new_start, new_count, suffix),
+        old_start=old_start,
+        old_count=old_count,
+        new_start=new_start,
+        new_count=new_count,
+        lines=lines,
+    )
+
+
+def _normalize_context(line: str) -> str:
+    """Строка контекста без хвостовых пробелов (добавленные и удалённые не трогаем)"""
+    if line.startswith(' '):
+        return ' ' + line[1:].rstrip()
+    return line
+
+
+def minify_diff(files: List[FileDiff], options: MinifyOptions, stats: Dict[str, int]) -> List[FileDiff]:
+    """Копии FileDiff с сокращённым контекстом hunk'ов"""
+    result = []
+    for file_diff in files:
+        hunks: List[Hunk] = []
+        for hunk in file_diff.hunks:
+            if options.normalize_whitespace:
+                hunk = Hunk(
+                    header=hunk.header, old_start=hunk.old_start, old_count=hunk.old_count,
+                    new_start=hunk.new_start, new_count=hunk.new_count,
+                    lines=[_normalize_context(line) for line in hunk.lines],
+                )
+            if options.context_lines is not None and options.context_lines >= 0:
+                hunks.extend(trim_hunk(hunk, options.context_lines, stats))
+            else:
+                hunks.append(hunk)
+        result.append(FileDiff(
+            path=file_diff.path,
+            old_path=file_diff.old_path,
+            change_type=file_diff.change_type,
+            header_lines=file_diff.header_lines,
+            hunks=hunks,
+        ))
+    return result
+
+
+def new_lines_in_diff(file_diff: FileDiff) -> Set[int]:
+    """Номера строк нового файла, которые уже видны в diff (контекст и добавленные)"""
+    covered: Set[int] = set()
+    for hunk in file_diff.hunks:
+        line_number = hunk.new_start
+        for line in hunk.lines:
+            if line[:1] in (' ', '+', ''):
+                covered.add(line_number)
+                line_number += 1
+    return covered
+
+
+# ----------------------------------------------------------------------
+# Выдержки файлов
+# ----------------------------------------------------------------------
+
+@dataclass
+class ExcerptLine:
+    """Строка выдержки: номер в файле и текст; number=None — маркер пропуска"""
+
+    number: Optional[int]
+    text: str
+    hidden: bool = False  # пропущена без маркера (пустая строка)
+    last: Optional[int] = None  # маркер вместо строк number..last
+
+
+def parse_excerpt(body: List[str]) -> Tuple[List[ExcerptLine], bool]:
+    """Строки выдержки и признак явной нумерации (`  12 | код`, как в context_collector)"""
+    numbered = [EXCERPT_LINE_RE.match(line) for line in body]
+    if body and all(match or line.strip() == GAP_MARKER.strip() for match, line in zip(numbered, body)):
+        return [
+            ExcerptLine(int(match.group(1)), match.group(2)) if match else ExcerptLine(None, GAP_MARKER)
+            for match, line in zip(numbered, body)
+        ], True
+    return [ExcerptLine(number, line) for number, line in enumerate(body, start=1)], False
+
+
+def _replace_run(lines: List[ExcerptLine], start: int, end: int, marker: str) -> List[ExcerptLine]:
+    """Заменяет строки [start, end) одним маркером"""
+    first, last = lines[start].number, lines[end - 1].number
+    return lines[:start] + [ExcerptLine(first, marker, last=last)] + lines[end:]
+
+
+def _is_code(line: ExcerptLine) -> bool:
+    return line.number is not None and line.last is None and not line.hidden
+
+
+def collapse_imports(lines: List[ExcerptLine], min_lines: int, stats: Dict[str, int]) -> List[ExcerptLine]:
+    """Сворачивает подряд идущие import в одну строку: пакет.{имена}"""
+    index = 0
+    while index < len(lines):
+        if not (_is_code(lines[index]) and IMPORT_RE.match(lines[index].text)):
+            index += 1
+            continue
+        end = index
+        imports: List[Tuple[str, str]] = []
+        while end < len(lines) and _is_code(lines[end]) and (IMPORT_RE.match(lines[end].text) or not lines[end].text.strip()):
+            match = IMPORT_RE.match(lines[end].text)
+            if match:
+                imports.append((match.group(1), ' '.join((match.group(2) or '').split())))
+            end += 1
+        while end > index and not lines[end - 1].text.strip():
+            end -= 1
+        if len(imports) < min_lines:
+            index = end
+            continue
+        packages: Dict[str, List[str]] = {}
+        for name, alias in imports:
+            package, _, short = name.rpartition('.')
+            packages.setdefault(package, []).append(f"{short} {alias}" if alias else short)
+        summary = ", ".join(
+            f"{package}.{names[0]}" if len(names) == 1 else f"{package}.{{{', '.join(names)}}}"
+            for package, names in packages.items()
+        )
+        stats['import_lines'] = stats.get('import_lines', 0) + end - index
+        lines = _replace_run(lines, index, end, f"import {summary}")
+        index += 1
+    return lines
+
+
+def strip_license_header(lines: List[ExcerptLine], stats: Dict[str, int]) -> List[ExcerptLine]:
+    """Убирает комментарий с лицензией в начале файла"""
+    start = next((index for index, line in enumerate(lines) if _is_code(line) and line.text.strip()), None)
+    if start is None or lines[start].number > LICENSE_MAX_START:
+        return lines
+    first = lines[start].text.strip()
+    end = start
+    # Окно выдержки могло начаться с середины комментария
+    if first.startswith(('/*', '*')):
+        while end < len(lines) and _is_code(lines[end]) and '*/' not in lines[end].text:
+            end += 1
+        end += 1
+    elif first.startswith('//'):
+        while end < len(lines) and _is_code(lines[end]) and lines[end].text.strip().startswith('//'):
+            end += 1
+    end = min(end, len(lines))
+    if end == start or not any(LICENSE_RE.search(line.text) for line in lines[start:end]):
+        return lines
+    stats['license_lines'] = stats.get('license_lines', 0) + end - start
+    return _replace_run(lines, start, end, "/* лицензионный заголовок */")
+
+
+def drop_lines_in_diff(lines: List[ExcerptLine], covered: Set[int], stats: Dict[str, int]) -> List[ExcerptLine]:
+    """Заменяет строки, уже показанные в diff, маркером с диапазоном"""
+    index = 0
+    while index < len(lines):
+        if not (_is_code(lines[index]) and lines[index].number in covered):
+            index += 1
+            continue
+        end = index
+        while end < len(lines) and _is_code(lines[end]) and lines[end].number in covered:
+            end += 1
+        stats['duplicate_lines'] = stats.get('duplicate_lines', 0) + end - index
+        lines = _replace_run(lines, index, end, DIFF_MARKER)
+        index += 1
+    return lines
+
+
+def normalize_whitespace(lines: List[ExcerptLine], stats: Dict[str, int]) -> List[ExcerptLine]:
+    """Убирает хвостовые пробелы и повторные пустые строки"""
+    previous_blank = False
+    for line in lines:
+        if not _is_code(line):
+            previous_blank = False
+            continue
+        stripped = line.text.rstrip()
+        if stripped != line.text:
+            line.text = stripped
+            stats['trailing_whitespace'] = stats.get('trailing_whitespace', 0) + 1
+        blank = not line.text
+        if blank and previous_blank:
+            line.hidden = True
+            stats['blank_lines'] = stats.get('blank_lines', 0) + 1
+        previous_blank = blank
+    return lines
+
+
+def render_excerpt_lines(banner: str, lines: List[ExcerptLine]) -> str:
+    """Выдержка с явными номерами строк; разрывы нумерации отмечаются ⋮"""
+    numbers = [line.last or line.number for line in lines if line.number is not None]
+    width = len(str(max(numbers))) if numbers else 1
+    output = [banner]
+    previous: Optional[int] = None
+    for line in lines:
+        if line.number is None:
+            if output and output[-1] != GAP_MARKER:
+                output.append(GAP_MARKER)
+            previous = None
+            continue
+        if line.hidden:
+            previous = line.number
+            continue
+        if previous is not None and line.number != previous + 1 and output[-1] != GAP_MARKER:
+            output.append(GAP_MARKER)
+        if line.last is not None:
+            span = f"{line.number}–{line.last}" if line.last != line.number else str(line.number)
+            output.append(f"{span:>{width}} ⋮ {line.text}")
+        else:
+            output.append(f"{line.number:>{width}} | {line.text}")
+        previous = line.last or line.number
+    return "\n".join(output) + "\n"
+
+
+def minify_section(text: str, covered: Optional[Set[int]], options: MinifyOptions, stats: Dict[str, int]) -> str:
+    """Минифицирует выдержку одного файла; без изменений возвращает исходный текст"""
+    body = text.rstrip('\n').split('\n')
+    if not body or not FILE_BANNER_RE.match(body[0]):
+        return text  # Выгрузка без баннера: номера строк неизвестны
+    banner, body = body[0], body[1:]
+    lines, numbered = parse_excerpt(body)
+    # Счётчики секции попадают в общие, только если минифицированный текст используется
+    section_stats: Dict[str, int] = {}
+
+    if options.strip_license_headers:
+        lines = strip_license_header(lines, section_stats)
+    if options.collapse_imports:
+        lines = collapse_imports(lines, options.min_import_lines, section_stats)
+    if options.dedupe_file_contents and covered:
+        lines = drop_lines_in_diff(lines, covered, section_stats)
+    if options.normalize_whitespace:
+        lines = normalize_whitespace(lines, section_stats)
+
+    if not section_stats:
+        return text
+    if not any(_is_code(line) and line.text.strip() or line.last is not None and line.text != DIFF_MARKER for line in lines):
+        minified = ""  # Всё уже есть в diff — не нужен и баннер
+    elif not numbered and all(_is_code(line) for line in lines):
+        # Строки не пропадали: номера по-прежнему считаются от начала файла
+        minified = "\n".join([banner] + [line.text for line in lines]) + "\n"
+    else:
+        minified = render_excerpt_lines(banner, lines)
+        if not numbered and estimate_tokens(minified) >= estimate_tokens(text):
+            # Нумерация строк обошлась бы дороже сэкономленного
+            return text
+    for name, count in section_stats.items():
+        stats[name] = stats.get(name, 0) + count
+    return minified
+
+
+def minify_inputs(files: List[FileDiff], file_contents: str, options: MinifyOptions) -> MinifyResult:
+    """Минифицирует diff и выдержки файлов перед упаковкой промпта"""
+    stats: Dict[str, int] = {}
+    tokens_before = {'diff': estimate_tokens(render_diff(files)), 'files': estimate_tokens(file_contents)}
+    minified_files = minify_diff(files, options, stats)
+    by_path = {file_diff.path: file_diff for file_diff in minified_files if file_diff.change_type != 'deleted'}
+
+    sections = []
+    for path, text in split_file_sections(file_contents).items():
+        covered = new_lines_in_diff(by_path[path]) if path in by_path else None
+        section = minify_section(text, covered, options, stats)
+        if section:
+            sections.append(section)
+    minified_contents = "\n".join(sections)
+    return MinifyResult(
+        files=minified_files,
+        file_contents=minified_contents,
+        tokens_before=tokens_before,
+        tokens_after={'diff': estimate_tokens(render_diff(minified_files)), 'files': estimate_tokens(minified_contents)},
+        stats=stats,
+    )
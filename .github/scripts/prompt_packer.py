@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Упаковщик промпта по бюджету токенов
+Распределяет входной бюджет модели между разделами промпта по приоритетам,
+не разрезая hunk'и, и сообщает, что не поместилось
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from diff_parser import FileDiff
+
+
+# Порядок разделов по приоритету: сначала то, без чего review бессмыслен
+SECTION_PR_INFO = 'pr_info'
+SECTION_DIFF = 'diff'
+SECTION_SYMBOLS = 'symbols'
+SECTION_CONTEXT = 'project_context'
+SECTION_FILES = 'file_contents'
+SECTION_PRIORITY = {
+    SECTION_PR_INFO: 0,
+    SECTION_DIFF: 1,
+    SECTION_SYMBOLS: 2,
+    SECTION_CONTEXT: 3,
+    SECTION_FILES: 4,
+}
+
+# Средняя длина токена: латиница и код ~3.5 символа, кириллица ~2
+ASCII_CHARS_PER_TOKEN = 3.5
+NON_ASCII_CHARS_PER_TOKEN = 2.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Быстрая локальная оценка числа токенов без токенизатора"""
+    if not text:
+        return 0
+    # Для кириллицы UTF-8 даёт 2 байта на символ: разница длин ≈ число не-ASCII символов
+    non_ascii = len(text.encode('utf-8')) - len(text)
+    ascii_chars = max(0, len(text) - non_ascii)
+    return int(ascii_chars / ASCII_CHARS_PER_TOKEN + non_ascii / NON_ASCII_CHARS_PER_TOKEN) + 1
+
+
+@dataclass
+class PackItem:
+    """Неделимая единица промпта: hunk, раздел документации, файл"""
+
+    section: str
+    label: str
+    text: str
+    order: int = 0
+    required: bool = False
+    truncatable: bool = False
+    group: Optional[str] = None
+    group_header: str = ""
+    tokens: int = -1
+
+    def __post_init__(self):
+        if self.tokens < 0:
+            self.tokens = estimate_tokens(self.text)
+
+
+@dataclass
+class PackResult:
+    """Результат упаковки: что вошло в промпт и что было отброшено"""
+
+    budget: int
+    used_tokens: int = 0
+    included: List[PackItem] = field(default_factory=list)
+    dropped: List[PackItem] = field(default_factory=list)
+    truncated: List[PackItem] = field(default_factory=list)
+
+    def render(self, section: str, separator: str = "\n") -> str:
+        """Собирает текст раздела в исходном порядке элементов"""
+        items = sorted(
+            (item for item in self.included if item.section == section),
+            key=lambda item: item.order
+        )
+        parts = []
+        seen_groups = set()
+        for item in items:
+            if item.group is not None and item.group not in seen_groups:
+                seen_groups.add(item.group)
+                if item.group_header:
+                    parts.append(item.group_header)
+            parts.append(item.text)
+        return separator.join(parts)
+
+    def report(self, max_lines: int = 30) -> str:
+        """Краткий отчёт о том, что не поместилось в бюджет.
+
+        Отброшенные hunk'и группируются по файлам.
+        """
+        if not self.dropped and not self.truncated:
+            return ""
+        lines = [f"Бюджет: {self.used_tokens}/{self.budget} токенов (оценка)"]
+        for item in self.truncated:
+            lines.append(f"- ✂️ {item.section}: {item.label} (обрезан)")
+
+        grouped: Dict[tuple, List[PackItem]] = {}
+        for item in self.dropped:
+            grouped.setdefault((item.section, item.group or item.label), []).append(item)
+        entries = []
+        for (section, name), items in grouped.items():
+            tokens = sum(item.tokens for item in items)
+            if len(items) > 1:
+                entries.append(f"- ➖ {section}: {name} — {len(items)} шт. (~{tokens} токенов)")
+            else:
+                entries.append(f"- ➖ {section}: {items[0].label} (~{tokens} токенов)")
+
+        lines.extend(entries[:max_lines])
+        if len(entries) > max_lines:
+            lines.append(f"- … и ещё {len(entries) - max_lines}")
+        return "\n".join(lines)
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    """Обрезает текст по границе строки так, чтобы он уложился в tokens"""
+    if tokens <= 0:
+        return ""
+    ratio = tokens / max(1, estimate_tokens(text))
+    cut = text[:int(len(text) * ratio)]
+    newline = cut.rfind("\n")
+    if newline > 0:
+        cut = cut[:newline]
+    while cut and estimate_tokens(cut) > tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    return cut
+
+
+def pack(
+    items: List[PackItem],
+    budget: int,
+    reserves: Optional[Dict[str, int]] = None
+) -> PackResult:
+    """Упаковывает элементы в бюджет токенов.
+
+    Обязательные элементы входят всегда. Затем каждый раздел из reserves
+    получает гарантированную долю бюджета, а оставшееся место заполняется
+    по приоритету разделов и порядку элементов внутри раздела. Элемент
+    либо входит целиком, либо (если truncatable) обрезается по строкам.
+    """
+    result = PackResult(budget=budget)
+    groups_included = set()
+    taken = set()
+
+    def cost(item: PackItem) -> int:
+        if item.group is not None and item.group not in groups_included:
+            return item.tokens + estimate_tokens(item.group_header)
+        return item.tokens
+
+    def take(item: PackItem) -> None:
+        result.used_tokens += cost(item)
+        if item.group is not None:
+            groups_included.add(item.group)
+        result.included.append(item)
+        taken.add(id(item))
+
+    ordered = sorted(items, key=lambda item: (SECTION_PRIORITY.get(item.section, 99), item.order))
+
+    for item in ordered:
+        if item.required:
+            take(item)
+
+    for section, reserve in (reserves or {}).items():
+        section_used = 0
+        for item in ordered:
+            if item.section != section or id(item) in taken:
+                continue
+            item_cost = cost(item)
+            if section_used + item_cost > reserve or result.used_tokens + item_cost > budget:
+                continue
+            take(item)
+            section_used += item_cost
+
+    for item in ordered:
+        if id(item) in taken:
+            continue
+        item_cost = cost(item)
+        remaining = budget - result.used_tokens
+        if item_cost <= remaining:
+            take(item)
+        elif item.truncatable and remaining > item_cost - item.tokens + 50:
+            text = _truncate_to_tokens(item.text, remaining - (item_cost - item.tokens))
+            if text:
+                short = PackItem(
+                    section=item.section,
+                    label=item.label,
+                    text=text,
+                    order=item.order,
+                    group=item.group,
+                    group_header=item.group_header,
+                )
+                take(short)
+                result.truncated.append(short)
+            else:
+                result.dropped.append(item)
+        else:
+            result.dropped.append(item)
+
+    return result
+
+
+def diff_items(files: List[FileDiff], start_order: int = 0) -> List[PackItem]:
+    """Превращает разобранный diff в элементы упаковки: один hunk — один элемент"""
+    items = []
+    order = start_order
+    for file_diff in files:
+        for hunk in file_diff.hunks:
+            items.append(PackItem(
+                section=SECTION_DIFF,
+                label=f"{file_diff.path} {hunk.header.split(' @@')[0]} @@",
+                text=hunk.text,
+                order=order,
+                group=file_diff.path,
+                group_header=file_diff.header,
+            ))
+            order += 1
+        if not file_diff.hunks:
+            # Бинарные файлы, переименования без изменений и т.п.
+            items.append(PackItem(
+                section=SECTION_DIFF,
+                label=file_diff.path,
+                text=file_diff.header,
+                order=order,
+            ))
+            order += 1
+    return items
+
+
+def context_items(project_context: str) -> List[PackItem]:
+    """Разделы контекста проекта (в порядке релевантности) как элементы упаковки"""
+    blocks = [block for block in project_context.split("\n\n### ") if block.strip()]
+    items = []
+    for index, block in enumerate(blocks):
+        text = block if index == 0 else f"### {block}"
+        label = text.splitlines()[0].lstrip('# ').strip()
+        items.append(PackItem(section=SECTION_CONTEXT, label=label, text=text, order=index))
+    return items
+
+
+def file_items(file_sections: Dict[str, str]) -> List[PackItem]:
+    """Содержимое изменённых файлов как элементы упаковки (можно обрезать)"""
+    return [
+        PackItem(section=SECTION_FILES, label=path, text=text, order=index, truncatable=True)
+        for index, (path, text) in enumerate(file_sections.items())
+    ]
+
+
+def symbol_items(symbols: List[Tuple[str, str]]) -> List[PackItem]:
+    """Объявления символов из diff (по убыванию значимости) как элементы упаковки"""
+    return [
+        PackItem(section=SECTION_SYMBOLS, label=name, text=text, order=index)
+        for index, (name, text) in enumerate(symbols)
+    ]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Ограничение частоты запросов к Claude API
+Token bucket для запросов/мин и токенов/мин и повторы с экспоненциальной
+задержкой и джиттером для 429/5xx
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+
+T = TypeVar('T')
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# Ошибки соединения SDK не имеют status_code, распознаём их по имени класса
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'ConnectionError', 'TimeoutError'}
+TIMEOUT_ERROR_NAMES = {'APITimeoutError', 'TimeoutError', 'DeadlineExceeded'}
+
+
+class TokenBucket:
+    """Классический token bucket: ёмкость = лимит в минуту, равномерное пополнение"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float) -> float:
+        """Списывает amount и возвращает 0, либо возвращает время ожидания в секундах"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Совместный лимит запросов/мин и входных токенов/мин для всех потоков"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['RateLimiter']:
+        """Создаёт лимитер по секции `rate_limits:` конфига"""
+        rpm = config.get('requests_per_minute')
+        tpm = config.get('tokens_per_minute')
+        if not rpm and not tpm:
+            return None
+        return cls(requests_per_minute=rpm, tokens_per_minute=tpm)
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Блокирует поток, пока оба лимита не позволят отправить запрос"""
+        while True:
+            wait = self.requests.try_acquire(1) if self.requests else 0.0
+            if wait == 0.0 and self.tokens and tokens:
+                wait = self.tokens.try_acquire(tokens)
+                if wait > 0 and self.requests:
+                    self.requests.refund(1)
+            if wait == 0.0:
+                return
+            with self._lock:
+                self.waited_seconds += wait
+            time.sleep(wait + random.uniform(0, 0.05))
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Достаёт задержку из заголовка retry-after ответа API, если он есть"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """429, 5xx и ошибки соединения имеет смысл повторить"""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def is_timeout(error: Exception) -> bool:
+    """Таймаут запроса: при дедлайне его не повторяют, а упрощают запрос"""
+    return isinstance(error, TimeoutError) or type(error).__name__ in TIMEOUT_ERROR_NAMES
+
+
+def is_retryable_except_timeout(error: Exception) -> bool:
+    """Как is_retryable, но без таймаутов"""
+    return is_retryable(error) and not is_timeout(error)
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def call_with_retries(
+    func: Callable[[], T],
+    max_retries: int = 4,
+    base_delay: float = 2.0,
+    max_delay: float = 60.0,
+    on_retry: Optional[Callable[[int, Exception, float], None]] = None,
+    retryable: Callable[[Exception], bool] = is_retryable,
+    deadline: Optional[float] = None
+) -> T:
+    """Вызывает func, повторяя при временных ошибках API.
+
+    deadline — момент time.monotonic(), после которого повтор не начинается.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not retryable(e):
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(attempt, base_delay, max_delay)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            if on_retry is not None:
+                on_retry(attempt + 1, e, delay)
+            time.sleep(delay)
+            attempt += 1
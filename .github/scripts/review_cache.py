@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Кэш ответов Claude для AI Code Review
+Content-addressed хранилище на диске с TTL и LRU-вытеснением по размеру
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class ReviewCache:
+    """Кэш ответов модели, ключ — хэш от модели, версии промпта и содержимого.
+
+    Каждая запись — отдельный JSON файл `<dir>/<ab>/<key>.json`, поэтому
+    директорию можно целиком сохранять и восстанавливать через actions/cache.
+    Время последнего обращения хранится в mtime файла и используется для LRU.
+    """
+
+    def __init__(self, directory: Path, ttl_hours: float = 24, max_size_mb: float = 50):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Строит ключ кэша из частей запроса"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает сохранённый ответ или None, если записи нет или она устарела"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        if time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+            self._remove(path)
+            self._count(hit=False)
+            return None
+
+        try:
+            os.utime(path)  # Отмечаем обращение для LRU
+        except OSError:
+            pass
+        self._count(hit=True)
+        return entry.get('text')
+
+    def put(self, key: str, text: str, meta: Optional[Dict] = None) -> None:
+        """Сохраняет ответ модели атомарной записью"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {'created_at': time.time(), 'text': text, 'meta': meta or {}}
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> int:
+        """Удаляет устаревшие записи и самые давно использованные сверх лимита размера"""
+        if not self.directory.exists():
+            return 0
+
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.directory.glob('*/*.json'):
+            try:
+                stat = path.stat()
+                with open(path, 'r', encoding='utf-8') as f:
+                    created_at = json.load(f).get('created_at', 0)
+            except (OSError, ValueError):
+                self._remove(path)
+                removed += 1
+                continue
+            if now - created_at > self.ttl_seconds:
+                self._remove(path)
+                removed += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            self._remove(path)
+            total_size -= size
+            removed += 1
+
+        return removed
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Тонкий клиент сервера AI Code Review
+Принимает те же аргументы, что и ai_code_review.py, и передаёт задачу серверу
+(`ai_code_review.py --serve`) через Unix-сокет. Импортирует только stdlib,
+поэтому запускается мгновенно; если сервер не запущен — выполняет review сам
+"""
+
+import os
+import sys
+import json
+import socket
+from pathlib import Path
+from typing import List, Optional
+
+
+DEFAULT_SOCKET = '/tmp/ai-code-review.sock'
+DEFAULT_CONFIG = '.github/ai-review-config.yml'  # Как в ai_code_review.py
+PATH_ARGS = {
+    '--diff-file', '--files-file', '--pr-info-file', '--docs-dir', '--output-file',
+    '--config', '--cache-dir', '--metrics-file', '--metrics-history',
+}
+JOB_STARTED_ENV = 'REVIEW_JOB_STARTED'  # Как в ai_code_review.py
+# Кассеты подменяют клиент API, поэтому такие задачи выполняются без сервера
+LOCAL_ARGS = {'--record', '--replay'}
+SCRIPT = Path(__file__).resolve().parent / 'ai_code_review.py'
+
+
+def socket_path(value: Optional[str] = None) -> str:
+    """Путь к сокету: аргумент, $AI_REVIEW_SOCKET или значение по умолчанию"""
+    return value or os.environ.get('AI_REVIEW_SOCKET') or DEFAULT_SOCKET
+
+
+def absolutize(argv: List[str]) -> List[str]:
+    """Делает пути абсолютными: у сервера своя рабочая директория"""
+    result = []
+    expect_path = False
+    for arg in argv:
+        if expect_path:
+            result.append(os.path.abspath(arg))
+            expect_path = False
+        elif arg in PATH_ARGS:
+            result.append(arg)
+            expect_path = True
+        elif '=' in arg and arg.split('=', 1)[0] in PATH_ARGS:
+            name, value = arg.split('=', 1)
+            result.append(f"{name}={os.path.abspath(value)}")
+        else:
+            result.append(arg)
+    if not any(arg == '--config' or arg.startswith('--config=') for arg in argv):
+        result += ['--config', os.path.abspath(DEFAULT_CONFIG)]
+    return result
+
+
+def split_client_args(argv: List[str]):
+    """Отделяет аргументы клиента (--socket, --no-fallback) от аргументов review"""
+    review_args = []
+    path = None
+    fallback = True
+    args = iter(argv)
+    for arg in args:
+        if arg == '--socket':
+            path = next(args, None)
+        elif arg.startswith('--socket='):
+            path = arg.split('=', 1)[1]
+        elif arg == '--no-fallback':
+            fallback = False
+        else:
+            review_args.append(arg)
+    return review_args, socket_path(path), fallback
+
+
+def with_job_started(argv: List[str]) -> List[str]:
+    """Добавляет --job-started из окружения клиента: у сервера окружение чужой job"""
+    if any(arg.split('=', 1)[0] == '--job-started' for arg in argv) or not os.environ.get(JOB_STARTED_ENV):
+        return argv
+    return argv + ['--job-started', os.environ[JOB_STARTED_ENV]]
+
+
+def run_remote(path: str, argv: List[str]) -> int:
+    """Отправляет задачу серверу и печатает его вывод по мере поступления"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(path)
+        # cwd — для путей, которые клиент не распознал (сокращённые флаги, пути из конфига)
+        request = {'argv': absolutize(argv), 'cwd': os.getcwd()}
+        conn.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        with conn.makefile('r', encoding='utf-8') as stream:
+            for line in stream:
+                event = json.loads(line)
+                if event['event'] == 'output':
+                    sys.stdout.write(event['text'])
+                    sys.stdout.flush()
+                elif event['event'] == 'exit':
+                    return event['code']
+    print("❌ Сервер review закрыл соединение, не завершив задачу")
+    return 1
+
+
+def run_local(argv: List[str]) -> None:
+    """Выполняет review в этом процессе вместо сервера"""
+    os.execv(sys.executable, [sys.executable, str(SCRIPT), *argv])
+
+
+def main():
+    argv, path, fallback = split_client_args(sys.argv[1:])
+    argv = with_job_started(argv)
+    if any(arg.split('=', 1)[0] in LOCAL_ARGS for arg in argv):
+        run_local(argv)
+    try:
+        exit_code = run_remote(path, argv)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        if not fallback:
+            print(f"❌ Сервер review недоступен ({path}): {e}")
+            sys.exit(1)
+        # Сервер не запущен — тот же review в этом процессе
+        print(f"⚠️  Сервер review недоступен ({path}), запуск без сервера", file=sys.stderr)
+        run_local(argv)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Метрики AI Code Review
+Время по фазам, токены и стоимость запросов к Claude; JSON рядом с review
+и история запусков в JSONL для p50/p95 по времени и расходу токенов
+"""
+
+import json
+import math
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# Тарифы кэша промптов относительно обычных входных токенов
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Перцентиль методом ближайшего ранга; None для пустого списка"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * p / 100))
+    return ordered[rank - 1]
+
+
+class ReviewMetrics:
+    """Собирает метрики одного запуска; безопасен для вызова из нескольких потоков"""
+
+    def __init__(self, pricing: Optional[Dict[str, Dict[str, float]]] = None):
+        self.pricing = pricing or {}
+        self.started_at = datetime.now(timezone.utc)
+        self.phases: Dict[str, float] = {}
+        self.calls: List[Dict[str, Any]] = []
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """Добавляет время к фазе; замеры одной фазы (в т.ч. из разных потоков) суммируются"""
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Замеряет время блока кода как фазу name"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.monotonic() - started)
+
+    def cost(self, model: str, usage: Dict[str, int]) -> Optional[float]:
+        """Стоимость запроса в USD по секции `metrics.pricing` (цены за 1M токенов)"""
+        price = self.pricing.get(model)
+        if not price:
+            return None
+        input_price = price.get('input', 0.0)
+        total = (
+            usage['input_tokens'] * input_price
+            + usage['cache_creation_input_tokens'] * input_price * CACHE_WRITE_MULTIPLIER
+            + usage['cache_read_input_tokens'] * input_price * CACHE_READ_MULTIPLIER
+            + usage['output_tokens'] * price.get('output', 0.0)
+        )
+        return round(total / 1_000_000, 6)
+
+    def record_call(
+        self,
+        model: str,
+        usage: Any,
+        seconds: float,
+        time_to_first_token: Optional[float] = None,
+        streamed: bool = False
+    ) -> None:
+        """Записывает один успешный запрос к API (usage — `response.usage` SDK)"""
+        tokens = {
+            name: getattr(usage, name, None) or 0
+            for name in ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+        }
+        call = {
+            'model': model,
+            'seconds': round(seconds, 3),
+            'time_to_first_token': round(time_to_first_token, 3) if time_to_first_token is not None else None,
+            'streamed': streamed,
+            **tokens,
+            'cost_usd': self.cost(model, tokens),
+        }
+        if getattr(usage, 'substituted', False):
+            # Воспроизведение кассеты: ответ от другого промпта, входные токены оценены
+            call['substituted'] = True
+        with self._lock:
+            self.calls.append(call)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Итоги по запросам: токены, стоимость, p50/p95 задержки"""
+        with self._lock:
+            calls = list(self.calls)
+        latencies = [call['seconds'] for call in calls]
+        first_tokens = [call['time_to_first_token'] for call in calls if call['time_to_first_token'] is not None]
+        costs = [call['cost_usd'] for call in calls]
+        totals: Dict[str, Any] = {
+            name: sum(call[name] for call in calls)
+            for name in ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+        }
+        totals.update(
+            api_calls=len(calls),
+            substituted_calls=sum(1 for call in calls if call.get('substituted')),
+            retries=self.retries,
+            # Стоимость известна, только если для всех моделей заданы цены
+            cost_usd=round(sum(costs), 6) if None not in costs else None,
+            latency_p50=percentile(latencies, 50),
+            latency_p95=percentile(latencies, 95),
+            time_to_first_token_p50=percentile(first_tokens, 50),
+        )
+        return totals
+
+    def to_dict(self, **extra: Any) -> Dict[str, Any]:
+        """Полный отчёт запуска; extra — дополнительные поля (PR, модель, кэш)"""
+        with self._lock:
+            phases = {name: round(seconds, 3) for name, seconds in self.phases.items()}
+            calls = list(self.calls)
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            **extra,
+            'phases': phases,
+            'totals': self.summary(),
+            'calls': calls,
+        }
+
+    def write(self, path: Path, **extra: Any) -> Dict[str, Any]:
+        """Сохраняет отчёт в JSON и возвращает его"""
+        report = self.to_dict(**extra)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+
+def append_history(path: Path, report: Dict[str, Any]) -> None:
+    """Дописывает отчёт запуска (без списка запросов) строкой в JSONL историю"""
+    entry = {key: value for key, value in report.items() if key != 'calls'}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def summarize_history(path: Path) -> Dict[str, Any]:
+    """p50/p95 длительности запуска и расход токенов по JSONL истории"""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+
+    durations = [entry['total_seconds'] for entry in entries if entry.get('total_seconds') is not None]
+    input_tokens = [entry['totals']['input_tokens'] for entry in entries]
+    output_tokens = [entry['totals']['output_tokens'] for entry in entries]
+    costs = [entry['totals']['cost_usd'] for entry in entries if entry['totals'].get('cost_usd') is not None]
+    return {
+        'runs': len(entries),
+        'seconds_p50': percentile(durations, 50),
+        'seconds_p95': percentile(durations, 95),
+        'input_tokens_p50': percentile(input_tokens, 50),
+        'input_tokens_p95': percentile(input_tokens, 95),
+        'output_tokens_p50': percentile(output_tokens, 50),
+        'output_tokens_p95': percentile(output_tokens, 95),
+        'cost_usd_total': round(sum(costs), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сводка по истории метрик AI Code Review')
+    parser.add_argument('history', help='JSONL файл истории запусков')
+    args = parser.parse_args()
+
+    summary = summarize_history(Path(args.history))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Сервер AI Code Review (`ai_code_review.py --serve`)
+Держит в памяти конфиг, индекс документации и клиент Anthropic с пулом
+соединений и принимает задачи review от review_client.py через Unix-сокет
+"""
+
+import os
+import io
+import sys
+import json
+import socket
+import argparse
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from ai_code_review import CodeReviewAssistant, REQUIRED_ARGS, build_arg_parser, run_review_job
+from review_client import socket_path
+
+
+class SocketWriter(io.TextIOBase):
+    """stdout задачи: каждый фрагмент вывода уходит клиенту отдельным событием"""
+
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self.disconnected = False
+
+    def send(self, event: Dict) -> None:
+        if self.disconnected:
+            return
+        try:
+            self.conn.sendall((json.dumps(event, ensure_ascii=False) + "\n").encode('utf-8'))
+        except OSError:
+            # Клиент ушёл (например, job остановлен) — review всё равно дописывается в файл
+            self.disconnected = True
+
+    def write(self, text: str) -> int:
+        if text:
+            self.send({'event': 'output', 'text': text})
+        return len(text)
+
+    def writable(self) -> bool:
+        return True
+
+
+@contextmanager
+def working_directory(path: Optional[str]) -> Iterator[None]:
+    """Рабочая директория клиента на время задачи (задачи выполняются по очереди)"""
+    if not path:
+        yield
+        return
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class ReviewServer:
+    """Выполняет задачи по очереди; ассистенты кэшируются по (config, cache_dir)"""
+
+    def __init__(self, path: str, api_key: str, client: Optional[Any] = None):
+        self.path = path
+        self.api_key = api_key
+        self.client = client
+        self.assistants: Dict[Tuple[str, str], CodeReviewAssistant] = {}
+
+    def assistant_for(self, args: argparse.Namespace) -> CodeReviewAssistant:
+        key = (os.path.abspath(args.config), os.path.abspath(args.cache_dir) if args.cache_dir else '')
+        if key not in self.assistants:
+            self.assistants[key] = CodeReviewAssistant(
+                api_key=self.api_key,
+                config_path=Path(key[0]),
+                cache_dir=Path(key[1]) if key[1] else None,
+                client=self.client
+            )
+        return self.assistants[key]
+
+    def run(self, argv: list, writer: SocketWriter, cwd: Optional[str] = None) -> int:
+        """Разбирает аргументы задачи и выполняет review, вывод — клиенту.
+
+        Относительные пути аргументов и конфига (кэш, история метрик, repo_dir)
+        считаются от cwd клиента, а не от директории, где запущен сервер.
+        """
+        with redirect_stdout(writer), redirect_stderr(writer), working_directory(cwd):
+            parser = build_arg_parser()
+            try:
+                args = parser.parse_args(argv)
+                missing = [name for name in REQUIRED_ARGS if getattr(args, name) is None]
+                if missing:
+                    parser.error("обязательные аргументы: " + ", ".join(
+                        '--' + name.replace('_', '-') for name in missing
+                    ))
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else 2
+
+            assistant = self.assistant_for(args)
+            assistant.reset_metrics()
+            try:
+                return run_review_job(assistant, args, handle_sigterm=False)
+            except Exception as e:
+                print(f"❌ Ошибка выполнения review: {e}")
+                return 1
+
+    def handle(self, conn: socket.socket) -> None:
+        writer = SocketWriter(conn)
+        with conn.makefile('r', encoding='utf-8') as stream:
+            line = stream.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+        except ValueError:
+            writer.send({'event': 'output', 'text': "❌ Некорректный запрос\n"})
+            writer.send({'event': 'exit', 'code': 2})
+            return
+        try:
+            exit_code = self.run(request.get('argv') or [], writer, cwd=request.get('cwd'))
+        except OSError as e:
+            # cwd клиента недоступен серверу (другой контейнер, удалена директория)
+            writer.send({'event': 'output', 'text': f"❌ Рабочая директория клиента недоступна: {e}\n"})
+            exit_code = 1
+        writer.send({'event': 'exit', 'code': exit_code})
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Сокет, оставшийся от прошлого запуска
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(self.path)
+            os.chmod(self.path, 0o600)
+            server.listen()
+            print(f"🟢 Сервер review слушает {self.path}")
+            try:
+                while True:
+                    conn, _ = server.accept()
+                    with conn:
+                        self.handle(conn)
+            except KeyboardInterrupt:
+                print("\n🛑 Сервер review остановлен")
+            finally:
+                os.unlink(self.path)
+
+
+def serve(args: argparse.Namespace, api_key: str, client: Optional[Any] = None) -> None:
+    """Запускает сервер; --config/--cache-dir/--docs-dir прогревают ассистента заранее"""
+    server = ReviewServer(socket_path(args.socket), api_key, client=client)
+    assistant = server.assistant_for(args)
+    print(f"🔧 Модель: {assistant.model}")
+    if args.docs_dir:
+        index = assistant.load_docs_index(Path(os.path.abspath(args.docs_dir)))
+        if index is not None:
+            print(f"📚 Индекс документации: {len(index.sections)} разделов")
+    symbols = assistant.load_symbol_index()
+    if symbols is not None:
+        print(f"🔗 Индекс символов: {len(symbols.by_name)} имён")
+    sys.stdout.flush()
+    server.serve_forever()
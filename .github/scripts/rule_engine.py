@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Локальные проверки project_specific_rules
+Быстрый проход по разобранному diff до запроса к Claude: импорты между слоями,
+GlobalScope, var в UI state, suspend-вызовы в @Composable и т.д.
+Замечания передаются модели подсказкой; hunk'и, полностью объяснённые замечаниями
+с severity из local_rules.skip_severities (по умолчанию suggestion), можно не отправлять в модель
+"""
+
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from diff_parser import FileDiff, Hunk
+
+
+SEVERITY_TITLES = {
+    'critical': '🔴 Critical',
+    'important': '🟡 Important',
+    'suggestion': '💡 Suggestion',
+}
+SEVERITY_ORDER = ['critical', 'important', 'suggestion']
+# Severity замечаний, с которыми hunk можно не отправлять в модель (local_rules.skip_severities)
+DEFAULT_SKIP_SEVERITIES = ('suggestion',)
+
+FUN_RE = re.compile(r'\bfun\s+(?:<[^>]*>\s*)?(?:[\w.]+\.)?(\w+)\s*\(')
+COMPOSABLE_RE = re.compile(r'@Composable\b')
+EFFECT_RE = re.compile(r'\b(?:LaunchedEffect|DisposableEffect|produceState|SideEffect)\b|\.launch\s*\{|\blaunch\s*\{')
+# first()/single() — только у Flow: у List/Iterable это обычные вызовы
+SUSPEND_CALL_RE = re.compile(
+    r'\bdelay\s*\(|\bwithContext\s*\(|\.emit\s*\(|\.collect\s*[({]|\brunBlocking\b'
+    r'|\b\w*(?:Flow|flow)\s*\.\s*(?:first|single)\s*\(\s*\)'
+)
+STATE_CLASS_RE = re.compile(r'\bdata\s+class\s+\w*(?:State|UiState)\s*\(')
+STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"')
+ANNOTATION_RE = re.compile(r'@[\w.:]+(?:\s*\([^()]*(?:\([^()]*\)[^()]*)*\))?')
+CLASS_LITERAL_RE = re.compile(r'\b[\w.]+::class\b')
+# Источник данных в позиции типа (`: FooApi`) или вызова конструктора (`FooApi(`)
+DATA_SOURCE_RE = re.compile(
+    r'(?<!:):\s*(?:[\w.]+\.)?(?:[A-Z]\w*)?(?:Api|Dao|DataSource|HttpClient)\b'
+    r'|\b(?:[A-Z]\w*)?(?:Api|Dao|DataSource|HttpClient)\s*\('
+)
+
+
+@dataclass
+class Finding:
+    """Замечание локального правила к строке нового файла"""
+
+    rule: str
+    severity: str
+    path: str
+    line: int
+    hunk_index: int
+    category: str
+    problem: str
+    suggestion: str
+
+    def render(self) -> str:
+        return (
+            f"📍 **[{self.path}:{self.line}]** — {self.category} (`{self.rule}`)\n\n"
+            f"**Проблема:** {self.problem}\n\n"
+            f"**Предложение:** {self.suggestion}\n"
+        )
+
+
+@dataclass
+class LineContext:
+    """Состояние прохода по строкам hunk'а в порядке нового файла"""
+
+    depth: int = 0
+    composable_depth: Optional[int] = None
+    effect_depth: Optional[int] = None
+    state_class_depth: Optional[int] = None
+    pending_composable: bool = False
+
+    @property
+    def in_composable(self) -> bool:
+        return self.composable_depth is not None
+
+    @property
+    def in_effect(self) -> bool:
+        return self.effect_depth is not None
+
+    @property
+    def in_state_class(self) -> bool:
+        return self.state_class_depth is not None
+
+
+def _code(line: str) -> str:
+    """Строка без строковых литералов и комментария в конце"""
+    return STRING_RE.sub('""', line).split('//', 1)[0]
+
+
+def _is_presentation(path: str) -> bool:
+    return '/presentation/' in path or '/ui/' in path
+
+
+def _is_view_model(path: str) -> bool:
+    return path.endswith('ViewModel.kt')
+
+
+# Проверки одной добавленной строки: (path, code, context) → (проблема, предложение) или None
+RuleCheck = Callable[[str, str, LineContext], Optional[Tuple[str, str]]]
+
+
+def check_layer_separation(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if _is_presentation(path) and re.match(r'\s*import\s+[\w.]*\.data\.', code):
+        return (
+            "Presentation-слой импортирует класс из Data-слоя.",
+            "Обращайтесь к данным через Use Case / интерфейс репозитория из domain."
+        )
+    return None
+
+
+def check_use_cases_required(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if _is_view_model(path) and re.search(r':\s*\w*Repository(?:Impl)?\b', code):
+        return (
+            "ViewModel зависит от репозитория напрямую.",
+            "Инжектируйте Use Case, который инкапсулирует работу с репозиторием."
+        )
+    return None
+
+
+def check_repository_pattern(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if not ('/domain/' in path or _is_presentation(path)):
+        return None
+    # Аргументы аннотаций и литералы классов (`@OptIn(FooApi::class)`) — не использование
+    code = CLASS_LITERAL_RE.sub('', ANNOTATION_RE.sub('', code))
+    if DATA_SOURCE_RE.search(code):
+        return (
+            "Источник данных используется вне Data-слоя.",
+            "Оберните источник данных в Repository и используйте его интерфейс."
+        )
+    return None
+
+
+def check_immutable_state(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if context.in_state_class and re.search(r'\bvar\s+\w+', code):
+        return (
+            "Свойство UI state объявлено через `var`.",
+            "Используйте `val` и создавайте новое состояние через `copy()`."
+        )
+    return None
+
+
+def check_coroutine_scope(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if re.search(r'\bGlobalScope\b', code):
+        return (
+            "Корутина запускается в `GlobalScope` и переживает экран — утечка и потеря отмены.",
+            "Используйте `viewModelScope` (в ViewModel) или scope жизненного цикла."
+        )
+    if _is_view_model(path) and re.search(r'\bCoroutineScope\s*\(', code):
+        return (
+            "ViewModel создаёт собственный `CoroutineScope`, который никто не отменяет.",
+            "Используйте `viewModelScope`."
+        )
+    return None
+
+
+def check_flow_over_livedata(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if re.search(r'\b(?:Mutable)?LiveData\b', code):
+        return (
+            "Используется LiveData (недоступна в commonMain).",
+            "Используйте `StateFlow` / `SharedFlow`."
+        )
+    return None
+
+
+def check_remember_state(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if context.in_composable and not context.in_effect and re.search(r'\bmutableStateOf\s*\(', code) \
+            and 'remember' not in code:
+        return (
+            "`mutableStateOf` в Composable без `remember` — состояние сбрасывается при каждой рекомпозиции.",
+            "Оберните в `remember { mutableStateOf(...) }` или `rememberSaveable`."
+        )
+    return None
+
+
+def check_avoid_side_effects(path: str, code: str, context: LineContext) -> Optional[Tuple[str, str]]:
+    if context.in_composable and not context.in_effect and SUSPEND_CALL_RE.search(code):
+        return (
+            "Suspend-вызов прямо в теле Composable выполняется при каждой рекомпозиции.",
+            "Перенесите вызов в `LaunchedEffect` или во ViewModel."
+        )
+    return None
+
+
+# Локальные реализации правил из `project_specific_rules` и их категории
+RULE_CHECKS: Dict[str, Tuple[str, RuleCheck]] = {
+    'enforce_layer_separation': ('🏗️ Architecture', check_layer_separation),
+    'use_cases_required': ('🏗️ Architecture', check_use_cases_required),
+    'repository_pattern': ('🏗️ Architecture', check_repository_pattern),
+    'immutable_state': ('💡 Best Practice', check_immutable_state),
+    'coroutine_scope': ('🧵 Concurrency', check_coroutine_scope),
+    'flow_over_livedata': ('💡 Best Practice', check_flow_over_livedata),
+    'remember_state': ('🐛 Bug / Potential Bug', check_remember_state),
+    'avoid_side_effects': ('🐛 Bug / Potential Bug', check_avoid_side_effects),
+}
+
+
+def _enter_line(context: LineContext, code: str, header_composable: bool) -> None:
+    """Обновляет контекст до проверки строки (объявления, начало блоков)"""
+    if COMPOSABLE_RE.search(code):
+        context.pending_composable = True
+    match = FUN_RE.search(code)
+    if match:
+        name = match.group(1)
+        composable = context.pending_composable or name[:1].isupper()
+        context.pending_composable = False
+        if composable and not context.in_composable:
+            context.composable_depth = context.depth
+        elif not composable and context.in_composable and not header_composable \
+                and context.depth <= context.composable_depth:
+            context.composable_depth = None
+    if context.in_composable and not context.in_effect and EFFECT_RE.search(code):
+        context.effect_depth = context.depth
+    if not context.in_state_class and STATE_CLASS_RE.search(code):
+        context.state_class_depth = context.depth
+
+
+def _leave_line(context: LineContext, code: str) -> None:
+    """Обновляет глубину скобок и закрывает завершившиеся блоки"""
+    context.depth += code.count('{') + code.count('(') - code.count('}') - code.count(')')
+    if context.in_effect and context.depth <= context.effect_depth:
+        context.effect_depth = None
+    if context.in_state_class and context.depth <= context.state_class_depth:
+        context.state_class_depth = None
+    if context.in_composable and context.depth < context.composable_depth:
+        context.composable_depth = None
+
+
+def check_hunk(
+    path: str,
+    hunk: Hunk,
+    hunk_index: int,
+    rules: Dict[str, Dict],
+    skip_severities: Iterable[str] = DEFAULT_SKIP_SEVERITIES
+) -> Tuple[List[Finding], bool]:
+    """Проверяет hunk; возвращает замечания и признак «hunk полностью объяснён правилами»"""
+    context = LineContext()
+    header_composable = bool(re.search(r'@@.*@@.*\bfun\s+[A-Z]', hunk.header))
+    if header_composable:
+        # Hunk начинается внутри Composable-функции (по заголовку git)
+        context.composable_depth = -10 ** 6
+
+    findings: List[Finding] = []
+    flagged_lines = 0
+    added_lines = 0
+    removed_lines = 0
+    line_number = hunk.new_start
+
+    for raw in hunk.lines:
+        prefix, text = raw[:1], raw[1:]
+        if prefix == '-':
+            if text.strip():
+                removed_lines += 1
+            continue
+        if prefix not in (' ', '+'):
+            continue
+
+        code = _code(text)
+        _enter_line(context, code, header_composable)
+        if prefix == '+' and text.strip():
+            added_lines += 1
+            line_findings = []
+            for rule, options in rules.items():
+                category, check = RULE_CHECKS[rule]
+                result = check(path, code, context)
+                if result:
+                    problem, suggestion = result
+                    line_findings.append(Finding(
+                        rule=rule,
+                        severity=options.get('severity', 'important'),
+                        path=path,
+                        line=line_number,
+                        hunk_index=hunk_index,
+                        category=category,
+                        problem=problem,
+                        suggestion=suggestion,
+                    ))
+            if line_findings:
+                flagged_lines += 1
+                findings.extend(line_findings)
+        _leave_line(context, code)
+        line_number += 1
+
+    # Полностью объяснён: каждая добавленная строка нарушает правило, а удалённые — их прежние версии.
+    # Hunk с замечанием другой severity модель видит всегда: совпадение regex — ещё не review строки
+    skippable = set(skip_severities)
+    covered = added_lines > 0 and flagged_lines == added_lines and removed_lines <= added_lines \
+        and all(finding.severity in skippable for finding in findings)
+    return findings, covered
+
+
+def _check_file(args: Tuple[FileDiff, Dict[str, Dict], Tuple[str, ...]]) -> Tuple[List[Finding], List[int]]:
+    file_diff, rules, skip_severities = args
+    findings: List[Finding] = []
+    covered: List[int] = []
+    for index, hunk in enumerate(file_diff.hunks):
+        hunk_findings, hunk_covered = check_hunk(file_diff.path, hunk, index, rules, skip_severities)
+        findings.extend(hunk_findings)
+        if hunk_covered:
+            covered.append(index)
+    return findings, covered
+
+
+@dataclass
+class LocalRulesResult:
+    """Замечания локальных правил по всему diff и полностью объяснённые hunk'и"""
+
+    findings: List[Finding] = field(default_factory=list)
+    covered: Set[Tuple[str, int]] = field(default_factory=set)
+
+    def uncovered_files(self, files: List[FileDiff]) -> List[FileDiff]:
+        """Diff без hunk'ов, которые уже полностью объяснены локальными правилами"""
+        result = []
+        for file_diff in files:
+            hunks = [
+                hunk for index, hunk in enumerate(file_diff.hunks)
+                if (file_diff.path, index) not in self.covered
+            ]
+            if hunks or not file_diff.hunks:
+                result.append(replace(file_diff, hunks=hunks))
+        return result
+
+    def summary(self) -> Dict:
+        """Сводка для метрик"""
+        by_severity = {severity: 0 for severity in SEVERITY_ORDER}
+        for finding in self.findings:
+            by_severity[finding.severity] = by_severity.get(finding.severity, 0) + 1
+        return {'findings': len(self.findings), 'covered_hunks': len(self.covered), **by_severity}
+
+    def hints(self) -> str:
+        """Подсказка для модели: что уже нашли локальные правила"""
+        if not self.findings:
+            return ""
+        lines = [
+            "## Замечания локальных проверок",
+            "",
+            "Эти места уже отмечены регулярными проверками и будут добавлены в review отдельно. "
+            "Не повторяй их; если замечание ложное, скажи об этом. Остальной код hunk'ов проверь как обычно.",
+            "",
+        ]
+        for finding in sorted(self.findings, key=lambda finding: (finding.path, finding.line)):
+            lines.append(f"- {finding.path}:{finding.line} — `{finding.rule}` ({finding.severity}): {finding.problem}")
+        return "\n".join(lines)
+
+    def render(self) -> str:
+        """Раздел review с замечаниями в формате детальных замечаний модели"""
+        if not self.findings:
+            return ""
+        ordered = sorted(
+            self.findings,
+            key=lambda finding: (SEVERITY_ORDER.index(finding.severity)
+                                 if finding.severity in SEVERITY_ORDER else len(SEVERITY_ORDER),
+                                 finding.path, finding.line)
+        )
+        parts = ["## 🧰 Локальные проверки правил проекта\n"]
+        severity = None
+        for finding in ordered:
+            if finding.severity != severity:
+                severity = finding.severity
+                parts.append(f"### {SEVERITY_TITLES.get(severity, severity)}\n")
+            parts.append(finding.render())
+        return "\n".join(parts)
+
+
+def active_rules(project_rules: List[Dict]) -> Dict[str, Dict]:
+    """Правила конфига, для которых есть локальная реализация"""
+    return {
+        rule['rule']: rule
+        for rule in project_rules or []
+        if rule.get('rule') in RULE_CHECKS
+    }
+
+
+def check_files(
+    files: List[FileDiff],
+    project_rules: List[Dict],
+    parallel_min_hunks: int = 200,
+    max_workers: int = 4,
+    skip_severities: Iterable[str] = DEFAULT_SKIP_SEVERITIES
+) -> LocalRulesResult:
+    """Проверяет diff; на больших PR файлы проверяются в пуле процессов"""
+    rules = active_rules(project_rules)
+    result = LocalRulesResult()
+    if not rules:
+        return result
+
+    jobs = [(file_diff, rules, tuple(skip_severities)) for file_diff in files if file_diff.hunks]
+    total_hunks = sum(len(file_diff.hunks) for file_diff, _, _ in jobs)
+    if max_workers > 1 and total_hunks >= parallel_min_hunks and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+            outcomes = list(executor.map(_check_file, jobs, chunksize=max(1, len(jobs) // (max_workers * 4))))
+    else:
+        outcomes = [_check_file(job) for job in jobs]
+
+    for (file_diff, _, _), (findings, covered) in zip(jobs, outcomes):
+        result.findings.extend(findings)
+        result.covered.update((file_diff.path, index) for index in covered)
+    return result
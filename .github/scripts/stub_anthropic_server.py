@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Локальный stub-сервер Messages API для проверки пакетного режима
+Отвечает заготовленным review и, как настоящий API, возвращает 429
+при превышении лимитов запросов/мин и входных токенов/мин
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prompt_packer import estimate_tokens
+
+
+STUB_REVIEW = """# 🔍 Code Review Summary
+
+## 📊 Общая оценка
+
+- **Критичных проблем:** 0 🔴
+- **Важных замечаний:** 0 🟡
+- **Предложений:** 0 💡
+
+Ответ локального stub-сервера.
+"""
+
+
+class LimitWindow:
+    """Скользящее окно в 60 секунд для запросов и входных токенов"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.stats = {'ok': 0, 'rate_limited': 0, 'errors': 0}
+
+    def admit(self, tokens: int) -> float:
+        """Пропускает запрос (возвращает 0) или возвращает retry-after в секундах"""
+        with self.lock:
+            now = time.monotonic()
+            while self.events and now - self.events[0][0] >= 60:
+                self.events.popleft()
+            used_tokens = sum(amount for _, amount in self.events)
+            if len(self.events) >= self.requests_per_minute or used_tokens + tokens > self.tokens_per_minute:
+                self.stats['rate_limited'] += 1
+                return max(1.0, 60 - (now - self.events[0][0])) if self.events else 1.0
+            self.events.append((now, tokens))
+            return 0.0
+
+
+def make_handler(window: LimitWindow, latency: float, error_rate: float):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: dict, headers: dict = None) -> None:
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/v1/messages'):
+                self._send(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+                return
+
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            prompt = "\n".join(
+                message['content'] if isinstance(message['content'], str)
+                else "".join(block.get('text', '') for block in message['content'])
+                for message in request.get('messages', [])
+            )
+            input_tokens = estimate_tokens(prompt)
+
+            retry_after = window.admit(input_tokens)
+            if retry_after:
+                self._send(429, {
+                    'type': 'error',
+                    'error': {'type': 'rate_limit_error', 'message': 'Rate limit exceeded (stub)'}
+                }, headers={'retry-after': f"{retry_after:.0f}"})
+                return
+
+            if random.random() < error_rate:
+                with window.lock:
+                    window.stats['errors'] += 1
+                self._send(529, {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded (stub)'}})
+                return
+
+            time.sleep(latency)
+            with window.lock:
+                window.stats['ok'] += 1
+            self._send(200, {
+                'id': f"msg_stub_{int(time.time() * 1000)}",
+                'type': 'message',
+                'role': 'assistant',
+                'model': request.get('model', 'stub'),
+                'content': [{'type': 'text', 'text': STUB_REVIEW}],
+                'stop_reason': 'end_turn',
+                'stop_sequence': None,
+                'usage': {'input_tokens': input_tokens, 'output_tokens': estimate_tokens(STUB_REVIEW)},
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub-сервер Messages API с лимитами')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rpm', type=int, default=10, help='Лимит запросов в минуту')
+    parser.add_argument('--tpm', type=int, default=100000, help='Лимит входных токенов в минуту')
+    parser.add_argument('--latency', type=float, default=0.5, help='Задержка ответа, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 529 Overloaded')
+    args = parser.parse_args()
+
+    window = LimitWindow(args.rpm, args.tpm)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(window, args.latency, args.error_rate))
+    print(f"🧪 Stub API на http://127.0.0.1:{args.port} (rpm={args.rpm}, tpm={args.tpm})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"\n📊 Статистика: {window.stats}")
+
+
+if __name__ == '__main__':
+    main()
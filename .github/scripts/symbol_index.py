@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Индекс объявлений Kotlin для AI Code Review
+Классы, интерфейсы, объекты, функции и expect/actual из git-репозитория с их
+сигнатурами и KDoc. Хранится на диске по SHA blob'ов: перечитываются только
+изменившиеся файлы. В промпт попадают объявления идентификаторов из hunk'ов
+"""
+
+import json
+import re
+import subprocess
+import sys
+import argparse
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from context_collector import GitBlobReader
+from diff_parser import FileDiff, read_diff_file
+
+
+# Увеличивайте при изменении разбора: сохранённые индексы перестроятся
+INDEX_VERSION = 1
+KOTLIN_SUFFIXES = ('.kt', '.kts')
+
+MODIFIERS = (
+    'public|private|protected|internal|expect|actual|abstract|open|sealed|data|enum|annotation|'
+    'inner|value|companion|override|suspend|inline|operator|infix|tailrec|external|const|fun'
+)
+SYMBOL_RE = re.compile(
+    r'^(?P<indent>\s*)(?:@\w+(?:\([^)]*\))?\s+)*'
+    rf'(?P<modifiers>(?:(?:{MODIFIERS})\s+)*)'
+    r'(?P<kind>class|interface|object|fun|typealias)\s+'
+    r'(?:<[^>]*>\s*)?(?:[\w.]+\.)?(?P<name>[A-Za-z_]\w*)'
+)
+IDENT_RE = re.compile(r'\b[A-Za-z_]\w*\b')
+STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"')
+
+# Идентификаторы, по которым искать объявления бессмысленно
+KOTLIN_KEYWORDS = {
+    'package', 'import', 'class', 'interface', 'object', 'fun', 'val', 'var', 'return', 'if', 'else',
+    'when', 'for', 'while', 'do', 'try', 'catch', 'finally', 'throw', 'this', 'super', 'null', 'true',
+    'false', 'is', 'in', 'as', 'private', 'public', 'protected', 'internal', 'override', 'suspend',
+    'data', 'sealed', 'enum', 'companion', 'const', 'lateinit', 'open', 'abstract', 'expect', 'actual',
+    'typealias', 'break', 'continue', 'it', 'by', 'get', 'set', 'init', 'constructor', 'operator',
+}
+
+MAX_SIGNATURE_LINES = 12
+MAX_KDOC_CHARS = 400
+MAX_MEMBERS = 15
+
+
+def _code(line: str) -> str:
+    """Строка без строковых литералов и комментария в конце"""
+    return STRING_RE.sub('""', line).split('//', 1)[0]
+
+
+def _signature(lines: List[str], start: int) -> Tuple[str, Optional[int]]:
+    """Сигнатура объявления с строки start (до тела) и номер строки, где открывается `{` тела"""
+    parts = []
+    depth = 0
+    for offset, line in enumerate(lines[start:start + MAX_SIGNATURE_LINES]):
+        code = _code(line).rstrip()
+        cut = len(code)
+        for index, char in enumerate(code):
+            if char in '(<[':
+                depth += 1
+            elif char in ')>]':
+                depth = max(0, depth - 1)
+            elif depth == 0 and (char == '{' or code.startswith(' = ', index - 1) and char == '='):
+                cut = index
+                break
+        parts.append(code[:cut].rstrip())
+        if cut < len(code):
+            return "\n".join(parts).strip('\n'), start + offset if code[cut] == '{' else None
+        if depth == 0 and not code.rstrip().endswith((',', ':', '(')):
+            break
+    return "\n".join(parts).strip('\n'), None
+
+
+def _kdoc_before(lines: List[str], index: int) -> str:
+    """KDoc непосредственно над объявлением (аннотации между ними допускаются)"""
+    position = index - 1
+    while position >= 0 and lines[position].strip().startswith('@'):
+        position -= 1
+    if position < 0 or not lines[position].strip().endswith('*/'):
+        return ""
+    end = position
+    while position >= 0 and '/**' not in lines[position]:
+        position -= 1
+    if position < 0:
+        return ""
+    kdoc = "\n".join(
+        (" " if line.strip().startswith('*') else "") + line.strip() for line in lines[position:end + 1]
+    )
+    return kdoc if len(kdoc) <= MAX_KDOC_CHARS else kdoc[:MAX_KDOC_CHARS].rstrip() + " …*/"
+
+
+def parse_declarations(path: str, content: str) -> List[Dict]:
+    """Объявления файла: верхнего уровня и члены типов (кроме private)"""
+    lines = content.splitlines()
+    symbols: List[Dict] = []
+    owners: List[Tuple[Dict, int, int]] = []  # (объявление типа, строка `{` тела, глубина скобок тела)
+    depth = 0
+
+    for index, line in enumerate(lines):
+        while owners and index > owners[-1][1] and depth < owners[-1][2]:
+            owners.pop()
+        match = SYMBOL_RE.match(line)
+        owner = owners[-1][0] if owners and index > owners[-1][1] and depth == owners[-1][2] else None
+        if match and (owner is not None or depth == 0):
+            modifiers = match.group('modifiers').split()
+            signature, body_line = _signature(lines, index)
+            symbol = {
+                'name': match.group('name'),
+                'kind': match.group('kind'),
+                'path': path,
+                'line': index + 1,
+                'signature': signature.strip(),
+                'kdoc': _kdoc_before(lines, index),
+                'platform': 'expect' if 'expect' in modifiers else 'actual' if 'actual' in modifiers else None,
+                'owner': owner['name'] if owner is not None else None,
+                'members': [],
+            }
+            if 'private' not in modifiers:
+                symbols.append(symbol)
+                if owner is not None and len(owner['members']) < MAX_MEMBERS:
+                    owner['members'].append(symbol['signature'])
+            if body_line is not None and symbol['kind'] in ('class', 'interface', 'object'):
+                owners.append((symbol, body_line, depth + 1))
+
+        code = _code(line)
+        depth += code.count('{') - code.count('}')
+    return symbols
+
+
+def render_symbol(symbol: Dict, actuals: Iterable[str] = ()) -> str:
+    """Объявление для промпта: путь, KDoc, сигнатура и сигнатуры членов типа"""
+    title = f"{symbol['owner']}.{symbol['name']}" if symbol.get('owner') else symbol['name']
+    header = f"### `{title}` — {symbol['path']}:{symbol['line']}"
+    actuals = list(actuals)
+    if actuals:
+        header += f" (actual: {', '.join(actuals)})"
+    body = [symbol['kdoc']] if symbol['kdoc'] else []
+    body.append(symbol['signature'])
+    if symbol['members']:
+        members = "\n".join(
+            "    " + member.strip().replace("\n", "\n    ") for member in symbol['members']
+        )
+        body[-1] += f" {{\n{members}\n}}"
+    return f"{header}\n```kotlin\n" + "\n".join(body) + "\n```"
+
+
+def _platform(path: str) -> str:
+    """Имя source set'а (androidMain → android) для списка actual-реализаций"""
+    match = re.search(r'/src/(\w+?)Main/', path)
+    return match.group(1) if match else path
+
+
+def referenced_identifiers(files: Iterable[FileDiff]) -> Counter:
+    """Идентификаторы из hunk'ов: изменённые строки весят больше контекстных"""
+    counts: Counter = Counter()
+    for file_diff in files:
+        for hunk in file_diff.hunks:
+            for line in hunk.lines:
+                weight = 2 if line.startswith(('+', '-')) else 1
+                for name in IDENT_RE.findall(_code(line[1:])):
+                    if len(name) > 2 and name not in KOTLIN_KEYWORDS:
+                        counts[name] += weight
+    return counts
+
+
+class SymbolIndex:
+    """Индекс объявлений Kotlin из git с инкрементальным обновлением по SHA blob'ов"""
+
+    def __init__(self, repo_dir: Path = Path('.'), roots: Optional[List[str]] = None, index_path: Optional[Path] = None):
+        self.repo_dir = Path(repo_dir)
+        self.roots = list(roots or ['composeApp'])
+        self.index_path = index_path
+        self.files: Dict[str, Dict] = {}
+        self.by_name: Dict[str, List[Dict]] = {}
+        self.reindexed: List[str] = []
+
+    def _load_saved(self) -> Dict[str, Dict]:
+        if not self.index_path or not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != INDEX_VERSION:
+            return {}
+        return data.get('files', {})
+
+    def _tracked_blobs(self) -> Dict[str, str]:
+        """Путь → SHA blob'а для Kotlin файлов в roots (`git ls-files -s`)"""
+        output = subprocess.run(
+            ['git', 'ls-files', '-s', '--', *self.roots],
+            cwd=self.repo_dir, capture_output=True, text=True, check=True
+        ).stdout
+        blobs = {}
+        for line in output.splitlines():
+            meta, _, path = line.partition('\t')
+            if path.endswith(KOTLIN_SUFFIXES):
+                blobs[path] = meta.split()[1]
+        return blobs
+
+    def build(self) -> 'SymbolIndex':
+        """Обновляет индекс: разбираются только blob'ы с изменившимся SHA"""
+        saved = self.files or self._load_saved()
+        blobs = self._tracked_blobs()
+        files: Dict[str, Dict] = {}
+        self.reindexed = []
+
+        changed_paths = [path for path, sha in blobs.items() if saved.get(path, {}).get('blob') != sha]
+        if changed_paths:
+            with GitBlobReader(self.repo_dir) as reader:
+                for path in changed_paths:
+                    content = reader.read_object(blobs[path]) or ""
+                    saved[path] = {'blob': blobs[path], 'symbols': parse_declarations(path, content)}
+                    self.reindexed.append(path)
+        for path in blobs:
+            files[path] = saved[path]
+
+        changed = bool(self.reindexed) or set(files) != set(saved)
+        self.files = files
+        self.by_name = {}
+        for entry in files.values():
+            for symbol in entry['symbols']:
+                self.by_name.setdefault(symbol['name'], []).append(symbol)
+        if changed:
+            self.save()
+        return self
+
+    def save(self) -> None:
+        """Сохраняет индекс на диск"""
+        if not self.index_path:
+            return
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self.files}, f, ensure_ascii=False)
+        tmp_path.replace(self.index_path)
+
+    def select(self, files: List[FileDiff], max_symbols: int = 40, max_definitions: int = 3) -> List[Tuple[str, str]]:
+        """Объявления идентификаторов из hunk'ов: [(имя, блок для промпта)] по убыванию значимости.
+
+        Объявления, которые и так видны в hunk'ах, пропускаются; у expect/actual
+        показывается expect-объявление со списком платформ; имена с большим
+        числом несвязанных определений считаются неоднозначными.
+        """
+        visible = {
+            (file_diff.path, line)
+            for file_diff in files
+            for hunk in file_diff.hunks
+            for line in range(hunk.new_start, hunk.new_start + max(hunk.new_count, 1))
+        }
+        selected: List[Tuple[str, str]] = []
+        shown_types = set()
+        for identifier, _ in referenced_identifiers(files).most_common():
+            if len(selected) >= max_symbols:
+                break
+            # Свойство `getCategoriesUseCase` обычно имеет тип `GetCategoriesUseCase`
+            name = identifier if identifier in self.by_name else identifier[:1].upper() + identifier[1:]
+            if name in shown_types or any(name == shown for shown, _ in selected):
+                continue
+            definitions = [
+                symbol for symbol in self.by_name.get(name, [])
+                if (symbol['path'], symbol['line']) not in visible
+            ]
+            expects = [symbol for symbol in definitions if symbol['platform'] == 'expect']
+            if expects:
+                actuals = sorted({_platform(symbol['path']) for symbol in definitions if symbol['platform'] == 'actual'})
+                definitions, extra = expects, actuals
+            else:
+                extra = []
+            # Член уже показанного типа виден в его сигнатуре
+            if any(symbol.get('owner') in shown_types for symbol in definitions):
+                continue
+            if not definitions or len(definitions) > max_definitions:
+                continue
+            blocks = [render_symbol(symbol, extra) for symbol in definitions]
+            selected.append((name, "\n\n".join(blocks)))
+            if any(symbol['kind'] in ('class', 'interface', 'object') for symbol in definitions):
+                shown_types.add(name)
+        return selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Объявления Kotlin, на которые ссылается diff')
+    parser.add_argument('--diff-file', required=True, help='Файл с diff изменений')
+    parser.add_argument('--repo-dir', default='.', help='Корень git репозитория')
+    parser.add_argument('--roots', default='composeApp', help='Каталоги для индексации через запятую')
+    parser.add_argument('--index', help='Файл индекса (по умолчанию без сохранения)')
+    parser.add_argument('--max-symbols', type=int, default=40, help='Максимум объявлений')
+    args = parser.parse_args()
+
+    try:
+        index = SymbolIndex(
+            Path(args.repo_dir), args.roots.split(','), Path(args.index) if args.index else None
+        ).build()
+        files = list(read_diff_file(Path(args.diff_file)))
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"❌ Не удалось построить индекс: {e}")
+        sys.exit(1)
+
+    print(f"🔗 Индекс: {len(index.files)} файлов, переиндексировано {len(index.reindexed)}")
+    for _, block in index.select(files, args.max_symbols):
+        print(block + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,10 @@
 
 import os
 import sys
+import time
+import argparse
 from pathlib import Path
+from typing import Optional
 import subprocess
 
 def create_test_files():
@@ -91,13 +94,14 @@ Base Branch: main
     return test_dir
 
 
-def run_review(test_dir: Path):
-    """Запускает AI review"""
+def run_review(test_dir: Path, record: Optional[str] = None, replay: Optional[str] = None):
+    """Запускает AI review (с кассетой replay ключ API не нужен)"""
 
     api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if not api_key:
+    if not api_key and not replay:
         print("❌ Установите ANTHROPIC_API_KEY:")
         print("   export ANTHROPIC_API_KEY='your-key'")
+        print("   или воспроизведите записанную кассету: --replay review.jsonl.gz")
         sys.exit(1)
 
     docs_dir = Path(".claude")
@@ -113,6 +117,10 @@ def run_review(test_dir: Path):
         "--docs-dir", str(docs_dir),
         "--output-file", str(test_dir / "review.md")
     ]
+    if record:
+        cmd += ["--record", record]
+    if replay:
+        cmd += ["--replay", replay]
 
     print("🤖 Запуск AI Code Review...")
     print(f"📄 Команда: {' '.join(cmd)}\n")
@@ -132,7 +140,169 @@ def run_review(test_dir: Path):
         sys.exit(1)
 
 
+def run_offline_review(test_dir: Path):
+    """Запускает потоковый review в процессе с фейковым клиентом, без API"""
+
+    sys.path.insert(0, str(Path(".github/scripts").resolve()))
+    from ai_code_review import CodeReviewAssistant, StreamingOutput
+    from diff_parser import DiffFilter, read_diff_file
+    from fake_client import FakeAnthropic
+
+    client = FakeAnthropic(first_token_delay=0.2, delta_delay=0.01)
+    assistant = CodeReviewAssistant(
+        api_key="offline",
+        config_path=Path(".github/ai-review-config.yml"),
+        client=client
+    )
+    assistant.cache = None  # Офлайн-проверка не должна зависеть от кэша
+
+    files = list(read_diff_file(test_dir / "changes.diff", DiffFilter.from_config(assistant.config)))
+    project_context = assistant.load_project_context(Path(".claude"), files=files)
+
+    print("🤖 Офлайн AI Code Review (FakeAnthropic, поток)...\n")
+    output_path = test_dir / "review.md"
+    started = time.monotonic()
+    with StreamingOutput(output_path) as output:
+        result = assistant.review_code(
+            files=files,
+            file_contents=(test_dir / "file_contents.txt").read_text(),
+            pr_info=(test_dir / "pr_info.txt").read_text(),
+            project_context=project_context,
+            on_text=output.write
+        )
+
+    assert result == output_path.read_text(), "Файл должен совпадать с полученным потоком"
+    assert len(client.messages.calls) == 1, "Ожидался ровно один запрос к API"
+    print("\n" + "="*70)
+    print(f"⏱️  Время до первого токена: {assistant.time_to_first_token:.2f} с")
+    print(f"⏱️  Общее время: {time.monotonic() - started:.2f} с")
+    print(f"✅ Офлайн review сохранён в: {output_path}")
+
+
+def run_prefix_check(test_dir: Path):
+    """Проверяет без API, что кэшируемый префикс промпта одинаков для разных PR"""
+
+    sys.path.insert(0, str(Path(".github/scripts").resolve()))
+    from ai_code_review import CodeReviewAssistant
+    from diff_parser import DiffFilter, read_diff_file
+    from fake_client import FakeAnthropic, cache_breakpoints
+
+    # Минимум кэшируемого префикса — как у API (1024 токена)
+    client = FakeAnthropic()
+    assistant = CodeReviewAssistant(
+        api_key="offline",
+        config_path=Path(".github/ai-review-config.yml"),
+        client=client
+    )
+    assistant.cache = None  # Иначе второй запуск может не дойти до API
+
+    # Документация проекта: .claude, а если её нет — руководство по архитектуре из репозитория
+    docs_dir = Path(".claude")
+    if not docs_dir.exists():
+        guide = Path("app/src/main/java/ru/macdroid/subagentstest/kmp-prompt.md")
+        docs_dir = guide.parent
+        assistant.config.setdefault('cache', {})['stable_docs'] = [guide.name]
+
+    diff_filter = DiffFilter.from_config(assistant.config)
+    first = list(read_diff_file(test_dir / "changes.diff", diff_filter))
+    # Второй PR: тот же файл с другим изменением
+    second_diff = test_dir / "changes_second.diff"
+    second_diff.write_text(
+        (test_dir / "changes.diff").read_text().replace("viewModelScope.launch { loadCategories() }", "loadCategories()\n+        observeCategories()")
+    )
+    second = list(read_diff_file(second_diff, diff_filter))
+    project_context = assistant.load_project_context(docs_dir, files=first)
+    assert assistant.stable_context, "Постоянный контекст проекта пуст — нечего кэшировать"
+    for files, pr_info in ((first, (test_dir / "pr_info.txt").read_text()), (second, "# PR #2: Локализация ошибок\n")):
+        assistant.review_code(
+            files=files,
+            file_contents=(test_dir / "file_contents.txt").read_text(),
+            pr_info=pr_info,
+            project_context=project_context
+        )
+
+    calls = client.messages.calls
+    assert len(calls) == 2, "Ожидалось ровно два запроса к API"
+    systems = [call['system'] for call in calls]
+    assert systems[0] == systems[1], "Системный промпт должен совпадать байт в байт"
+    assert systems[0][-1].get('cache_control'), "Системный промпт должен быть помечен cache_control"
+    assert all(
+        not block.get('cache_control') for call in calls for block in call['messages'][0]['content']
+    ), "Контекст по diff и блок PR не должны кэшироваться"
+    assert cache_breakpoints(calls[0]) == cache_breakpoints(calls[1]), "Кэшируемый префикс должен совпадать"
+    assert calls[0]['messages'] != calls[1]['messages'], "PR-зависимая часть должна различаться"
+
+    usage = assistant.metrics.summary()
+    print(f"💾 Prompt cache: записано {usage['cache_creation_input_tokens']}, "
+          f"прочитано {usage['cache_read_input_tokens']} токенов")
+    assert usage['cache_read_input_tokens'] > 0, "Второй запрос должен читать префикс из кэша"
+    print("✅ Префикс промпта стабилен между PR")
+
+
+def run_rules_check():
+    """Проверяет без API, что локальные правила не дают ложных замечаний на presentation-коде проекта"""
+
+    sys.path.insert(0, str(Path(".github/scripts").resolve()))
+    import yaml
+    from diff_parser import FileDiff, Hunk
+    from rule_engine import check_files
+
+    config = yaml.safe_load(Path(".github/ai-review-config.yml").read_text(encoding='utf-8'))
+    rules = config.get('project_specific_rules') or []
+
+    # Каждый файл — как целиком добавленный в PR
+    files = []
+    paths = {*Path(".").glob("*/src/**/presentation/**/*.kt"), *Path(".").glob("*/src/**/ui/**/*.kt")}
+    for path in sorted(paths):
+        lines = path.read_text(encoding='utf-8').splitlines()
+        files.append(FileDiff(
+            path=path.as_posix(),
+            old_path=path.as_posix(),
+            change_type="added",
+            hunks=[Hunk(
+                header=f"@@ -0,0 +1,{len(lines)} @@",
+                old_start=0,
+                old_count=0,
+                new_start=1,
+                new_count=len(lines),
+                lines=["+" + line for line in lines]
+            )]
+        ))
+    assert files, "Не найдены presentation-файлы проекта"
+
+    result = check_files(files, rules, max_workers=1)
+    for finding in result.findings:
+        print(f"❌ {finding.path}:{finding.line} — {finding.rule}")
+    assert not result.findings, "Локальные правила не должны срабатывать на коде проекта"
+    print(f"✅ Локальные правила: {len(files)} presentation-файлов без замечаний")
+
+    # Hunk, целиком объяснённый правилом из skip_severities, в модель не уходит,
+    # а hunk с критичным замечанием (GlobalScope) остаётся
+    path = "composeApp/src/commonMain/kotlin/app/presentation/NotesViewModel.kt"
+    hunks = [
+        Hunk(header="@@ -10,0 +11,1 @@", old_start=10, old_count=0, new_start=11, new_count=1,
+             lines=["+    private val notes = MutableLiveData<List<Note>>()"]),
+        Hunk(header="@@ -20,0 +22,1 @@", old_start=20, old_count=0, new_start=22, new_count=1,
+             lines=["+        GlobalScope.launch { load() }"]),
+    ]
+    diff = [FileDiff(path=path, old_path=path, hunks=hunks)]
+    skip_severities = (config.get('local_rules') or {}).get('skip_severities') or ['suggestion']
+    result = check_files(diff, rules, max_workers=1, skip_severities=skip_severities)
+    assert result.covered == {(path, 0)}, f"Должен пропускаться только hunk с LiveData: {result.covered}"
+    remaining = result.uncovered_files(diff)
+    assert [hunk.new_start for hunk in remaining[0].hunks] == [22], "Hunk с GlobalScope должен остаться в запросе"
+    print("✅ Hunk, объяснённый правилом уровня suggestion, исключается из запроса к модели")
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Локальное тестирование AI Code Review')
+    parser.add_argument('--offline', action='store_true', help='Без API: фейковый клиент с потоковым ответом')
+    parser.add_argument('--record', help='Записать запросы к API в кассету')
+    parser.add_argument('--replay', help='Воспроизвести кассету вместо API')
+    parser.add_argument('--check-prefix', action='store_true', help='Без API: проверить стабильность кэшируемого префикса промпта')
+    parser.add_argument('--check-rules', action='store_true', help='Без API: прогнать локальные правила по presentation-коду проекта')
+    args = parser.parse_args()
+
     print("🧪 AI Code Review - Локальное тестирование\n")
 
     # Проверяем, что скрипт запущен из корня проекта
@@ -141,11 +311,20 @@ def main():
         print("   python3 .github/scripts/test_review.py")
         sys.exit(1)
 
+    if args.check_rules:
+        run_rules_check()
+        return
+
     # Создаём тестовые файлы
     test_dir = create_test_files()
 
     # Запускаем review
-    run_review(test_dir)
+    if args.check_prefix:
+        run_prefix_check(test_dir)
+    elif args.offline:
+        run_offline_review(test_dir)
+    else:
+        run_review(test_dir, record=args.record, replay=args.replay)
 
 
 if __name__ == '__main__':
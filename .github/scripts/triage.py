@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Триаж hunk'ов для каскада моделей
+Оценивает риск каждого hunk'а по категориям `priorities:` конфига (локальной
+эвристикой или дешёвой моделью) и решает, какие hunk'и идут в основную модель
+"""
+
+import json
+import re
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
+
+from diff_parser import FileDiff, Hunk
+
+
+ROUTE_FULL = 'full'
+ROUTE_SUMMARY = 'summary'
+
+# Вес категории по уровню в `priorities:`
+LEVEL_WEIGHTS = {'critical': 1.0, 'important': 0.6, 'suggestion': 0.2}
+
+# Сигналы по умолчанию: регулярные выражения по изменённым строкам → категория priorities
+DEFAULT_SIGNALS: Dict[str, List[str]] = {
+    'race_condition': [r'GlobalScope', r'runBlocking', r'\bMutex\b', r'synchronized', r'@Volatile', r'\bwithContext\b'],
+    'memory_leak': [r'\bContext\b', r'\bActivity\b', r'addListener|removeListener', r'\bregister\w*\(', r'DisposableEffect'],
+    'null_pointer': [r'!!', r'\blateinit\b', r'\bas\s+[A-Z]'],
+    'security_vulnerability': [r'(?i)password|secret|api_?key|token', r'http://', r'MessageDigest|Cipher'],
+    'architecture_violation': [r'^import .*\.data\.', r'RepositoryImpl\(', r'Api\('],
+    'missing_error_handling': [r'\bcatch\b', r'runCatching', r'\bthrow\b'],
+    'performance_issue': [r'\bremember\b', r'LazyColumn|LazyRow', r'derivedStateOf', r'\.collect\s*\{'],
+}
+
+TRIAGE_PROMPT = """Ты — быстрый триаж изменений для code review Kotlin Multiplatform проекта.
+
+Оцени риск каждого hunk'а числом от 0 до 1: насколько вероятно, что в нём есть
+проблема одной из категорий ({categories}). Переименования, форматирование,
+импорты и комментарии — риск около 0. Корутины, состояние, безопасность,
+нарушение слоёв — высокий риск.
+
+Ответь ТОЛЬКО JSON-объектом вида {{"h1": 0.1, "h2": 0.8}} без пояснений.
+
+{hunks}
+"""
+
+
+@dataclass
+class HunkRoute:
+    """Решение триажа для одного hunk'а"""
+
+    path: str
+    hunk: Optional[Hunk]
+    score: float
+    reasons: List[str] = field(default_factory=list)
+    route: str = ROUTE_SUMMARY
+
+    @property
+    def location(self) -> str:
+        if self.hunk is None:
+            return self.path
+        return f"{self.path}:{self.hunk.new_start}"
+
+
+@dataclass
+class Routing:
+    """Результат триажа всего diff: куда ушёл каждый hunk"""
+
+    method: str
+    threshold: float
+    routes: List[HunkRoute] = field(default_factory=list)
+
+    def _files(self, route: str, files: List[FileDiff]) -> List[FileDiff]:
+        selected: List[FileDiff] = []
+        for file_diff in files:
+            hunks = [
+                item.hunk for item in self.routes
+                if item.route == route and item.path == file_diff.path and item.hunk is not None
+            ]
+            if hunks:
+                selected.append(replace(file_diff, hunks=hunks))
+            elif route == ROUTE_SUMMARY and not file_diff.hunks:
+                selected.append(file_diff)
+        return selected
+
+    def full_files(self, files: List[FileDiff]) -> List[FileDiff]:
+        """Файлы только с hunk'ами для основной модели"""
+        return self._files(ROUTE_FULL, files)
+
+    def summary_files(self, files: List[FileDiff]) -> List[FileDiff]:
+        """Файлы только с низкорисковыми hunk'ами (и изменения без hunk'ов)"""
+        return self._files(ROUTE_SUMMARY, files)
+
+    def summary(self) -> Dict:
+        """Сводка для метрик"""
+        return {
+            'method': self.method,
+            'threshold': self.threshold,
+            'full_hunks': sum(1 for item in self.routes if item.route == ROUTE_FULL),
+            'summary_hunks': sum(1 for item in self.routes if item.route == ROUTE_SUMMARY),
+        }
+
+    def report(self, max_lines: int = 30) -> str:
+        """Таблица решений для блока в конце review.
+
+        Hunk'и основной модели перечисляются по одному, низкорисковые
+        сворачиваются в одну строку на файл.
+        """
+        rows = []
+        for item in self.routes:
+            if item.route == ROUTE_FULL:
+                rows.append(f"| `{item.location}` | {item.score:.2f} | основная | {', '.join(item.reasons) or '—'} |")
+
+        low_risk: Dict[str, List[HunkRoute]] = {}
+        for item in self.routes:
+            if item.route == ROUTE_SUMMARY:
+                low_risk.setdefault(item.path, []).append(item)
+        for path, items in low_risk.items():
+            reasons = sorted({reason for item in items for reason in item.reasons})
+            location = f"`{path}` ({len(items)} hunk'ов)" if len(items) > 1 else f"`{items[0].location}`"
+            score = max(item.score for item in items)
+            rows.append(f"| {location} | {score:.2f} | краткий обзор | {', '.join(reasons) or '—'} |")
+
+        if len(rows) > max_lines:
+            rows = rows[:max_lines] + [f"| … и ещё {len(rows) - max_lines} строк | | | |"]
+        return "\n".join(["| Hunk | Риск | Модель | Причины |", "|---|---|---|---|"] + rows)
+
+
+def changed_lines(hunk: Hunk) -> Tuple[List[str], List[str]]:
+    """Удалённые и добавленные строки hunk'а без префикса"""
+    removed = [line[1:] for line in hunk.lines if line.startswith('-')]
+    added = [line[1:] for line in hunk.lines if line.startswith('+')]
+    return removed, added
+
+
+def _normalize(lines: List[str]) -> str:
+    return re.sub(r'\s+', '', "".join(lines))
+
+
+def category_weights(priorities: Dict[str, List[str]]) -> Dict[str, float]:
+    """Вес каждой категории по её уровню в `priorities:`"""
+    weights: Dict[str, float] = {}
+    for level, categories in (priorities or {}).items():
+        for category in categories or []:
+            weights[category] = LEVEL_WEIGHTS.get(level, 0.2)
+    return weights
+
+
+class HeuristicTriage:
+    """Локальная оценка риска: сигналы в изменённых строках и объём изменений"""
+
+    def __init__(self, priorities: Dict[str, List[str]], signals: Optional[Dict[str, List[str]]] = None):
+        self.weights = category_weights(priorities)
+        self.signals = {
+            category: [re.compile(pattern) for pattern in patterns]
+            for category, patterns in (signals or DEFAULT_SIGNALS).items()
+        }
+
+    def score(self, hunk: Hunk) -> Tuple[float, List[str]]:
+        removed, added = changed_lines(hunk)
+        if _normalize(removed) == _normalize(added):
+            return 0.0, ['только форматирование']
+        changed = removed + added
+
+        score = 0.0
+        reasons = []
+        for category, patterns in self.signals.items():
+            if any(pattern.search(line) for pattern in patterns for line in changed):
+                score = max(score, self.weights.get(category, 0.2))
+                reasons.append(category)
+        if not reasons and all(
+            not line.strip() or line.lstrip().startswith(('import ', '//', '*', '/*')) for line in changed
+        ):
+            return 0.05, ['импорты/комментарии']
+        # Большие изменения рискованны и без явных сигналов
+        size_score = min(0.5, len(changed) / 40)
+        if size_score > score:
+            score = size_score
+            reasons.append(f"изменённых строк: {len(changed)}")
+        return round(score, 2), reasons
+
+
+def build_triage_prompt(
+    files: List[FileDiff],
+    categories: List[str],
+    max_hunk_chars: int = 1500
+) -> Tuple[str, Dict[str, Tuple[str, Hunk]]]:
+    """Промпт для модели-триажа и соответствие id → (файл, hunk)"""
+    index: Dict[str, Tuple[str, Hunk]] = {}
+    blocks = []
+    for file_diff in files:
+        for hunk in file_diff.hunks:
+            hunk_id = f"h{len(index) + 1}"
+            index[hunk_id] = (file_diff.path, hunk)
+            blocks.append(f"### {hunk_id}: {file_diff.path}\n```diff\n{hunk.text[:max_hunk_chars]}\n```")
+    prompt = TRIAGE_PROMPT.format(categories=", ".join(categories), hunks="\n\n".join(blocks))
+    return prompt, index
+
+
+def parse_triage_response(text: str) -> Dict[str, float]:
+    """Достаёт {id: риск} из ответа модели; ValueError, если JSON не найден"""
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        raise ValueError("в ответе триажа нет JSON")
+    data = json.loads(match.group(0))
+    return {str(key): max(0.0, min(1.0, float(value))) for key, value in data.items()}